@@ -2,8 +2,12 @@ import customtkinter
 import json
 import logging
 import os
-from typing import Callable, Dict, Any
+import threading
+from tkinter import filedialog
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, Optional
 from camera_service import CameraService
+from punch_export import export_punches
 from ui_theme import StatusColors
 from password_utils import hash_password, verify_password
 
@@ -143,9 +147,13 @@ def show_admin_login(parent, callback: Callable[[bool], None]):
         callback(False)
 
 class AdminPanel(customtkinter.CTkToplevel):
-    def __init__(self, parent, settings_path: str = 'settings.json'):
+    def __init__(self, parent, settings_path: str = 'settings.json', storage=None, soap_client=None):
         super().__init__(parent)
         self.settings_path = settings_path
+        # Running OfflineStorage, used for the database counters on the System tab
+        self.storage = storage
+        # Running SoapClient, used for the connection state on the System tab
+        self.soap_client = soap_client
         
         # Don't store settings in memory, always read from disk
         logger.debug("Admin panel initialized")
@@ -543,6 +551,10 @@ class AdminPanel(customtkinter.CTkToplevel):
         db_row = 0
         customtkinter.CTkLabel(db_frame, text="Database", font=self.scaled_fonts['title']).grid(row=db_row, column=0, sticky="w", padx=10, pady=5)
         db_row += 1
+        self.db_stats_label = customtkinter.CTkLabel(db_frame, text="", font=self.scaled_fonts['text'], justify="left")
+        self.db_stats_label.grid(row=db_row, column=0, sticky="w", padx=10, pady=5)
+        self.refresh_db_stats()
+        db_row += 1
         customtkinter.CTkButton(
             db_frame,
             text="Clean Old Records",
@@ -550,6 +562,36 @@ class AdminPanel(customtkinter.CTkToplevel):
             font=self.scaled_fonts['button'],
             height=35
         ).grid(row=db_row, column=0, sticky="w", padx=10, pady=5)
+        db_row += 1
+        # Optional punch date range for the export, both days included
+        export_range_frame = customtkinter.CTkFrame(db_frame, fg_color="transparent")
+        export_range_frame.grid(row=db_row, column=0, sticky="w", padx=10, pady=5)
+        customtkinter.CTkLabel(export_range_frame, text="From (YYYY-MM-DD):", font=self.scaled_fonts['text']).grid(row=0, column=0, sticky="w")
+        self.export_start_var = customtkinter.StringVar()
+        customtkinter.CTkEntry(export_range_frame, textvariable=self.export_start_var, width=120, font=self.scaled_fonts['text']).grid(row=0, column=1, sticky="w", padx=(5, 15))
+        customtkinter.CTkLabel(export_range_frame, text="To:", font=self.scaled_fonts['text']).grid(row=0, column=2, sticky="w")
+        self.export_end_var = customtkinter.StringVar()
+        customtkinter.CTkEntry(export_range_frame, textvariable=self.export_end_var, width=120, font=self.scaled_fonts['text']).grid(row=0, column=3, sticky="w", padx=5)
+        db_row += 1
+        self.export_unsynced_var = customtkinter.BooleanVar(value=False)
+        customtkinter.CTkCheckBox(
+            db_frame,
+            text="Unsynced punches only",
+            variable=self.export_unsynced_var,
+            font=self.scaled_fonts['text']
+        ).grid(row=db_row, column=0, sticky="w", padx=10, pady=5)
+        db_row += 1
+        self.export_button = customtkinter.CTkButton(
+            db_frame,
+            text="Export Punches...",
+            command=self.export_punches,
+            font=self.scaled_fonts['button'],
+            height=35
+        )
+        self.export_button.grid(row=db_row, column=0, sticky="w", padx=10, pady=5)
+        db_row += 1
+        self.export_status_label = customtkinter.CTkLabel(db_frame, text="", font=self.scaled_fonts['text'])
+        self.export_status_label.grid(row=db_row, column=0, sticky="w", padx=10, pady=5)
         
         # Network Status
         current_row += 1
@@ -560,6 +602,10 @@ class AdminPanel(customtkinter.CTkToplevel):
         net_row = 0
         customtkinter.CTkLabel(net_frame, text="Network", font=self.scaled_fonts['title']).grid(row=net_row, column=0, sticky="w", padx=10, pady=5)
         net_row += 1
+        self.net_status_label = customtkinter.CTkLabel(net_frame, text="", font=self.scaled_fonts['text'], justify="left")
+        self.net_status_label.grid(row=net_row, column=0, sticky="w", padx=10, pady=5)
+        self.refresh_connection_status()
+        net_row += 1
         customtkinter.CTkButton(
             net_frame,
             text="Test Connection",
@@ -832,6 +878,124 @@ class AdminPanel(customtkinter.CTkToplevel):
             logger.error(f"Failed to clear logs: {e}")
             self.show_error(f"Failed to clear logs: {e}")
 
+    def refresh_db_stats(self):
+        """Show backlog counters and hot store and spilled record counts"""
+        if self.storage is None:
+            self.db_stats_label.configure(text="Storage statistics unavailable")
+            return
+        try:
+            counters = self.storage.stats()
+            stats = self.storage.spill_stats()
+            oldest = ""
+            if counters['oldestUnsynced']:
+                oldest_time = datetime.fromisoformat(counters['oldestUnsynced'])
+                oldest = f" (oldest {oldest_time.strftime('%Y-%m-%d %H:%M')})"
+            self.db_stats_label.configure(text=(
+                f"Waiting to sync: {counters['unsynced']}{oldest}\n"
+                f"Synced today: {counters['syncedToday']}\n"
+                f"Total records: {counters['total']} ({counters['bytesOnDisk'] / 1024:.1f} KB, "
+                f"photos {counters['photoBytes'] / (1024 * 1024):.1f} MB)\n"
+                f"Offline records: {stats['hot']} of {stats['maxRecords']}\n"
+                f"Overflow (unsynced): {stats['overflow']} ({stats['overflowBytes'] / 1024:.1f} KB)\n"
+                f"Archived (synced): {stats['archived']} ({stats['archiveBytes'] / 1024:.1f} KB)"
+            ))
+        except Exception as e:
+            logger.error(f"Failed to load storage statistics: {e}")
+            self.db_stats_label.configure(text="Storage statistics unavailable")
+
+    def refresh_connection_status(self):
+        """Show the server connection and circuit breaker state"""
+        if not self.winfo_exists():
+            return
+        if self.soap_client is None:
+            self.net_status_label.configure(text="Connection status unavailable")
+            return
+        try:
+            status = self.soap_client.connection_status()
+            circuit = status['circuit']
+            lines = [f"Server: {'online' if status['online'] else 'offline'}"]
+            if circuit['state'] == 'open':
+                lines.append(f"Reconnect paused (circuit open), next attempt in {circuit['retryIn']:.0f}s")
+            else:
+                lines.append(f"Circuit: {circuit['state']}")
+            if status['error'] and not status['online']:
+                lines.append(f"Last error: {status['error'][:80]}")
+            lines.extend(self._telemetry_lines(self.soap_client.telemetry.snapshot()))
+            self.net_status_label.configure(text="\n".join(lines))
+        except Exception as e:
+            logger.error(f"Failed to load connection status: {e}")
+            self.net_status_label.configure(text="Connection status unavailable")
+        # Keep the countdown current while the panel is open
+        self.after(1000, self.refresh_connection_status)
+
+    def _telemetry_lines(self, telemetry: dict) -> list:
+        """Punch latency, timeouts, offline fallbacks and reconnects in a few lines"""
+        lines = []
+        for operation, phases in telemetry['latency'].items():
+            total = phases.get('total')
+            if operation == 'reconnect' or not total:
+                continue
+            lines.append(
+                f"{operation}: {total['count']} calls, p50 {total['p50Ms']:.0f}ms, "
+                f"p95 {total['p95Ms']:.0f}ms, p99 {total['p99Ms']:.0f}ms"
+            )
+        timeouts = sum(telemetry['timeouts'].values())
+        fallbacks = sum(telemetry['offlineFallbacks'].values())
+        lines.append(f"Timeouts: {timeouts}, offline fallbacks: {fallbacks}")
+        reconnects = telemetry['reconnects']
+        if reconnects:
+            lines.append("Reconnects: " + ", ".join(f"{n} {outcome}" for outcome, n in sorted(reconnects.items())))
+        return lines
+
+    def export_punches(self):
+        """Export stored punches to a CSV or JSON Lines file chosen by the admin"""
+        if self.storage is None:
+            self.show_error("Punch storage is not available")
+            return
+        try:
+            start_text = self.export_start_var.get().strip()
+            end_text = self.export_end_var.get().strip()
+            start = datetime.strptime(start_text, '%Y-%m-%d') if start_text else None
+            # The end day is included, so stop at the following midnight
+            end = datetime.strptime(end_text, '%Y-%m-%d') + timedelta(days=1) if end_text else None
+        except ValueError:
+            self.show_error("Enter export dates as YYYY-MM-DD")
+            return
+        if start and end and start >= end:
+            self.show_error("The export start date is after the end date")
+            return
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="Export Punches",
+            defaultextension=".csv",
+            initialfile=f"punches-{datetime.now().strftime('%Y%m%d')}.csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")]
+        )
+        if not path:
+            return
+        synced = False if self.export_unsynced_var.get() else None
+
+        def run_export():
+            try:
+                count = export_punches(self.storage, path, start=start, end=end, synced=synced)
+                message = f"Exported {count} punches to {os.path.basename(path)}"
+                self.after(0, lambda: self._finish_export(message))
+            except Exception as e:
+                logger.error(f"Punch export failed: {e}")
+                error = f"Export failed: {e}"
+                self.after(0, lambda: self._finish_export(None, error))
+
+        # Large backlogs take a while; keep the panel responsive
+        self.export_button.configure(state="disabled")
+        self.export_status_label.configure(text="Exporting...")
+        threading.Thread(target=run_export, daemon=True).start()
+
+    def _finish_export(self, message: Optional[str], error: Optional[str] = None):
+        self.export_button.configure(state="normal")
+        self.export_status_label.configure(text=message or "")
+        if error:
+            self.show_error(error)
+
     def clean_old_records(self):
         # TODO: Implement database cleanup
         self.show_error("Database cleanup not implemented yet")
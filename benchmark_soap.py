@@ -0,0 +1,133 @@
+"""
+CPU cost per punch of the SOAP punch path: zeep's generic serializer and
+deserializer against the templated fast path in soap_fastpath. Both build
+the RecordSwipeSummary request and read a canned reply in process, so the
+numbers measure this machine's CPU, not the network. Service definitions
+come from the configured endpoint or, offline, from the WSDL cache.
+
+Usage (on the kiosk, with the time clock stopped):
+    python benchmark_soap.py
+    python benchmark_soap.py --punches 5000 --output soap-bench.json
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+from datetime import datetime
+from typing import Dict, Any, Callable
+
+from requests.models import Response
+from zeep.wsdl.utils import etree_to_string
+
+from benchmark_storage import summarize
+
+OPERATION = 'RecordSwipeSummary'
+
+SAMPLE_VALUES = {
+    'PunchSuccess': 'true',
+    'PunchType': 'checkin',
+    'FirstName': 'Test',
+    'LastName': 'Employee',
+    'PunchException': '0',
+    'CurrentWeeklyHours': '38.5'
+}
+
+
+def canned_response(content: bytes) -> Response:
+    response = Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'text/xml; charset=utf-8'
+    response._content = content
+    return response
+
+
+def bench(name: str, punch: Callable[[str], Any], punches: int) -> Dict[str, Any]:
+    """Time punch() for a run of swipe inputs, wall clock per call and CPU overall"""
+    timings = []
+    cpu_start = time.process_time()
+    for i in range(punches):
+        swipe_input = f"{100000 + i}|*|{datetime.now().isoformat()}"
+        start = time.perf_counter()
+        punch(swipe_input)
+        timings.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+    result = summarize(timings)
+    result['path'] = name
+    result['cpuMsPerPunch'] = round(cpu / punches * 1000, 4)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CPU per punch of zeep against the SOAP fast path')
+    parser.add_argument('--punches', type=int, default=2000, help='Punches per path (default: 2000)')
+    parser.add_argument('--settings', default='settings.json', help='Settings file (default: settings.json)')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+
+    from soap_client import SoapClient
+    client = SoapClient(args.settings)
+    fast_path = client.fast_path
+    if client.summary_client is None or fast_path is None:
+        print(f"Service definitions unavailable or unsuitable for the fast path: "
+              f"{client.get_connection_error()}", file=sys.stderr)
+        sys.exit(1)
+
+    summary = client.summary_client
+    binding = summary.service._binding
+    operation = binding.get(OPERATION)
+    reply = fast_path.sample_reply(OPERATION, SAMPLE_VALUES)
+
+    def zeep_punch(swipe_input: str):
+        envelope, _ = binding._create(
+            OPERATION, (), {'_soapheaders': [client.credentials], 'swipeInput': swipe_input},
+            client=summary
+        )
+        etree_to_string(envelope)
+        result = binding.process_reply(summary, operation, canned_response(reply))
+        return client._format_response(result, True)
+
+    def fast_punch(swipe_input: str):
+        fast_path.render(OPERATION, swipe_input)
+        result = fast_path.parse(OPERATION, reply)
+        return client._format_response(result, True)
+
+    # Both paths must agree before their speed means anything
+    if zeep_punch('0|*|2026-01-01T00:00:00') != fast_punch('0|*|2026-01-01T00:00:00'):
+        print("Fast path and zeep disagree on the sample reply", file=sys.stderr)
+        sys.exit(1)
+
+    # _format_response logs every punch at INFO, keep that out of the timings
+    logging.getLogger('soap_client').setLevel(logging.WARNING)
+
+    report = {
+        'startedAt': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'punches': args.punches,
+        'results': [
+            bench('zeep', zeep_punch, args.punches),
+            bench('fastPath', fast_punch, args.punches)
+        ]
+    }
+    zeep_cpu = report['results'][0]['cpuMsPerPunch']
+    fast_cpu = report['results'][1]['cpuMsPerPunch']
+    report['speedup'] = round(zeep_cpu / fast_cpu, 1) if fast_cpu else None
+    report['finishedAt'] = datetime.now().isoformat()
+    client.storage.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"Wrote benchmark report to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Storage microbenchmarks for OfflineStorage.
+Measures store_punch, get_unsynced_punches, mark_as_synced and
+cleanup_old_records across every storage engine at several backlog sizes,
+each run in a fresh temporary directory, and prints the results as JSON.
+
+Usage:
+    python benchmark_storage.py
+    python benchmark_storage.py --engines sqlite segments --sizes 100 1000 --output bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+
+from offline_storage import OfflineStorage, ENGINES
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+# Backlog punches spread over this many days so cleanup has something to remove
+BACKLOG_DAYS = 30
+RETENTION_DAYS = 10
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Latency percentiles in milliseconds and throughput for a list of durations in seconds"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return round(ordered[index] * 1000, 3)
+
+    total = sum(ordered)
+    return {
+        'count': len(ordered),
+        'meanMs': round(total / len(ordered) * 1000, 3),
+        'p50Ms': percentile(50),
+        'p95Ms': percentile(95),
+        'p99Ms': percentile(99),
+        'maxMs': round(ordered[-1] * 1000, 3),
+        'opsPerSec': round(len(ordered) / total, 1) if total > 0 else None
+    }
+
+
+def make_backlog(size: int, synced_fraction: float) -> List[Dict[str, Any]]:
+    """Punch records created over the last BACKLOG_DAYS days, oldest first"""
+    now = datetime.now()
+    rng = random.Random(size)
+    punches = []
+    for i in range(size):
+        created = now - timedelta(seconds=(size - i) * BACKLOG_DAYS * 86400 / size)
+        synced = rng.random() < synced_fraction
+        punches.append({
+            'employeeId': str(100000 + rng.randrange(500)),
+            'punchTime': created.isoformat(),
+            'punchType': 'OFFLINE',
+            'imageFilename': None,
+            'synced': synced,
+            'createdAt': created.isoformat(),
+            'syncedAt': created.isoformat() if synced else None
+        })
+    return punches
+
+
+def write_settings(directory: str, engine: str, size: int, samples: int) -> str:
+    settings_path = os.path.join(directory, 'settings.json')
+    with open(settings_path, 'w') as f:
+        json.dump({
+            'storage': {
+                'retentionDays': RETENTION_DAYS,
+                'engine': engine,
+                'dbPath': os.path.join(directory, 'data', 'local.db'),
+                'photoDir': os.path.join(directory, 'photos'),
+                # Room for the backlog plus the measured stores, so no spill interferes
+                'maxOfflineRecords': size + samples + 1
+            }
+        }, f, indent=2)
+    return settings_path
+
+
+def bench_engine(engine: str, size: int, samples: int, synced_fraction: float) -> Dict[str, Any]:
+    """Run every storage benchmark for one engine at one backlog size"""
+    directory = tempfile.mkdtemp(prefix=f'msiclock-bench-{engine}-')
+    result: Dict[str, Any] = {'engine': engine, 'backlog': size}
+    try:
+        storage = OfflineStorage(write_settings(directory, engine, size, samples))
+        try:
+            start = time.perf_counter()
+            storage.import_punches(make_backlog(size, synced_fraction))
+            result['loadSeconds'] = round(time.perf_counter() - start, 3)
+
+            timings = []
+            for _ in range(samples):
+                start = time.perf_counter()
+                storage.store_punch(str(random.randrange(100000, 999999)), datetime.now())
+                timings.append(time.perf_counter() - start)
+            result['store_punch'] = summarize(timings)
+
+            timings = []
+            unsynced: List[Dict[str, Any]] = []
+            for _ in range(max(1, samples // 10)):
+                start = time.perf_counter()
+                unsynced = storage.get_unsynced_punches()
+                timings.append(time.perf_counter() - start)
+            result['get_unsynced_punches'] = summarize(timings)
+            result['get_unsynced_punches']['rows'] = len(unsynced)
+
+            timings = []
+            for punch in unsynced[:samples]:
+                start = time.perf_counter()
+                storage.mark_as_synced(punch['id'])
+                timings.append(time.perf_counter() - start)
+            result['mark_as_synced'] = summarize(timings)
+
+            start = time.perf_counter()
+            deleted = storage.cleanup_old_records(RETENTION_DAYS)
+            result['cleanup_old_records'] = summarize([time.perf_counter() - start])
+            result['cleanup_old_records']['deleted'] = deleted
+        finally:
+            storage.close()
+        result['bytesOnDisk'] = directory_size(directory)
+    except Exception as e:
+        logging.error(f"Benchmark {engine} at {size} records failed: {e}")
+        result['error'] = str(e)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return result
+
+
+def directory_size(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the offline punch storage engines')
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES),
+                        help='Storage engines to benchmark (default: all)')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help='Backlog sizes to benchmark at')
+    parser.add_argument('--samples', type=int, default=100,
+                        help='Timed calls per operation (default: 100)')
+    parser.add_argument('--synced-fraction', type=float, default=0.5,
+                        help='Share of the backlog that is already synced (default: 0.5)')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+
+    report = {
+        'startedAt': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'samples': args.samples,
+        'syncedFraction': args.synced_fraction,
+        'results': []
+    }
+    for engine in args.engines:
+        for size in args.sizes:
+            print(f"Benchmarking {engine} with {size} records...", file=sys.stderr)
+            report['results'].append(bench_engine(engine, size, args.samples, args.synced_fraction))
+    report['finishedAt'] = datetime.now().isoformat()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"Wrote benchmark report to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
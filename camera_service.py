@@ -34,10 +34,12 @@ logging.getLogger("ultralytics").setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
 class CameraService:
-    def __init__(self, settings_path: str = 'settings.json'):
+    def __init__(self, settings_path: str = 'settings.json', photo_store=None):
         self.settings = self._load_settings(settings_path)
         self.camera = None
         self._initialized = False
+        # PhotoStore that keeps the local copy of each captured photo
+        self.photo_store = photo_store
         # Initialize YOLO model for person detection
         try:
             self.model = YOLO('yolov8n.pt')  # Using the smallest model for faster inference
@@ -504,9 +506,7 @@ class CameraService:
                 jpeg_data = buffer.tobytes()
                 
                 # Save a local copy
-                filename = f"photos/{employee_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}.jpg"
-                os.makedirs("photos", exist_ok=True)
-                cv2.imwrite(filename, placeholder)
+                self._save_local_copy(employee_id, timestamp, jpeg_data)
                 
                 return jpeg_data
             
@@ -533,10 +533,7 @@ class CameraService:
             # Save a local copy for backup using provided timestamp or current time
             if timestamp is None:
                 timestamp = datetime.now()
-            filename = f"photos/{employee_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}.jpg"
-            
-            os.makedirs("photos", exist_ok=True)
-            cv2.imwrite(filename, resized_frame)
+            self._save_local_copy(employee_id, timestamp, jpeg_data)
 
             return jpeg_data
 
@@ -544,6 +541,18 @@ class CameraService:
             logger.error(f"Error capturing photo: {e}")
             return None
 
+    def _save_local_copy(self, employee_id: str, timestamp: datetime, jpeg_data: bytes):
+        """Keep the captured JPEG in the photo store"""
+        if self.photo_store is None:
+            logger.debug("No photo store configured, not keeping a local copy")
+            return
+        try:
+            filename = f"{employee_id}_{timestamp.strftime('%Y%m%d_%H%M%S')}.jpg"
+            self.photo_store.put(filename, jpeg_data)
+        except Exception as e:
+            # The punch must not fail because the backup copy couldn't be saved
+            logger.error(f"Failed to save local photo copy: {e}")
+
     def cleanup(self):
         """Release camera resources"""
         try:
@@ -0,0 +1,116 @@
+"""
+Circuit breaker for the SOAP server connection.
+After repeated failures the circuit opens and no attempts are made until
+an exponentially growing, randomly jittered delay has passed. A single
+trial attempt is then let through (half-open): success closes the circuit,
+failure opens it again with a longer delay. The jitter spreads the retries
+of many kiosks when the server comes back.
+"""
+
+import time
+import random
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """Closed/open/half-open state machine with exponential backoff and jitter"""
+
+    def __init__(self, failure_threshold: int = 3, base_delay: float = 5.0,
+                 max_delay: float = 300.0, jitter: float = 0.5, name: str = 'SOAP'):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open a closed circuit
+            base_delay: Delay in seconds after the circuit first opens
+            max_delay: Upper bound for the doubled delays
+            jitter: Share of each delay that is randomized (0 to 1)
+            name: Used in log messages
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        # Times the circuit has opened since it was last closed, drives the backoff
+        self._opens = 0
+        self._retry_at = 0.0
+        self._last_change = time.time()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether an attempt may be made now
+
+        An open circuit whose delay has passed turns half-open and allows
+        exactly one trial attempt.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() >= self._retry_at:
+                self._set_state(HALF_OPEN)
+                logger.info(f"{self.name} circuit half-open, allowing a trial attempt")
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opens = 0
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+                logger.info(f"{self.name} circuit closed")
+
+    def record_failure(self, error: Optional[str] = None):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opens += 1
+                delay = self._backoff()
+                self._retry_at = time.monotonic() + delay
+                self._set_state(OPEN)
+                logger.warning(
+                    f"{self.name} circuit open after {self._failures} failures, "
+                    f"next attempt in {delay:.1f}s{f': {error}' if error else ''}"
+                )
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit allows its trial attempt"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._retry_at - time.monotonic())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = max(0.0, self._retry_at - time.monotonic()) if self._state == OPEN else 0.0
+            return {
+                'state': self._state,
+                'failures': self._failures,
+                'opens': self._opens,
+                'retryIn': round(retry_in, 1),
+                'since': self._last_change
+            }
+
+    def _backoff(self) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** (self._opens - 1)))
+        # Randomize the top part of the delay so kiosks don't retry in step
+        return delay * (1 - self.jitter * random.random())
+
+    def _set_state(self, state: str):
+        logger.debug(f"{self.name} circuit {self._state} -> {state}")
+        self._state = state
+        self._last_change = time.time()
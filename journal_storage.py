@@ -0,0 +1,302 @@
+"""
+Append-only journal storage engine for offline punches.
+Every change is one JSON line appended to a journal file, so storing a
+punch costs a single small append and fsync regardless of the backlog
+size. A background compactor periodically folds the journal into a
+snapshot file; on startup the state is rebuilt from snapshot plus journal.
+"""
+
+import os
+import json
+import bisect
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+from punch_store import PunchStore, DEFAULT_READ_BATCH, fsync_dir, punch_matches, read_events
+
+logger = logging.getLogger(__name__)
+
+# Default seconds between background compactions
+DEFAULT_COMPACT_INTERVAL = 300
+
+
+class JournalPunchStore(PunchStore):
+    """Offline punches as a snapshot file plus an append-only event journal
+
+    Files, all next to the configured database path:
+        <base>.snapshot   - JSON object with lastId and the full punch list
+        <base>.journal    - one JSON event per line, appended since the snapshot
+        <base>.journal.1  - previous journal while a compaction is running
+    """
+
+    name = 'journal'
+
+    def __init__(self, path: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(path, options)
+        base = os.path.splitext(path)[0]
+        self.snapshot_file = base + '.snapshot'
+        self.journal_file = base + '.journal'
+        self.rotated_file = self.journal_file + '.1'
+        self._lock = threading.RLock()
+        # Serializes compactions; appends only wait for the journal rotation
+        self._compact_lock = threading.Lock()
+        self._punches: Dict[int, Dict[str, Any]] = {}
+        self._last_id = 0
+        self._replay()
+        self._journal = open(self.journal_file, 'a')
+        fsync_dir(os.path.dirname(self.journal_file))
+
+        # Background compactor
+        self._compact_interval = self.options.get('compactIntervalSeconds', DEFAULT_COMPACT_INTERVAL)
+        self._stop_event = threading.Event()
+        self._compactor = threading.Thread(target=self._compact_loop, name='journal-compactor')
+        self._compactor.daemon = True
+        self._compactor.start()
+
+    def _replay(self):
+        """Rebuild the in-memory state from the snapshot and journal files"""
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, 'r') as f:
+                    snapshot = json.load(f)
+            except ValueError as e:
+                # Startup recovery ran out of time on it; salvage without a deadline
+                logger.error(f"Journal snapshot damaged, salvaging it: {e}")
+                from storage_recovery import repair_snapshot
+                repair_snapshot(self.snapshot_file)
+                with open(self.snapshot_file, 'r') as f:
+                    snapshot = json.load(f)
+            self._last_id = snapshot.get('lastId', 0)
+            for punch in snapshot.get('punches', []):
+                self._punches[punch['id']] = punch
+
+        # Events are idempotent, so replaying a rotated journal that an
+        # interrupted compaction already folded into the snapshot is harmless
+        replayed = 0
+        for journal in (self.rotated_file, self.journal_file):
+            if os.path.exists(journal):
+                replayed += self._replay_journal(journal)
+        logger.debug(f"Journal store loaded {len(self._punches)} punches ({replayed} journal events)")
+
+    def _replay_journal(self, journal: str) -> int:
+        """Apply every event in a journal file"""
+        applied = 0
+        for event in read_events(journal):
+            try:
+                self._apply(event)
+                applied += 1
+            except Exception as e:
+                logger.error(f"Skipping bad journal event in {journal}: {e}")
+        return applied
+
+    def _apply(self, event: Dict[str, Any]):
+        """Apply a single journal event to the in-memory state"""
+        op = event['op']
+        if op == 'stored':
+            punch = event['punch']
+            self._punches[punch['id']] = punch
+            self._last_id = max(self._last_id, punch['id'])
+        elif op == 'synced':
+            punch = self._punches.get(event['id'])
+            if punch is not None:
+                punch['synced'] = True
+                punch['syncedAt'] = event['syncedAt']
+        elif op == 'deleted':
+            for punch_id in event['ids']:
+                self._punches.pop(punch_id, None)
+        else:
+            raise ValueError(f"unknown journal op '{op}'")
+
+    def _append(self, events: List[Dict[str, Any]]):
+        """Durably append events to the journal with a single fsync"""
+        self._journal.write(''.join(
+            json.dumps(event, separators=(',', ':')) + '\n' for event in events
+        ))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def commit(self, ops: List[Tuple]) -> List[Any]:
+        with self._lock:
+            events = []
+            results = []
+            next_id = self._last_id
+            for op in ops:
+                if op[0] == 'store':
+                    punch = op[1]
+                    next_id += 1
+                    punch['id'] = next_id
+                    events.append({'op': 'stored', 'punch': dict(punch)})
+                    results.append(punch)
+                elif op[0] == 'synced':
+                    known = op[1] in self._punches or op[1] in (
+                        e['punch']['id'] for e in events if e['op'] == 'stored'
+                    )
+                    if known:
+                        events.append({'op': 'synced', 'id': op[1], 'syncedAt': op[2]})
+                    results.append(known)
+                elif op[0] == 'delete':
+                    present = [i for i in op[1] if i in self._punches]
+                    if present:
+                        events.append({'op': 'deleted', 'ids': present})
+                    results.append(len(present))
+                else:
+                    raise ValueError(f"Unknown storage operation '{op[0]}'")
+            # Only touch the in-memory state once the events are durable
+            if events:
+                self._append(events)
+                for event in events:
+                    self._apply(event)
+        return results
+
+    def import_punches(self, punches, source: Optional[str] = None) -> int:
+        with self._lock:
+            count = 0
+            for punch in punches:
+                punch = dict(punch)
+                punch['id'] = self._last_id + 1
+                self._apply({'op': 'stored', 'punch': punch})
+                count += 1
+        # One snapshot write instead of an fsync per imported punch
+        if count:
+            self.compact()
+        return count
+
+    def get_unsynced(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(p) for p in self._punches.values() if not p.get('synced', False)]
+
+    def iter_punches(self, start: Optional[str] = None, end: Optional[str] = None,
+                     synced: Optional[bool] = None,
+                     batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            keys = sorted(
+                (p['punchTime'], punch_id) for punch_id, p in self._punches.items()
+                if punch_matches(p, start, end, synced)
+            )
+        for offset in range(0, len(keys), batch_size):
+            with self._lock:
+                batch = [
+                    dict(self._punches[punch_id]) for _, punch_id in keys[offset:offset + batch_size]
+                    if punch_id in self._punches
+                ]
+            yield from batch
+
+    def iter_unsynced(self, after: Optional[Tuple[str, int]] = None,
+                      batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        # Punches are already in memory: sort just their keys once, then copy
+        # out one batch of records at a time
+        with self._lock:
+            keys = sorted(
+                (p['punchTime'], punch_id) for punch_id, p in self._punches.items()
+                if not p.get('synced', False)
+            )
+        if after is not None:
+            keys = keys[bisect.bisect_right(keys, tuple(after)):]
+        for start in range(0, len(keys), batch_size):
+            with self._lock:
+                batch = [
+                    dict(self._punches[punch_id]) for _, punch_id in keys[start:start + batch_size]
+                    if punch_id in self._punches and not self._punches[punch_id].get('synced', False)
+                ]
+            yield from batch
+
+    def oldest(self, synced: bool, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            matching = [dict(p) for p in self._punches.values() if p.get('synced', False) == synced]
+        matching.sort(key=lambda p: (p['createdAt'], p['id']))
+        return matching[:limit]
+
+    def delete_created_before(self, cutoff: datetime) -> int:
+        with self._lock:
+            expired = [
+                punch_id for punch_id, p in self._punches.items()
+                if datetime.fromisoformat(p['createdAt']).replace(
+                    hour=0, minute=0, second=0, microsecond=0
+                ) <= cutoff
+            ]
+            if expired:
+                # Journaled first, so replaying a journal that an interrupted
+                # compaction left behind can't bring the punches back
+                event = {'op': 'deleted', 'ids': expired}
+                self._append([event])
+                self._apply(event)
+        # Fold the deletions into the snapshot to reclaim the space
+        if expired:
+            self.compact()
+        return len(expired)
+
+    def data_files(self) -> List[str]:
+        return [self.snapshot_file, self.rotated_file, self.journal_file]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._punches)
+
+    def compact(self):
+        """Fold the journal into a new snapshot and start an empty journal"""
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            # Rotate the journal so appends can continue while the snapshot is written
+            self._journal.close()
+            if os.path.exists(self.rotated_file):
+                # A previous compaction failed part way; its events are in memory
+                # and will be in this snapshot, so fold them in with the rest
+                with open(self.rotated_file, 'a') as rotated, open(self.journal_file, 'r') as current:
+                    rotated.write(current.read())
+                    rotated.flush()
+                    os.fsync(rotated.fileno())
+                os.unlink(self.journal_file)
+            else:
+                os.replace(self.journal_file, self.rotated_file)
+            self._journal = open(self.journal_file, 'a')
+            fsync_dir(os.path.dirname(self.journal_file))
+            snapshot = {
+                'lastId': self._last_id,
+                'punches': [dict(p) for p in self._punches.values()]
+            }
+
+        try:
+            temp_fd, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.snapshot_file),
+                prefix='punches_',
+                suffix='.tmp'
+            )
+            try:
+                with os.fdopen(temp_fd, 'w') as f:
+                    json.dump(snapshot, f, separators=(',', ':'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.snapshot_file)
+                fsync_dir(os.path.dirname(self.snapshot_file))
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+            os.unlink(self.rotated_file)
+            logger.debug(f"Compacted punch journal into snapshot ({len(snapshot['punches'])} punches)")
+        except Exception as e:
+            logger.error(f"Failed to compact punch journal: {e}")
+            raise
+
+    def _compact_loop(self):
+        """Background compactor thread"""
+        while not self._stop_event.wait(self._compact_interval):
+            try:
+                if os.path.getsize(self.journal_file) > 0:
+                    self.compact()
+            except Exception as e:
+                logger.error(f"Background journal compaction failed: {e}")
+
+    def close(self):
+        self._stop_event.set()
+        with self._lock:
+            try:
+                self._journal.close()
+            except Exception as e:
+                logger.warning(f"Failed to close punch journal: {e}")
@@ -233,7 +233,8 @@ class TimeClock:
                 "password": "",
                 "endpoint": "http://msiwebtrax.com/",
                 "timeout": 30,
-                "clientId": 185
+                "clientId": 185,
+                "poolSize": 4
             },
             "camera": {
                 "deviceId": 0,
@@ -252,13 +253,19 @@ class TimeClock:
             },
             "storage": {
                 "retentionDays": 30,
+                "engine": "sqlite",
                 "dbPath": "data/local.db",
-                "maxOfflineRecords": 10000
+                "maxOfflineRecords": 10000,
+                "maxPhotoBytes": 536870912
             },
             "logging": {
                 "level": "INFO",
                 "maxSize": 10485760,
                 "backupCount": 5
+            },
+            "telemetry": {
+                "exportPath": "data/telemetry.json",
+                "exportInterval": 60
             }
         }
         
@@ -279,7 +286,8 @@ class TimeClock:
                     "password": "",
                     "endpoint": "http://msiwebtrax.com/",
                     "timeout": 30,
-                    "clientId": 185
+                    "clientId": 185,
+                    "poolSize": 4
                 },
                 "camera": {
                     "deviceId": 0,
@@ -298,13 +306,19 @@ class TimeClock:
                 },
                 "storage": {
                     "retentionDays": 30,
+                    "engine": "sqlite",
                     "dbPath": "data/local.db",
-                    "maxOfflineRecords": 10000
+                    "maxOfflineRecords": 10000,
+                    "maxPhotoBytes": 536870912
                 },
                 "logging": {
                     "level": "INFO",
                     "maxSize": 10485760,
                     "backupCount": 5
+                },
+                "telemetry": {
+                    "exportPath": "data/telemetry.json",
+                    "exportInterval": 60
                 }
             }
             
@@ -440,7 +454,8 @@ class TimeClock:
                 error = self.soap_client.get_connection_error()
                 logging.info(f"Starting in offline mode: {error}. Punches will be stored locally and synced when connection is restored.")
 
-            self.camera_service = CameraService()
+            # Photos go through the offline store's photo store
+            self.camera_service = CameraService(photo_store=self.soap_client.storage.photos)
             
             # Test camera initialization
             if not self.camera_service.initialize():
@@ -457,14 +472,17 @@ class TimeClock:
         # Create main UI with settings in the content frame
         # Pass the camera_service to TimeClockUI to avoid creating multiple instances
         self.content_frame.camera_service = self.camera_service
+        # Share the SOAP client too, so one OfflineStorage owns the punch store
+        self.content_frame.soap_client = self.soap_client
         self.time_clock_ui = TimeClockUI(self.content_frame, settings=self.settings)
         self.time_clock_ui.pack(fill="both", expand=True)
 
     def schedule_tasks(self):
         # Schedule periodic tasks
         
-        # Try to reconnect if offline every minute
-        self.root.after(60000, self.check_connection)
+        # Check the connection every 5 seconds while offline; the client's
+        # circuit breaker decides when a reconnect is actually attempted
+        self._schedule_periodic_task(self.check_connection, 5000)
         
         # Sync offline punches every 5 minutes
         self.root.after(300000, self.sync_offline_data)
@@ -475,6 +493,13 @@ class TimeClock:
         # Check camera connection every hour
         self.root.after(3600000, self.check_camera)
         
+        # Log offline storage health every 5 minutes
+        self._schedule_periodic_task(self.log_storage_health, 300000)
+        
+        # Export SOAP telemetry every minute
+        interval = self.settings.get('telemetry', {}).get('exportInterval', 60)
+        self._schedule_periodic_task(self.export_telemetry, int(interval * 1000))
+        
         # Check for day change every minute
         self.last_day = datetime.now().day
         self.root.after(60000, self.check_day_change)
@@ -506,11 +531,11 @@ class TimeClock:
     def check_connection(self):
         """Check connection status and attempt reconnection if offline"""
         if not self.soap_client.is_online():
-            if self.soap_client.try_reconnect():
-                logging.info("Successfully reconnected to SOAP service")
-            else:
-                error = self.soap_client.get_connection_error()
-                logging.debug(f"Still offline: {error}")
+            # Reconnect off the UI thread; the client logs the outcome
+            if not self.soap_client.request_reconnect():
+                status = self.soap_client.connection_status()
+                circuit = status['circuit']
+                logging.debug(f"Still offline (circuit {circuit['state']}, retry in {circuit['retryIn']}s): {status['error']}")
 
     def check_day_change(self):
         """Check if day has changed and add separator to logs"""
@@ -538,10 +563,33 @@ class TimeClock:
         else:
             logging.debug("Skipping offline sync - system is offline")
 
+    def log_storage_health(self):
+        """Log offline backlog counters"""
+        stats = self.soap_client.storage.stats()
+        logging.info(
+            f"Storage health: {stats['unsynced']} unsynced "
+            f"(oldest {stats['oldestUnsynced'] or 'n/a'}), {stats['syncedToday']} synced today, "
+            f"{stats['total']} total, {stats['bytesOnDisk']} bytes on disk, "
+            f"{stats['photoBytes']} bytes of photos"
+        )
+
+    def export_telemetry(self):
+        """Write SOAP latency histograms and connection counters to the telemetry file"""
+        path = self.settings.get('telemetry', {}).get('exportPath', 'data/telemetry.json')
+        self.soap_client.telemetry.export(path, {'connection': self.soap_client.connection_status()})
+
     def cleanup_old_records(self):
-        """Clean up old records"""
-        count = self.soap_client.cleanup_old_records()
-        logging.debug(f"Cleaned up {count} old records")
+        """Clean up old records on a background thread, so photo compaction can't freeze the UI"""
+        import threading
+
+        def run_cleanup():
+            try:
+                count = self.soap_client.cleanup_old_records()
+                logging.debug(f"Cleaned up {count} old records")
+            except Exception as e:
+                logging.error(f"Retention cleanup failed: {e}")
+
+        threading.Thread(target=run_cleanup, name='retention-cleanup', daemon=True).start()
 
     def check_camera(self):
         """Check camera connection"""
@@ -563,7 +611,8 @@ class TimeClock:
     def show_admin_panel_direct(self, first_launch=False):
         """Show admin panel directly without password prompt"""
         # Create admin panel as a Toplevel window with settings path
-        admin_panel = AdminPanel(self.root, settings_path='settings.json')
+        admin_panel = AdminPanel(self.root, settings_path='settings.json', storage=self.soap_client.storage,
+                                 soap_client=self.soap_client)
         logging.debug("Created admin panel with settings path")
         
         # Get screen dimensions
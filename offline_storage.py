@@ -1,84 +1,148 @@
 import os
 import json
+import heapq
 import logging
-import tempfile
-import shutil
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import threading
+from datetime import datetime, timedelta, date
+from typing import Dict, List, Iterable, Iterator, Optional, Any, Tuple
+
+from punch_store import PunchStore, JsonPunchStore, DEFAULT_READ_BATCH, punch_matches, write_json_atomic
+from sqlite_storage import SqlitePunchStore
+from journal_storage import JournalPunchStore
+from segment_storage import SegmentPunchStore
+from storage_writer import StorageWriter, DEFAULT_GROUP_COMMIT_MS
+from overflow_storage import PunchArchive, OverflowSegment
+from storage_recovery import recover_storage, DEFAULT_TIME_LIMIT
+from photo_store import PhotoStore, DEFAULT_MAX_PHOTO_BYTES
+from upload_queue import UploadQueue
 
 logger = logging.getLogger(__name__)
 
+# Storage engines selectable through the storage.engine setting
+ENGINES = {
+    'sqlite': SqlitePunchStore,
+    'json': JsonPunchStore,
+    'journal': JournalPunchStore,
+    'segments': SegmentPunchStore,
+}
+DEFAULT_ENGINE = 'sqlite'
+
+# File extension each engine keeps its data under
+ENGINE_EXTENSIONS = {
+    'sqlite': '.db',
+    'json': '.json',
+    'journal': '.journal',
+    'segments': '.segments',
+}
+
+def sync_key(punch: Dict[str, Any]) -> Tuple[str, int]:
+    """Order in which offline punches are sent to the server"""
+    return (punch['punchTime'], punch['id'])
+
+# Default cap on punches kept in the hot store
+DEFAULT_MAX_OFFLINE_RECORDS = 10000
+
 class OfflineStorage:
     def __init__(self, settings_path: str = 'settings.json'):
         self.settings_path = settings_path
-        self.storage_file = self._get_storage_path()
+        self.engine, db_path, self.options = self._get_storage_settings()
+        self.storage_file = self._get_storage_path(db_path)
+        base = os.path.splitext(self.storage_file)[0]
+        self.cursor_file = base + '.cursor'
         self._ensure_data_dir()
+        # Repair whatever an unclean shutdown left behind before opening the store
+        self.recovery_report = recover_storage(
+            self.storage_file,
+            self.engine,
+            legacy_file=os.path.splitext(db_path)[0] + '.json',
+            time_limit=self.options.get('recoveryTimeLimitSeconds', DEFAULT_TIME_LIMIT)
+        )
+        self.store: PunchStore = ENGINES[self.engine](self.storage_file, self.options)
+        self._import_legacy_json(db_path)
 
-    def _get_storage_path(self) -> str:
-        """Get the path to the offline storage file from settings"""
+        # Bounded hot store: punches past the cap spill to the archive or overflow
+        self.max_records = self.options.get('maxOfflineRecords', DEFAULT_MAX_OFFLINE_RECORDS)
+        self.archive = PunchArchive(base + '.archive')
+        self.overflow = OverflowSegment(base + '.overflow.jsonl')
+        self._complete_interrupted_spill()
+        self._count_lock = threading.Lock()
+        # Counts of the three places punches are held, changed together under
+        # the lock so their sum never counts a moving punch twice
+        self._hot_count = self.store.count()
+        self._overflow_count = self.overflow.count()
+        self._archive_count = self.archive.count()
+        self._spill_pending = False
+        # All writes go through a single writer thread that group-commits them
+        self.writer = StorageWriter(
+            self.store,
+            self.options.get('groupCommitMs', DEFAULT_GROUP_COMMIT_MS)
+        )
+
+        # Punch photos, kept within a byte budget; unsynced punches pin theirs
+        self.photos = PhotoStore(
+            self.options.get('photoDir', 'photos'),
+            self.options.get('maxPhotoBytes', DEFAULT_MAX_PHOTO_BYTES)
+        )
+        # Photos of online punches still to be uploaded, pinned as well
+        self.uploads = UploadQueue(base + '.uploads.jsonl')
+        unsynced = self.get_unsynced_punches()
+        self.photos.set_pinned(self._pinned_photos(unsynced))
+
+        # Counters behind stats(), kept current by every write
+        self.stats_file = base + '.stats'
+        self._unsynced: Dict[int, str] = {}
+        # (punchTime, id) of unsynced punches; synced ones are popped lazily from the top
+        self._unsynced_heap: List[Tuple[str, int]] = []
+        self._reset_unsynced(unsynced)
+        self._synced_day, self._synced_today = self._load_synced_today()
+        self._bytes_on_disk = 0
+        self._refresh_bytes()
+
+    def _get_storage_settings(self):
+        """Get the storage engine and database path from settings"""
         try:
             with open(self.settings_path, 'r') as f:
                 settings = json.load(f)
-                # Convert the SQLite path to JSON path
-                db_path = settings['storage']['dbPath']
-                return db_path.replace('.db', '.json')
+                storage = settings['storage']
+                engine = storage.get('engine', DEFAULT_ENGINE)
+                if engine not in ENGINES:
+                    logger.error(f"Unknown storage engine '{engine}', using {DEFAULT_ENGINE}")
+                    engine = DEFAULT_ENGINE
+                return engine, storage['dbPath'], storage
         except Exception as e:
             logger.error(f"Failed to get storage path: {e}")
-            return 'data/local.json'  # Default path
+            return DEFAULT_ENGINE, 'data/local.db', {}  # Default path
+
+    def _get_storage_path(self, db_path: str) -> str:
+        """Get the path to the offline storage file for the configured engine"""
+        base, _ = os.path.splitext(db_path)
+        return base + ENGINE_EXTENSIONS[self.engine]
 
     def _ensure_data_dir(self):
         """Ensure the data directory exists"""
-        os.makedirs(os.path.dirname(self.storage_file), exist_ok=True)
+        os.makedirs(os.path.dirname(self.storage_file) or '.', exist_ok=True)
 
-    def _load_punches(self) -> List[Dict[str, Any]]:
-        """Load punches from the JSON file"""
+    def _import_legacy_json(self, db_path: str):
+        """Import punches from a local.json left by the JSON engine on first start"""
+        legacy_file = os.path.splitext(db_path)[0] + '.json'
+        if self.engine == 'json' or not os.path.exists(legacy_file):
+            return
         try:
-            if os.path.exists(self.storage_file):
-                with open(self.storage_file, 'r') as f:
-                    return json.load(f)
-            return []
+            with open(legacy_file, 'r') as f:
+                punches = json.load(f)
+            count = self.store.import_punches(punches, source=legacy_file)
+            # Keep the old file around under a new name instead of deleting it
+            os.replace(legacy_file, legacy_file + '.imported')
+            logger.info(f"Imported {count} punches from {legacy_file} into {self.engine} storage")
         except Exception as e:
-            logger.error(f"Failed to load punches: {e}")
-            return []
-
-    def _save_punches(self, punches: List[Dict[str, Any]]):
-        """Save punches to the JSON file using atomic write"""
-        try:
-            # Create a temporary file in the same directory
-            temp_fd, temp_path = tempfile.mkstemp(
-                dir=os.path.dirname(self.storage_file),
-                prefix='punches_',
-                suffix='.tmp'
-            )
-            
-            try:
-                with os.fdopen(temp_fd, 'w') as f:
-                    json.dump(punches, f, indent=2)
-                    f.flush()
-                    os.fsync(f.fileno())  # Ensure data is written to disk
-                
-                # Atomic rename
-                shutil.move(temp_path, self.storage_file)
-                
-            except Exception:
-                # Clean up the temp file if something went wrong
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
-                raise
-                
-        except Exception as e:
-            logger.error(f"Failed to save punches: {e}")
-            raise
+            logger.error(f"Failed to import legacy punches from {legacy_file}: {e}")
 
     def store_punch(self, employee_id: str, punch_time: datetime,
                    punch_type: str = 'OFFLINE', image_filename: Optional[str] = None) -> Dict[str, Any]:
         """Store a punch in the offline storage"""
         try:
-            punches = self._load_punches()
-            
             # Create new punch record
             punch = {
-                'id': len(punches) + 1,  # Simple auto-increment
                 'employeeId': employee_id,
                 'punchTime': punch_time.isoformat(),
                 'punchType': punch_type,
@@ -86,10 +150,22 @@ class OfflineStorage:
                 'synced': False,
                 'createdAt': datetime.now().isoformat()
             }
-            
-            punches.append(punch)
-            self._save_punches(punches)
-            
+
+            # Blocks until the writer has made the punch durable
+            stored = self.writer.submit(('store', punch)).result()
+
+            with self._count_lock:
+                self._hot_count += 1
+                self._unsynced[stored['id']] = stored['punchTime']
+                heapq.heappush(self._unsynced_heap, (stored['punchTime'], stored['id']))
+                spill = self._hot_count > self.max_records and not self._spill_pending
+                if spill:
+                    self._spill_pending = True
+            if spill:
+                # Runs on the writer thread; the punch itself is already stored
+                self.writer.call(self._spill)
+            self._refresh_bytes()
+
             return {
                 'success': True,
                 'offline': True,
@@ -97,61 +173,348 @@ class OfflineStorage:
                 'punchType': punch_type,
                 'employeeId': employee_id
             }
-            
+
         except Exception as e:
             logger.error(f"Failed to store offline punch: {e}")
             raise
 
+    def import_punches(self, punches: Iterable[Dict[str, Any]]) -> int:
+        """Bulk-insert existing punch records through the writer (ids are reassigned)
+
+        The counters and photo pins are brought up to date, and the hot
+        store spills as after store_punch if the import took it past its cap.
+        Returns:
+            Number of punches imported
+        """
+        try:
+            def load():
+                count = self.store.import_punches(punches)
+                return count, list(self.iter_unsynced_punches())
+            count, unsynced = self.writer.call(load).result()
+
+            with self._count_lock:
+                self._hot_count += count
+                for punch in unsynced:
+                    if punch['id'] not in self._unsynced:
+                        self._unsynced[punch['id']] = punch['punchTime']
+                        heapq.heappush(self._unsynced_heap, sync_key(punch))
+                spill = self._hot_count > self.max_records and not self._spill_pending
+                if spill:
+                    self._spill_pending = True
+            self.photos.set_pinned(self._pinned_photos(unsynced))
+            if spill:
+                self.writer.call(self._spill)
+            self._refresh_bytes()
+            logger.info(f"Imported {count} punches into {self.engine} storage")
+            return count
+        except Exception as e:
+            logger.error(f"Failed to import punches: {e}")
+            raise
+
     def get_unsynced_punches(self) -> List[Dict[str, Any]]:
-        """Get all unsynced punches"""
+        """Get all unsynced punches in sync order, overflow punches merged in"""
         try:
-            punches = self._load_punches()
-            return [p for p in punches if not p.get('synced', False)]
+            return list(self.iter_unsynced_punches())
         except Exception as e:
             logger.error(f"Failed to get unsynced punches: {e}")
             return []
 
+    def iter_unsynced_punches(self, after: Optional[Tuple[str, int]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield unsynced punches lazily in sync order, overflow punches merged in
+
+        The hot store is read storage.readBatchSize punches at a time, so
+        memory stays flat however large the backlog is.
+
+        Args:
+            after: Only yield punches whose sync key sorts after this one
+        """
+        batch_size = self.options.get('readBatchSize', DEFAULT_READ_BATCH)
+        overflow = self.overflow.iter_punches(after, batch_size=batch_size)
+        hot = (
+            p for p in self.store.iter_unsynced(after, batch_size)
+            if not self.overflow.contains(p['id'])
+        )
+        return heapq.merge(overflow, hot, key=sync_key)
+
+    def iter_punches(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     synced: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+        """Yield every stored punch matching the filters, at most one archive month in memory
+
+        Filters are applied inside each storage layer: the hot store first,
+        then overflow punches, then the archive. Within each layer punches
+        come in punch-time order; the archive is ordered month file by
+        month file, and its files are named by the month punches were stored.
+
+        Args:
+            start: Only punches punched at or after this time
+            end: Only punches punched before this time
+            synced: Only synced (True) or unsynced (False) punches, None for both
+        """
+        start_iso = start.isoformat() if start is not None else None
+        end_iso = end.isoformat() if end is not None else None
+        batch_size = self.options.get('readBatchSize', DEFAULT_READ_BATCH)
+        overflow_ids = set(self.overflow.ids())
+        for punch in self.store.iter_punches(start_iso, end_iso, synced, batch_size):
+            # Hot copies left by an interrupted spill are exported from overflow
+            if punch['id'] not in overflow_ids:
+                yield punch
+        if synced is not True:
+            yield from self.overflow.iter_punches(start=start_iso, end=end_iso, batch_size=batch_size)
+        if synced is not False:
+            for punch in self.archive.iter_punches(start_iso):
+                if punch_matches(punch, start_iso, end_iso):
+                    yield punch
+
     def mark_as_synced(self, punch_id: int):
         """Mark a punch as synced"""
+        self.mark_many_synced([punch_id])
+
+    def mark_many_synced(self, punch_ids: List[int]):
+        """Mark several punches as synced in a single durable commit"""
+        if not punch_ids:
+            return
         try:
-            punches = self._load_punches()
-            for punch in punches:
-                if punch['id'] == punch_id:
-                    punch['synced'] = True
-                    punch['syncedAt'] = datetime.now().isoformat()
-                    break
-            self._save_punches(punches)
+            # Overflow membership is checked on the writer thread, where a spill
+            # can't move a punch between the check and the mark
+            found = self.writer.call(lambda: self._commit_synced(punch_ids)).result()
+            if len(found) < len(punch_ids):
+                found_set = set(found)
+                missing = [punch_id for punch_id in punch_ids if punch_id not in found_set]
+                logger.warning(f"Punches {missing} not found while marking as synced")
+            self._note_synced(found)
         except Exception as e:
-            logger.error(f"Failed to mark punch as synced: {e}")
+            logger.error(f"Failed to mark punches as synced: {e}")
             raise
 
+    def get_sync_cursor(self) -> Optional[Tuple[str, int]]:
+        """Get the sync key of the last checkpointed punch of an unfinished sync pass"""
+        try:
+            if os.path.exists(self.cursor_file):
+                with open(self.cursor_file, 'r') as f:
+                    cursor = json.load(f).get('after')
+                    return tuple(cursor) if cursor else None
+        except Exception as e:
+            logger.error(f"Failed to read sync cursor: {e}")
+        return None
+
+    def save_sync_cursor(self, cursor: Optional[Tuple[str, int]]):
+        """Persist the sync cursor. None marks the sync pass as finished"""
+        try:
+            if cursor is None:
+                if os.path.exists(self.cursor_file):
+                    os.unlink(self.cursor_file)
+                return
+            write_json_atomic(self.cursor_file, {
+                'after': list(cursor),
+                'savedAt': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Failed to save sync cursor: {e}")
+
     def cleanup_old_records(self, retention_days: int) -> int:
         """Remove old records based on retention policy"""
         try:
-            from datetime import timedelta
-            punches = self._load_punches()
             cutoff_date = datetime.now().replace(
                 hour=0, minute=0, second=0, microsecond=0
             )
-            
+
             # Calculate cutoff date using timedelta
             cutoff_date = cutoff_date - timedelta(days=retention_days)
-            
-            # Filter out old records
-            new_punches = [
-                p for p in punches
-                if datetime.fromisoformat(p['createdAt']).replace(
-                    hour=0, minute=0, second=0, microsecond=0
-                ) > cutoff_date
-            ]
-            
-            deleted_count = len(punches) - len(new_punches)
-            
-            if deleted_count > 0:
-                self._save_punches(new_punches)
-                
-            return deleted_count
-            
+
+            # Both on the writer, so no spill moves punches in between
+            hot_deleted, archive_deleted = self.writer.call(
+                lambda: (self.store.delete_created_before(cutoff_date), self.archive.delete_before(cutoff_date))
+            ).result()
+            with self._count_lock:
+                self._hot_count -= hot_deleted
+                self._archive_count -= archive_deleted
+            deleted = hot_deleted + archive_deleted
+
+            # Retention may remove unsynced punches too, so recount them
+            unsynced = self.get_unsynced_punches()
+            with self._count_lock:
+                self._reset_unsynced(unsynced)
+
+            # Photos follow the same retention, except those unsynced punches
+            # and the upload queue need
+            self.photos.cleanup(cutoff_date, pinned=self._pinned_photos(unsynced))
+            self._refresh_bytes()
+            return deleted
+
         except Exception as e:
             logger.error(f"Failed to cleanup old records: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def _pinned_photos(self, unsynced: List[Dict[str, Any]]) -> List[str]:
+        """Photos that must be kept: those of unsynced punches and queued uploads"""
+        names = [p['imageFilename'] for p in unsynced if p.get('imageFilename')]
+        return names + self.uploads.names()
+
+    def _complete_interrupted_spill(self):
+        """Drop hot copies of overflow punches left by a spill cut short by a crash"""
+        overflow_ids = self.overflow.ids()
+        if overflow_ids:
+            removed = self.store.commit([('delete', overflow_ids)])[0]
+            if removed:
+                logger.info(f"Completed interrupted spill of {removed} punches to overflow")
+
+    def _spill(self):
+        """Move the oldest punches out of the hot store until it is under its cap"""
+        with self._count_lock:
+            self._spill_pending = False
+            excess = self._hot_count - self.max_records
+        if excess <= 0:
+            return
+        try:
+            # Spill a little past the cap so every following punch doesn't spill again
+            target = excess + max(1, self.max_records // 20)
+            synced = self.store.oldest(synced=True, limit=target)
+            if synced:
+                self.archive.append(synced)
+                removed = self.store.commit([('delete', [p['id'] for p in synced])])[0]
+                with self._count_lock:
+                    self._hot_count -= removed
+                    self._archive_count += len(synced)
+                logger.info(f"Archived {removed} synced punches, hot store at capacity ({self.max_records})")
+
+            with self._count_lock:
+                excess = self._hot_count - self.max_records
+            if excess > 0:
+                # Only unsynced punches left: spill them with the same headroom
+                unsynced = self.store.oldest(synced=False, limit=excess + max(1, self.max_records // 20))
+                self.overflow.add(unsynced)
+                removed = self.store.commit([('delete', [p['id'] for p in unsynced])])[0]
+                with self._count_lock:
+                    self._hot_count -= removed
+                    self._overflow_count = self.overflow.count()
+                logger.warning(f"Moved {removed} unsynced punches to overflow, "
+                               f"{self.overflow.count()} waiting in overflow")
+        except Exception as e:
+            logger.error(f"Failed to spill offline punches: {e}")
+        self._refresh_bytes()
+
+    def _commit_synced(self, punch_ids: List[int]) -> List[int]:
+        """Mark punches synced wherever they are now. Runs on the writer thread
+
+        Returns:
+            The ids that were found, in overflow or in the hot store
+        """
+        overflow_ids = [i for i in punch_ids if self.overflow.contains(i)]
+        if overflow_ids:
+            self._sync_overflow(overflow_ids)
+            overflow_set = set(overflow_ids)
+            punch_ids = [i for i in punch_ids if i not in overflow_set]
+        if not punch_ids:
+            return overflow_ids
+        synced_at = datetime.now().isoformat()
+        results = self.store.commit([('synced', punch_id, synced_at) for punch_id in punch_ids])
+        return overflow_ids + [punch_id for punch_id, found in zip(punch_ids, results) if found]
+
+    def _sync_overflow(self, punch_ids: List[int]):
+        """Move synced overflow punches to the archive, then take them off the overflow
+
+        A crash in between leaves them in both, to be sent and archived
+        again, never in neither.
+        """
+        synced_at = datetime.now().isoformat()
+        synced = self.overflow.get(punch_ids)
+        if not synced:
+            return
+        for punch in synced:
+            punch['synced'] = True
+            punch['syncedAt'] = synced_at
+        self.archive.append(synced)
+        self.overflow.mark_synced([p['id'] for p in synced], synced_at)
+        with self._count_lock:
+            self._overflow_count = self.overflow.count()
+            self._archive_count += len(synced)
+
+    def _reset_unsynced(self, unsynced: List[Dict[str, Any]]):
+        """Rebuild the unsynced index from a full list. Caller holds the count lock"""
+        self._unsynced = {p['id']: p['punchTime'] for p in unsynced}
+        self._unsynced_heap = [sync_key(p) for p in unsynced]
+        heapq.heapify(self._unsynced_heap)
+
+    def _load_synced_today(self) -> Tuple[str, int]:
+        try:
+            if os.path.exists(self.stats_file):
+                with open(self.stats_file, 'r') as f:
+                    saved = json.load(f)
+                if saved.get('day') == date.today().isoformat():
+                    return saved['day'], saved.get('syncedToday', 0)
+        except Exception as e:
+            logger.warning(f"Failed to read storage stats, starting today's count at 0: {e}")
+        return date.today().isoformat(), 0
+
+    def _note_synced(self, punch_ids: List[int]):
+        """Update the counters for punches that were just marked synced"""
+        today = date.today().isoformat()
+        with self._count_lock:
+            if self._synced_day != today:
+                self._synced_day, self._synced_today = today, 0
+            for punch_id in punch_ids:
+                if self._unsynced.pop(punch_id, None) is not None:
+                    self._synced_today += 1
+            saved = {'day': self._synced_day, 'syncedToday': self._synced_today}
+        try:
+            # Only a display counter; not worth an fsync per checkpoint
+            write_json_atomic(self.stats_file, saved, durable=False)
+        except Exception as e:
+            logger.warning(f"Failed to save storage stats: {e}")
+        self._refresh_bytes()
+
+    def _refresh_bytes(self):
+        """Re-read the size of the storage files after a write"""
+        try:
+            size = self.store.size_bytes() + self.overflow.size_bytes() + self.archive.size_bytes()
+        except OSError as e:
+            logger.debug(f"Failed to size storage files: {e}")
+            return
+        with self._count_lock:
+            self._bytes_on_disk = size
+
+    def stats(self) -> Dict[str, Any]:
+        """Backlog counters, maintained on every write so reading them is O(1)
+
+        Returns:
+            total: punches held, hot store plus overflow plus archive
+            unsynced: punches waiting to be sent
+            syncedToday: punches marked synced since midnight
+            oldestUnsynced: punch time of the next punch to send, or None
+            bytesOnDisk: size of the punch store, overflow and archive files
+            photoBytes: size of the stored photos
+        """
+        with self._count_lock:
+            synced_today = self._synced_today if self._synced_day == date.today().isoformat() else 0
+            heap = self._unsynced_heap
+            while heap and heap[0][1] not in self._unsynced:
+                heapq.heappop(heap)
+            oldest = heap[0][0] if heap else None
+            counts = {
+                'total': self._hot_count + self._overflow_count + self._archive_count,
+                'unsynced': len(self._unsynced),
+                'syncedToday': synced_today,
+                'oldestUnsynced': oldest,
+                'bytesOnDisk': self._bytes_on_disk
+            }
+        counts['photoBytes'] = self.photos.size_bytes()
+        return counts
+
+    def spill_stats(self) -> Dict[str, int]:
+        """Sizes of the hot store and the spill targets, for the admin panel"""
+        with self._count_lock:
+            hot, overflow, archived = self._hot_count, self._overflow_count, self._archive_count
+        return {
+            'hot': hot,
+            'maxRecords': self.max_records,
+            'overflow': overflow,
+            'overflowBytes': self.overflow.size_bytes(),
+            'archived': archived,
+            'archiveBytes': self.archive.size_bytes()
+        }
+
+    def close(self):
+        """Flush pending writes and close the underlying storage engine"""
+        self.writer.stop()
+        self.store.close()
+        self.photos.close()
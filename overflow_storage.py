@@ -0,0 +1,270 @@
+"""
+Spill targets for the bounded offline punch store.
+When the hot store reaches storage.maxOfflineRecords, the oldest synced
+punches move to a gzip-compressed archive and, if that is not enough,
+the oldest unsynced punches move to an overflow segment that the offline
+sync drains before the hot store.
+"""
+
+import os
+import gzip
+import bisect
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from punch_store import DEFAULT_READ_BATCH, fsync_dir, iter_events, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class PunchArchive:
+    """Append-only gzip archive of synced punches, one file per month
+
+    Each append adds a new gzip member to the month's file, which gzip
+    readers treat as one continuous stream. Record counts are kept in a
+    small index file so they can be shown without decompressing anything.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_file = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = self._load_index()
+
+    def _load_index(self) -> Dict[str, int]:
+        counts = {}
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r') as f:
+                    counts = json.load(f)
+        except Exception as e:
+            logger.warning(f"Archive index unreadable, recounting archives: {e}")
+        for name in os.listdir(self.directory):
+            if name.endswith('.jsonl.gz') and name not in counts:
+                counts[name] = sum(1 for _ in self.iter_file(os.path.join(self.directory, name)))
+        return counts
+
+    def _file_for(self, punch: Dict[str, Any]) -> str:
+        return f"punches-{punch['createdAt'][:7]}.jsonl.gz"
+
+    def append(self, punches: Iterable[Dict[str, Any]]) -> int:
+        """Durably append punches to the archive. Returns the number archived"""
+        by_file: Dict[str, List[str]] = {}
+        for punch in punches:
+            by_file.setdefault(self._file_for(punch), []).append(
+                json.dumps(punch, separators=(',', ':')))
+        count = 0
+        with self._lock:
+            for name, lines in by_file.items():
+                path = os.path.join(self.directory, name)
+                with open(path, 'ab') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='ab') as gz:
+                        gz.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                self._counts[name] = self._counts.get(name, 0) + len(lines)
+                count += len(lines)
+            fsync_dir(self.directory)
+            self._save_index()
+        return count
+
+    def _save_index(self):
+        try:
+            write_json_atomic(self.index_file, self._counts)
+        except Exception as e:
+            logger.warning(f"Failed to write archive index: {e}")
+
+    @staticmethod
+    def iter_file(path: str):
+        """Yield the punch records of one archive file"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_punches(self, start: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield archived punches one month file at a time
+
+        Each month is read whole and sorted by (punchTime, id), since its
+        records are in the order they were spilled. Memory is bounded by
+        the largest month, not the archive.
+
+        Args:
+            start: Skip months before this ISO timestamp's month. Files are
+                   named by createdAt, which is never before the punch time
+        """
+        with self._lock:
+            names = sorted(self._counts)
+        for name in names:
+            if start is not None and name[len('punches-'):-len('.jsonl.gz')] < start[:7]:
+                continue
+            try:
+                month = list(self.iter_file(os.path.join(self.directory, name)))
+            except FileNotFoundError:
+                # Removed by retention cleanup meanwhile
+                continue
+            month.sort(key=lambda p: (p['punchTime'], p['id']))
+            yield from month
+
+    def delete_before(self, cutoff: datetime) -> int:
+        """Delete archive months that end before the cutoff day. Returns records removed"""
+        cutoff_month = cutoff.strftime('%Y-%m')
+        removed = 0
+        with self._lock:
+            for name in sorted(self._counts):
+                month = name[len('punches-'):-len('.jsonl.gz')]
+                if month >= cutoff_month:
+                    continue
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                removed += self._counts.pop(name)
+            if removed:
+                self._save_index()
+        return removed
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(self._counts.values())
+
+    def size_bytes(self) -> int:
+        total = 0
+        with self._lock:
+            for name in self._counts:
+                try:
+                    total += os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        return total
+
+
+class OverflowSegment:
+    """Unsynced punches that were spilled out of the full hot store
+
+    Kept as an event file of 'stored' and 'synced' lines. As in the segment
+    engine, only each pending punch's sync key and the offset of its
+    'stored' line are held in memory; the records themselves are read back
+    from the file a batch at a time. Once every punch in it has synced, the
+    file is removed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Punch id -> (punchTime, offset of its 'stored' line)
+        self._index: Dict[int, Tuple[str, int]] = {}
+        if os.path.exists(path):
+            for offset, event in iter_events(path):
+                if event.get('op') == 'stored':
+                    punch = event['punch']
+                    self._index[punch['id']] = (punch['punchTime'], offset)
+                elif event.get('op') == 'synced':
+                    self._index.pop(event['id'], None)
+
+    def _append(self, events: List[Dict[str, Any]]) -> List[int]:
+        """Durably append events, returning the offset of each line"""
+        lines = [(json.dumps(e, separators=(',', ':')) + '\n').encode('utf-8') for e in events]
+        new_file = not os.path.exists(self.path)
+        with open(self.path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        if new_file:
+            fsync_dir(os.path.dirname(self.path))
+        offsets = []
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line)
+        return offsets
+
+    def _read(self, punch_ids: List[int]) -> List[Dict[str, Any]]:
+        """Read pending punches from the file, in file order. Caller holds the lock"""
+        located = sorted((self._index[i][1], i) for i in punch_ids if i in self._index)
+        punches = []
+        if not located:
+            return punches
+        with open(self.path, 'rb') as f:
+            for offset, punch_id in located:
+                f.seek(offset)
+                punch = json.loads(f.readline())['punch']
+                if punch['id'] != punch_id:
+                    raise ValueError(f"Overflow index out of step with {self.path} at offset {offset}")
+                punches.append(punch)
+        return punches
+
+    def add(self, punches: List[Dict[str, Any]]):
+        """Durably move unsynced punches into the overflow segment"""
+        if not punches:
+            return
+        with self._lock:
+            offsets = self._append([{'op': 'stored', 'punch': p} for p in punches])
+            for punch, offset in zip(punches, offsets):
+                self._index[punch['id']] = (punch['punchTime'], offset)
+
+    def get(self, punch_ids: List[int]) -> List[Dict[str, Any]]:
+        """The pending overflow punches among punch_ids"""
+        with self._lock:
+            return self._read(punch_ids)
+
+    def mark_synced(self, punch_ids: List[int], synced_at: str):
+        """Durably record overflow punches as synced
+
+        Callers archive the punches first, so a failure here or a crash
+        before it leaves them pending rather than lost.
+        """
+        with self._lock:
+            ids = [i for i in punch_ids if i in self._index]
+            if not ids:
+                return
+            if len(ids) < len(self._index):
+                self._append([{'op': 'synced', 'id': i, 'syncedAt': synced_at} for i in ids])
+            else:
+                # Fully drained
+                os.unlink(self.path)
+            for punch_id in ids:
+                del self._index[punch_id]
+
+    def contains(self, punch_id: int) -> bool:
+        return punch_id in self._index
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return list(self._index)
+
+    def iter_punches(self, after: Optional[Tuple[str, int]] = None, start: Optional[str] = None,
+                     end: Optional[str] = None,
+                     batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        """Yield pending overflow punches in sync order, by (punchTime, id)
+
+        Args:
+            after: Only punches whose (punchTime, id) sorts after this key
+            start: Only punches with punchTime at or after this ISO timestamp
+            end: Only punches with punchTime before this ISO timestamp
+            batch_size: Punches read from the file at a time
+        """
+        with self._lock:
+            keys = sorted((t, i) for i, (t, _) in self._index.items()
+                          if (start is None or t >= start) and (end is None or t < end))
+        if after is not None:
+            keys = keys[bisect.bisect_right(keys, tuple(after)):]
+        for first in range(0, len(keys), batch_size):
+            with self._lock:
+                # Punches synced since the keys were taken are skipped
+                batch = self._read([i for _, i in keys[first:first + batch_size]])
+            batch.sort(key=lambda p: (p['punchTime'], p['id']))
+            yield from batch
+
+    def count(self) -> int:
+        return len(self._index)
+
+    def size_bytes(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
@@ -0,0 +1,61 @@
+"""
+Append-only pack file for punch photos.
+Photos are written back to back into a single data file and read through
+a memory map, so storing thousands of photos costs one inode and reading
+one for upload is a slice of the map rather than an open/read/close.
+Where each photo lives is recorded by the caller's index.
+"""
+
+import os
+import mmap
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PhotoPack:
+    """Append-only photo data file with zero-copy memory-mapped reads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        self._size = os.path.getsize(path)
+        self._map = None
+
+    def size(self) -> int:
+        return self._size
+
+    def append(self, data: bytes) -> int:
+        """Durably append a photo. Returns its offset in the pack"""
+        with self._lock:
+            offset = self._size
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._size += len(data)
+            return offset
+
+    def read(self, offset: int, length: int) -> memoryview:
+        """View of a photo's bytes, backed by the memory map"""
+        if offset + length > self._size:
+            raise ValueError(f"Photo at {offset}+{length} is past the end of {self.path}")
+        with self._lock:
+            if self._map is None or len(self._map) < offset + length:
+                # The pack grew since it was mapped. Views into the old map keep
+                # it alive until they are released, so it is just dropped here
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._map)[offset:offset + length]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            if self._map is not None:
+                try:
+                    self._map.close()
+                except BufferError:
+                    # A caller still holds a view; the map goes with it
+                    pass
+                self._map = None
@@ -0,0 +1,436 @@
+"""
+Bounded, content-addressed store for punch photos.
+Photos are kept once per distinct JPEG under their SHA-256 and looked up
+by the image filename the punch carries. The store holds to a byte budget
+by evicting the least recently used photos first, but never a photo still
+needed by an unsynced punch. Photo data lives in an append-only pack file
+that compaction rewrites once evicted photos take up enough of it.
+"""
+
+import os
+import glob
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional, Union
+
+from punch_store import fsync_dir, read_events
+from photo_pack import PhotoPack
+
+logger = logging.getLogger(__name__)
+
+# Default byte budget for stored photos
+DEFAULT_MAX_PHOTO_BYTES = 512 * 1024 * 1024
+
+INDEX_NAME = 'index.jsonl'
+
+# Share of the pack held by removed photos before cleanup compacts it, so
+# a rewrite always reclaims a good part of what it copies
+COMPACT_DEAD_RATIO = 0.25
+
+# Never compact to reclaim less than this
+COMPACT_MIN_DEAD_BYTES = 4 * 1024 * 1024
+
+
+class PhotoStore:
+    """Photos addressed by content hash with an LRU byte budget
+
+    Layout, under the photo directory:
+        photos-<n>.pack - photo data, appended back to back
+        index.jsonl     - 'pack', 'put' (with the pack offset), 'used'
+                          and 'removed' events
+
+    Photos stored one per file under objects/ by earlier versions stay
+    readable and are moved into the pack by the next compaction.
+
+    Punches still waiting to be synced pin their photos. Pins live in
+    memory only: the offline store sets them from the unsynced punches on
+    startup and on every cleanup, so a crash can't leave one behind.
+    Flat *.jpg files written before this store existed are still readable
+    and are removed by retention cleanup once they are old enough.
+    """
+
+    def __init__(self, directory: str = 'photos', max_bytes: int = DEFAULT_MAX_PHOTO_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(directory, INDEX_NAME)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        # name -> {hash, storedAt}
+        self._names: Dict[str, Dict[str, Any]] = {}
+        # hash -> {size, storedAt, lastUsed}; insertion order is LRU order
+        self._objects: Dict[str, Dict[str, Any]] = {}
+        # hash -> names referring to it
+        self._refs: Dict[str, set] = {}
+        self._pinned: set = set()
+        self._bytes = 0
+        self._index_lines = 0
+        self._compacting = False
+        self.pack_file = 'photos-0.pack'
+        self._load_index()
+        self._remove_stale_packs()
+        self.pack = PhotoPack(os.path.join(directory, self.pack_file))
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'objects', digest[:2], digest + '.jpg')
+
+    def _load_index(self):
+        if not os.path.exists(self.index_file):
+            return
+        for event in read_events(self.index_file):
+            self._index_lines += 1
+            op = event.get('op')
+            if op == 'pack':
+                self.pack_file = event['file']
+            elif op == 'put':
+                self._apply_put(event['name'], event['hash'], event['size'], event['at'],
+                                event.get('offset'))
+            elif op == 'used' and event.get('hash') in self._objects:
+                self._touch(event['hash'], event['at'])
+            elif op == 'removed':
+                for digest in event['hashes']:
+                    self._forget(digest)
+        logger.debug(f"Photo store loaded {len(self._objects)} photos ({self._bytes} bytes)")
+
+    def _remove_stale_packs(self):
+        """Delete packs left by a compaction that didn't finish"""
+        for path in glob.glob(os.path.join(self.directory, 'photos-*.pack')):
+            if os.path.basename(path) != self.pack_file:
+                logger.info(f"Removing stale photo pack {path}")
+                os.unlink(path)
+
+    def _apply_put(self, name: str, digest: str, size: int, at: str, offset: Optional[int] = None):
+        previous = self._names.get(name)
+        if previous is not None and previous['hash'] != digest:
+            self._refs.get(previous['hash'], set()).discard(name)
+        self._names[name] = {'hash': digest, 'storedAt': at}
+        self._refs.setdefault(digest, set()).add(name)
+        obj = self._objects.pop(digest, None)
+        if obj is None:
+            # offset None: an objects/ file from before the pack existed
+            obj = {'size': size, 'storedAt': at, 'lastUsed': at, 'offset': offset}
+            self._bytes += size
+        obj['storedAt'] = max(obj['storedAt'], at)
+        obj['lastUsed'] = at
+        self._objects[digest] = obj
+
+    def _touch(self, digest: str, at: str):
+        obj = self._objects.pop(digest)
+        obj['lastUsed'] = at
+        self._objects[digest] = obj
+
+    def _forget(self, digest: str):
+        obj = self._objects.pop(digest, None)
+        if obj is None:
+            return
+        self._bytes -= obj['size']
+        for name in self._refs.pop(digest, ()):
+            del self._names[name]
+
+    def _append(self, events, durable: bool = True):
+        with open(self.index_file, 'a') as f:
+            f.write(''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in events))
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        self._index_lines += len(events)
+
+    def put(self, name: str, data: bytes, pin: bool = False) -> str:
+        """Durably store a photo under an image filename
+
+        Args:
+            name: Image filename the punch refers to
+            data: JPEG bytes
+            pin: Keep the photo until unpinned, for punches not yet synced
+        Returns:
+            Content hash of the photo
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        at = datetime.now().isoformat()
+        with self._lock:
+            obj = self._objects.get(digest)
+            offset = obj['offset'] if obj is not None else None
+            if offset is None:
+                offset = self.pack.append(data)
+                if obj is not None:
+                    # Same photo as a loose file: the pack copy replaces it
+                    self._objects.pop(digest)
+                    self._bytes -= obj['size']
+            self._append([{'op': 'put', 'name': name, 'hash': digest, 'size': len(data),
+                           'offset': offset, 'at': at}])
+            self._apply_put(name, digest, len(data), at, offset)
+            if pin:
+                self._pinned.add(name)
+            if self._bytes > self.max_bytes:
+                self._evict()
+        return digest
+
+    def view(self, name: str) -> Optional[Union[memoryview, bytes]]:
+        """Read a photo by image filename without copying it out of the pack
+
+        Returns a memoryview over the pack's memory map, bytes for photos
+        not in the pack yet, or None if the photo isn't stored.
+        """
+        with self._lock:
+            entry = self._names.get(name)
+            if entry is not None:
+                digest = entry['hash']
+                obj = self._objects[digest]
+                try:
+                    data = self._read_object(digest, obj)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Photo {name} is indexed but its data is missing: {e}")
+                    return None
+                at = datetime.now().isoformat()
+                # Recency only guides eviction, losing it in a crash is harmless
+                self._append([{'op': 'used', 'hash': digest, 'at': at}], durable=False)
+                self._touch(digest, at)
+                return data
+
+        # Photos saved before the store existed sit directly in the directory
+        legacy_path = os.path.join(self.directory, os.path.basename(name))
+        try:
+            with open(legacy_path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _read_object(self, digest: str, obj: Dict[str, Any]) -> Union[memoryview, bytes]:
+        if obj['offset'] is not None:
+            return self.pack.read(obj['offset'], obj['size'])
+        with open(self._object_path(digest), 'rb') as f:
+            return f.read()
+
+    def contains(self, name: str) -> bool:
+        with self._lock:
+            if name in self._names:
+                return True
+        return os.path.exists(os.path.join(self.directory, os.path.basename(name)))
+
+    def set_pinned(self, names: Iterable[str]):
+        """Replace the set of photos that must be kept, see class docstring"""
+        with self._lock:
+            self._pinned = set(n for n in names if n)
+
+    def unpin(self, names: Iterable[str]):
+        """Allow photos of punches that have synced to be evicted"""
+        with self._lock:
+            self._pinned.difference_update(names)
+
+    def _pinned_hashes(self) -> set:
+        return {self._names[n]['hash'] for n in self._pinned if n in self._names}
+
+    def _remove(self, digests):
+        """Delete photos by hash. Caller holds the lock"""
+        if not digests:
+            return
+        self._append([{'op': 'removed', 'hashes': list(digests)}])
+        for digest in digests:
+            obj = self._objects.get(digest)
+            self._forget(digest)
+            if obj is not None and obj['offset'] is None:
+                try:
+                    os.unlink(self._object_path(digest))
+                except FileNotFoundError:
+                    pass
+            # Pack space is reclaimed by the next compaction
+
+    def _evict(self) -> int:
+        """Drop least recently used unpinned photos until under budget. Caller holds the lock"""
+        pinned = self._pinned_hashes()
+        victims = []
+        excess = self._bytes - self.max_bytes
+        for digest, obj in self._objects.items():
+            if excess <= 0:
+                break
+            if digest in pinned:
+                continue
+            victims.append(digest)
+            excess -= obj['size']
+        self._remove(victims)
+        if victims:
+            logger.info(f"Evicted {len(victims)} photos to stay within {self.max_bytes} bytes")
+        if self._bytes > self.max_bytes:
+            logger.warning(f"Photo store over budget with {self._bytes} bytes of photos "
+                           f"held by unsynced punches")
+        return len(victims)
+
+    def cleanup(self, cutoff: datetime, pinned: Optional[Iterable[str]] = None) -> int:
+        """Apply retention: remove unpinned photos stored before the cutoff
+
+        Args:
+            cutoff: Photos last stored before this time are removed
+            pinned: Image filenames of all unsynced punches, replacing the current pins
+        Returns:
+            Number of photos removed
+        """
+        cutoff_iso = cutoff.isoformat()
+        with self._lock:
+            if pinned is not None:
+                self._pinned = set(n for n in pinned if n)
+            keep = self._pinned_hashes()
+            expired = [d for d, obj in self._objects.items()
+                       if obj['storedAt'] < cutoff_iso and d not in keep]
+            self._remove(expired)
+            removed = len(expired) + self._evict()
+            removed += self._cleanup_legacy(cutoff)
+            dead = self.dead_bytes()
+            compact = (dead >= max(COMPACT_MIN_DEAD_BYTES, COMPACT_DEAD_RATIO * self.pack.size())
+                       or any(obj['offset'] is None for obj in self._objects.values()))
+            if not compact and self._index_lines > 2 * max(len(self._names), 1000):
+                self._write_index(self.pack_file, {})
+        # Outside the lock: the copy can take a while and puts must not wait on it
+        if compact:
+            self.compact()
+        if removed:
+            logger.info(f"Removed {removed} old photos")
+        return removed
+
+    def _cleanup_legacy(self, cutoff: datetime) -> int:
+        """Remove pre-store flat photo files older than the cutoff"""
+        cutoff_ts = cutoff.timestamp()
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith('.jpg'):
+                    continue
+                if entry.name in self._pinned:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff_ts:
+                        os.unlink(entry.path)
+                        removed += 1
+                except OSError as e:
+                    logger.warning(f"Could not remove old photo {entry.name}: {e}")
+        return removed
+
+    def dead_bytes(self) -> int:
+        """Pack space held by photos that have been removed"""
+        with self._lock:
+            live = sum(obj['size'] for obj in self._objects.values() if obj['offset'] is not None)
+            return self.pack.size() - live
+
+    def compact(self):
+        """Rewrite the pack with only the live photos, in LRU order
+
+        The live photos are copied without holding the lock, so puts and
+        reads carry on; the lock is only taken to copy photos stored in the
+        meantime and to swap the packs. The new pack is written under the
+        next generation's name and only becomes current when the rewritten
+        index naming it replaces the old one, so a crash at any point leaves
+        one consistent pack.
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            generation = int(self.pack_file[len('photos-'):-len('.pack')]) + 1
+            live = [(digest, dict(obj)) for digest, obj in self._objects.items()]
+        try:
+            new_file = f"photos-{generation}.pack"
+            new_path = os.path.join(self.directory, new_file)
+            offsets = {}
+            loose = []
+            with open(new_path, 'wb') as f:
+                for digest, obj in live:
+                    try:
+                        data = self._read_object(digest, obj)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Skipping unreadable photo {digest}: {e}")
+                        continue
+                    offsets[digest] = f.tell()
+                    f.write(data)
+                    if obj['offset'] is None:
+                        loose.append(digest)
+
+                with self._lock:
+                    # Photos stored while copying; removed ones are simply not moved
+                    for digest, obj in list(self._objects.items()):
+                        if digest in offsets:
+                            continue
+                        try:
+                            data = self._read_object(digest, obj)
+                        except (OSError, ValueError) as e:
+                            logger.warning(f"Dropping unreadable photo {digest}: {e}")
+                            self._forget(digest)
+                            continue
+                        offsets[digest] = f.tell()
+                        f.write(data)
+                        if obj['offset'] is None:
+                            loose.append(digest)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    offsets = {d: o for d, o in offsets.items() if d in self._objects}
+                    reclaimed = self.pack.size() - sum(self._objects[d]['size'] for d in offsets)
+
+                    self._write_index(new_file, offsets)
+                    old_pack = self.pack
+                    old_pack.close()
+                    os.unlink(old_pack.path)
+                    self.pack_file = new_file
+                    self.pack = PhotoPack(new_path)
+                    for digest, offset in offsets.items():
+                        self._objects[digest]['offset'] = offset
+                    loose = [d for d in loose if d in offsets]
+        finally:
+            with self._lock:
+                self._compacting = False
+        for digest in loose:
+            try:
+                os.unlink(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Compacted photo pack to {new_file}, reclaimed {max(reclaimed, 0)} bytes"
+                    + (f", packed {len(loose)} loose photos" if loose else ""))
+
+    def _write_index(self, pack_file: str, offsets: Dict[str, int]):
+        """Rewrite the index as one 'put' per live name. Caller holds the lock
+
+        Args:
+            pack_file: Pack the index refers to
+            offsets: New pack offsets by hash, for a compaction
+        """
+        temp_path = self.index_file + '.tmp'
+        lines = 0
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps({'op': 'pack', 'file': pack_file}) + '\n')
+            lines += 1
+            for name, entry in self._names.items():
+                obj = self._objects[entry['hash']]
+                f.write(json.dumps({'op': 'put', 'name': name, 'hash': entry['hash'],
+                                    'size': obj['size'],
+                                    'offset': offsets.get(entry['hash'], obj['offset']),
+                                    'at': entry['storedAt']},
+                                   separators=(',', ':')) + '\n')
+                lines += 1
+            # Recency survives as 'used' events in LRU order
+            for digest, obj in self._objects.items():
+                f.write(json.dumps({'op': 'used', 'hash': digest, 'at': obj['lastUsed']},
+                                   separators=(',', ':')) + '\n')
+                lines += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.index_file)
+        fsync_dir(self.directory)
+        self._index_lines = lines
+        logger.debug(f"Rewrote photo index with {lines} lines")
+
+    def size_bytes(self) -> int:
+        """Bytes of stored photos, kept current by every put and removal"""
+        return self._bytes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'photos': len(self._objects),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'pinned': len(self._pinned_hashes()),
+                'packBytes': self.pack.size()
+            }
+
+    def close(self):
+        with self._lock:
+            self.pack.close()
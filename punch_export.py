@@ -0,0 +1,119 @@
+"""
+Export of stored punches to CSV or JSON Lines.
+Punches are streamed from OfflineStorage straight into the output file,
+so exporting a backlog of any size holds at most one archive month
+in memory. Date-range and synced filters are applied by the storage layer.
+
+Usage (stop the time clock first, the export opens the punch store):
+    python punch_export.py punches.csv
+    python punch_export.py punches.jsonl --from 2026-10-01 --to 2026-10-15 --unsynced
+"""
+
+import os
+import csv
+import json
+import logging
+import argparse
+from datetime import datetime, timedelta
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# CSV column order
+EXPORT_FIELDS = ['id', 'employeeId', 'punchTime', 'punchType', 'imageFilename',
+                 'synced', 'createdAt', 'syncedAt']
+
+
+def export_format_for(path: str) -> str:
+    """Pick the export format from a file name, CSV unless it ends in .jsonl"""
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def export_punches(storage, path: str, export_format: Optional[str] = None,
+                   start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   synced: Optional[bool] = None) -> int:
+    """Stream punches from the offline storage into a file
+
+    The file is written under a temporary name and renamed when complete,
+    so a failed export never leaves a partial file behind.
+
+    Args:
+        storage: OfflineStorage to export from
+        path: Output file
+        export_format: 'csv' or 'jsonl', chosen from the file name if not given
+        start: Only punches punched at or after this time
+        end: Only punches punched before this time
+        synced: Only synced (True) or unsynced (False) punches, None for both
+    Returns:
+        Number of punches exported
+    """
+    export_format = export_format or export_format_for(path)
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'")
+
+    temp_path = path + '.tmp'
+    count = 0
+    try:
+        with open(temp_path, 'w', newline='', encoding='utf-8') as f:
+            punches = storage.iter_punches(start=start, end=end, synced=synced)
+            if export_format == 'csv':
+                writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                for punch in punches:
+                    writer.writerow(punch)
+                    count += 1
+            else:
+                for punch in punches:
+                    f.write(json.dumps(punch, separators=(',', ':')) + '\n')
+                    count += 1
+        os.replace(temp_path, path)
+    except Exception as e:
+        logger.error(f"Failed to export punches to {path}: {e}")
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    logger.info(f"Exported {count} punches to {path}")
+    return count
+
+
+def _parse_day(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a date (YYYY-MM-DD)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export stored punches to CSV or JSON Lines')
+    parser.add_argument('output', help='Output file; .jsonl exports JSON Lines, anything else CSV')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='Override the format chosen from the file name')
+    parser.add_argument('--from', dest='start', type=_parse_day,
+                        help='First punch day to export (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='end', type=_parse_day,
+                        help='Last punch day to export, inclusive (YYYY-MM-DD)')
+    state = parser.add_mutually_exclusive_group()
+    state.add_argument('--synced', dest='synced', action='store_const', const=True,
+                       help='Only punches already sent to the server')
+    state.add_argument('--unsynced', dest='synced', action='store_const', const=False,
+                       help='Only punches still waiting to be sent')
+    parser.add_argument('--settings', default='settings.json', help='Settings file (default: settings.json)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+
+    from offline_storage import OfflineStorage
+    storage = OfflineStorage(args.settings)
+    try:
+        # --to names a whole day
+        end = args.end + timedelta(days=1) if args.end is not None else None
+        count = export_punches(storage, args.output, args.format, args.start, end, args.synced)
+    finally:
+        storage.close()
+    print(f"Exported {count} punches to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Headless load generator for the punch pipeline.
+Replays badge scans through the same steps the kiosk takes for each one:
+photo capture (a stand-in of configurable size and delay),
+SoapClient.record_punch, then queueing the photo for upload. Scans come
+from a punch export (CSV or JSON Lines, replayed with their recorded
+spacing) or are generated at a given rate. Each scan runs on its own
+thread, as in the UI, and the report gives throughput, end-to-end latency
+percentiles, offline fallbacks and how long the photo uploads took to
+drain.
+
+Every run uses a fresh temporary data directory, so the kiosk's punch
+store is never touched. Unless --endpoint is given the punches go to an
+embedded soap_standin server.
+
+Usage:
+    python punch_replay.py --scans 200 --rate 20
+    python punch_replay.py --scans 200 --rate 20 --latency 300 --jitter 200 --hang-rate 0.02
+    python punch_replay.py --replay punches.csv --speed 10 --endpoint http://127.0.0.1:8088/
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from benchmark_storage import summarize, directory_size
+
+logger = logging.getLogger(__name__)
+
+# Shift change at one door: 200 people in 10 minutes
+DEFAULT_SCANS = 200
+DEFAULT_RATE = 20.0
+
+# How often the kiosk's main loop checks the connection
+CONNECTION_CHECK_SECONDS = 5.0
+
+
+def load_scans(path: str) -> List[Tuple[float, str]]:
+    """(offset in seconds, employee ID) for each punch of a punch export, in punch order"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    punches = sorted((datetime.fromisoformat(row['punchTime']), str(row['employeeId'])) for row in rows)
+    if not punches:
+        return []
+    first = punches[0][0]
+    return [((punch_time - first).total_seconds(), employee_id) for punch_time, employee_id in punches]
+
+
+def synthetic_scans(count: int, rate: float, employees: Optional[int], arrivals: str,
+                    rng: random.Random) -> List[Tuple[float, str]]:
+    """Scans at rate per minute, each employee scanning once unless employees is smaller than count"""
+    interval = 60.0 / rate
+    scans = []
+    offset = 0.0
+    for i in range(count):
+        employee = i if not employees else rng.randrange(employees)
+        scans.append((offset, str(100000 + employee)))
+        offset += rng.expovariate(1.0 / interval) if arrivals == 'poisson' else interval
+    return scans
+
+
+def photo_standin(size: int, rng: random.Random) -> bytes:
+    """Bytes shaped like a JPEG of about size bytes"""
+    return b'\xff\xd8\xff\xe0' + rng.randbytes(max(0, size - 6)) + b'\xff\xd9'
+
+
+def write_settings(directory: str, settings_path: str, endpoint: str) -> str:
+    """Copy of the kiosk settings pointed at endpoint, with storage in directory"""
+    with open(settings_path) as f:
+        settings = json.load(f)
+    settings['soap']['endpoint'] = endpoint
+    storage = settings.setdefault('storage', {})
+    storage['dbPath'] = os.path.join(directory, 'data', 'local.db')
+    storage['photoDir'] = os.path.join(directory, 'photos')
+    settings['soap'].pop('wsdlCachePath', None)
+    path = os.path.join(directory, 'settings.json')
+    with open(path, 'w') as f:
+        json.dump(settings, f, indent=2)
+    return path
+
+
+class ReplayRun:
+    """Scans in flight and their outcomes"""
+
+    def __init__(self, client, photo: bytes, capture_seconds: float):
+        self.client = client
+        self.photo = photo
+        self.capture_seconds = capture_seconds
+        self._lock = threading.Lock()
+        self.end_to_end: List[float] = []
+        self.record_punch: List[float] = []
+        self.outcomes: Dict[str, int] = {'online': 0, 'offline': 0, 'rejected': 0, 'error': 0}
+        self.threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(target=self._check_connection, daemon=True)
+        self._watcher.start()
+
+    def _check_connection(self):
+        """Reconnect in the background while offline, as the kiosk's main loop does"""
+        while not self._stop.wait(CONNECTION_CHECK_SECONDS):
+            if not self.client.is_online():
+                self.client.request_reconnect()
+
+    def stop(self):
+        self._stop.set()
+        self._watcher.join()
+
+    def scan(self, employee_id: str, due: float):
+        """One badge scan, as the kiosk's process_in_thread handles it"""
+        try:
+            punch_time = datetime.now()
+            # Photo capture stand-in
+            if self.capture_seconds:
+                time.sleep(self.capture_seconds)
+            photo_data = self.photo
+
+            start = time.perf_counter()
+            response = self.client.record_punch(employee_id=employee_id, punch_time=punch_time)
+            punched = time.perf_counter()
+
+            if response['offline']:
+                outcome = 'offline'
+            elif response['success']:
+                outcome = 'online'
+            else:
+                outcome = 'rejected'
+            if response['success'] and photo_data:
+                self.client.queue_image_upload(employee_id, photo_data, punch_time)
+        except Exception as e:
+            logger.error(f"Scan for {employee_id} failed: {e}")
+            with self._lock:
+                self.outcomes['error'] += 1
+            return
+        with self._lock:
+            self.outcomes[outcome] += 1
+            # From the scan to the result on screen, including any dispatch lag
+            self.end_to_end.append(punched - due)
+            self.record_punch.append(punched - start)
+
+    def run(self, scans: List[Tuple[float, str]], speed: float) -> float:
+        """Dispatch scans on schedule, wait for them all, return the elapsed seconds"""
+        started = time.perf_counter()
+        for offset, employee_id in scans:
+            due = started + offset / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            thread = threading.Thread(target=self.scan, args=(employee_id, due), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        for thread in self.threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def wait_for_uploads(client, timeout: float) -> Tuple[float, int]:
+    """Seconds until the upload queue drained (or timeout passed) and photos still pending"""
+    start = time.perf_counter()
+    while client.pending_uploads() and time.perf_counter() - start < timeout:
+        time.sleep(0.05)
+    return time.perf_counter() - start, client.pending_uploads()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay badge scans through the punch pipeline and report latency')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--replay', help='Punch export (CSV or JSON Lines) to replay')
+    source.add_argument('--scans', type=int, default=DEFAULT_SCANS,
+                        help=f'Number of synthetic scans (default: {DEFAULT_SCANS})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Synthetic scans per minute (default: {DEFAULT_RATE:g})')
+    parser.add_argument('--arrivals', choices=['uniform', 'poisson'], default='poisson',
+                        help='Spacing of synthetic scans (default: poisson)')
+    parser.add_argument('--employees', type=int,
+                        help='Draw synthetic scans from this many employees (default: one scan each)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Replay this many times faster than recorded or requested (default: 1)')
+    parser.add_argument('--photo-bytes', type=int, default=30000, help='Size of the stand-in photo (default: 30000)')
+    parser.add_argument('--capture-ms', type=float, default=0.0, help='Time the stand-in camera takes per photo')
+    parser.add_argument('--settings', default='settings.json', help='Settings file (default: settings.json)')
+    parser.add_argument('--endpoint', help='Send punches here instead of to an embedded stand-in server')
+    parser.add_argument('--latency', type=float, default=0.0, help='Stand-in latency per call in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Stand-in random extra latency in ms')
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='Stand-in share of calls answered with a fault')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Stand-in share of calls that hang')
+    parser.add_argument('--drain-timeout', type=float, default=120.0,
+                        help='Seconds to wait for photo uploads after the last scan (default: 120)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+
+    rng = random.Random(args.seed)
+    if args.replay:
+        scans = load_scans(args.replay)
+    else:
+        scans = synthetic_scans(args.scans, args.rate, args.employees, args.arrivals, rng)
+    if not scans:
+        print("No scans to replay", file=sys.stderr)
+        sys.exit(1)
+
+    standin = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        from soap_standin import start_standin, StandInConfig
+        standin = start_standin(StandInConfig(latency_ms=args.latency, jitter_ms=args.jitter,
+                                              fault_rate=args.fault_rate, hang_rate=args.hang_rate,
+                                              seed=args.seed))
+        endpoint = standin.endpoint
+
+    directory = tempfile.mkdtemp(prefix='msiclock-replay-')
+    try:
+        from soap_client import SoapClient
+        client = SoapClient(write_settings(directory, args.settings, endpoint))
+        if not client.is_online():
+            print(f"Not connected to {endpoint}, every punch will be stored offline: "
+                  f"{client.get_connection_error()}", file=sys.stderr)
+
+        run = ReplayRun(client, photo_standin(args.photo_bytes, rng), args.capture_ms / 1000.0)
+        started_at = datetime.now().isoformat()
+        print(f"Replaying {len(scans)} scans against {endpoint}...", file=sys.stderr)
+        elapsed = run.run(scans, args.speed)
+        drain_seconds, pending = wait_for_uploads(client, args.drain_timeout)
+        run.stop()
+
+        report = {
+            'startedAt': started_at,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'endpoint': endpoint,
+            'source': args.replay or f'synthetic {args.arrivals} at {args.rate:g}/min',
+            'speed': args.speed,
+            'scans': len(scans),
+            'elapsedSeconds': round(elapsed, 3),
+            'scansPerMinute': round(len(scans) / elapsed * 60, 1) if elapsed > 0 else None,
+            'outcomes': run.outcomes,
+            'offlineFallbacks': run.outcomes['offline'],
+            'endToEnd': summarize(run.end_to_end),
+            'recordPunch': summarize(run.record_punch),
+            'uploads': {
+                'drainSeconds': round(drain_seconds, 3),
+                'pending': pending
+            },
+            'connection': client.connection_status(),
+            'telemetry': client.telemetry.snapshot(),
+            'bytesOnDisk': directory_size(directory)
+        }
+        if standin is not None:
+            report['standin'] = standin.stats()['counters']
+        report['finishedAt'] = datetime.now().isoformat()
+        client.storage.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        if standin is not None:
+            standin.shutdown()
+            standin.server_close()
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"Wrote replay report to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+Storage engines for offline punches.
+This module defines the interface that every offline storage engine
+implements, plus the original JSON file engine.
+"""
+
+import os
+import json
+import logging
+import tempfile
+import shutil
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Unsynced punches read from storage at a time by iter_unsynced
+DEFAULT_READ_BATCH = 500
+
+# Punch ids reserved on disk per write of an id sequence file
+DEFAULT_ID_BLOCK = 1000
+
+
+def fsync_dir(path: str):
+    """fsync a directory so renames and new files inside it are durable"""
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.debug(f"Directory fsync not supported for {path}: {e}")
+
+
+def iter_events(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (byte offset, event) for each JSON event line of a file, a line at a time
+
+    A torn final line left by a crash mid-append is truncated away so the
+    next append starts on a clean line. Corrupt lines elsewhere are skipped.
+    """
+    torn_offset = None
+    with open(path, 'rb') as f:
+        offset = 0
+        index = 0
+        line = f.readline()
+        while line:
+            next_line = f.readline()
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError("incomplete line")
+                event = json.loads(line)
+            except Exception as e:
+                if not next_line:
+                    logger.warning(f"Discarding torn final line in {path}: {e}")
+                    torn_offset = offset
+                    break
+                logger.error(f"Skipping corrupt line {index + 1} in {path}: {e}")
+            else:
+                yield offset, event
+            offset += len(line)
+            index += 1
+            line = next_line
+    if torn_offset is not None:
+        with open(path, 'r+b') as f:
+            f.truncate(torn_offset)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_events(path: str) -> List[Dict[str, Any]]:
+    """Read a file of JSON event lines, see iter_events"""
+    return [event for _, event in iter_events(path)]
+
+
+def write_json_atomic(path: str, data: Any, durable: bool = True, **dump_kwargs):
+    """Write JSON to path through a temp file and an atomic rename
+
+    The temp file is fsynced first unless durable is False, for files that
+    are rebuilt when lost.
+    """
+    temp_fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.',
+        prefix='punches_',
+        suffix='.tmp'
+    )
+    try:
+        with os.fdopen(temp_fd, 'w') as f:
+            json.dump(data, f, **dump_kwargs)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def punch_matches(punch: Dict[str, Any], start: Optional[str] = None,
+                  end: Optional[str] = None, synced: Optional[bool] = None) -> bool:
+    """Check a punch against iter_punches filters, see PunchStore.iter_punches"""
+    if start is not None and punch['punchTime'] < start:
+        return False
+    if end is not None and punch['punchTime'] >= end:
+        return False
+    return synced is None or punch.get('synced', False) == synced
+
+
+class IdSequence:
+    """Persisted monotonic punch id allocator
+
+    Ids are handed out from blocks reserved in the sequence file ahead of
+    use, so allocating is a counter bump and the file is only rewritten
+    once per block. After a restart allocation resumes past the last
+    reserved block: ids may skip but never repeat, whatever was deleted
+    by cleanup or compaction in between.
+    """
+
+    def __init__(self, path: str, floor: int = 0, block_size: int = DEFAULT_ID_BLOCK):
+        """
+        Args:
+            path: Sequence file
+            floor: Highest id already in use by the store's data
+            block_size: Ids reserved per write of the sequence file
+        """
+        self.path = path
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        reserved = 0
+        try:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    reserved = json.load(f).get('reserved', 0)
+        except Exception as e:
+            # Falling back to the data's highest id is still monotonic
+            logger.warning(f"Id sequence {path} unreadable, continuing after id {floor}: {e}")
+        self._reserved = max(reserved, floor)
+        self._next = self._reserved + 1
+
+    def allocate(self) -> int:
+        """Next unused punch id"""
+        with self._lock:
+            if self._next > self._reserved:
+                reserved = self._next + self.block_size - 1
+                write_json_atomic(self.path, {'reserved': reserved})
+                self._reserved = reserved
+            punch_id = self._next
+            self._next += 1
+            return punch_id
+
+    @property
+    def last(self) -> int:
+        """Highest id allocated so far, or reserved before a restart"""
+        return self._next - 1
+
+
+class PunchStore:
+    """Interface implemented by the offline punch storage engines"""
+
+    # Engine name as used by the storage.engine setting
+    name = 'base'
+
+    def __init__(self, path: str, options: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            path: Path of the engine's main data file
+            options: The storage settings section, for engine-specific tuning
+        """
+        self.path = path
+        self.options = options or {}
+
+    def commit(self, ops: List[Tuple]) -> List[Any]:
+        """Apply a batch of write operations as one durable commit
+
+        Args:
+            ops: Operations in order, each one of
+                 ('store', punch)              - insert a punch, assigning its id
+                 ('synced', punch_id, synced_at) - mark a punch as synced
+                 ('delete', punch_ids)          - remove punches
+        Returns:
+            One result per operation: the stored record for 'store',
+            False for 'synced' if the id is unknown, else True, and the
+            number of removed punches for 'delete'
+        """
+        raise NotImplementedError
+
+    def insert_punch(self, punch: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist a new punch record, assigning its id. Returns the stored record"""
+        return self.commit([('store', punch)])[0]
+
+    def import_punches(self, punches: Iterable[Dict[str, Any]],
+                       source: Optional[str] = None) -> int:
+        """Bulk-insert existing punch records (ids are reassigned). Returns the count
+
+        Args:
+            punches: Punch records to copy into this store
+            source: Optional path the records came from, used by engines
+                    that can remember an import and refuse to repeat it
+        """
+        count = 0
+        for punch in punches:
+            self.insert_punch(dict(punch))
+            count += 1
+        return count
+
+    def get_unsynced(self) -> List[Dict[str, Any]]:
+        """Get all unsynced punch records"""
+        raise NotImplementedError
+
+    def iter_unsynced(self, after: Optional[Tuple[str, int]] = None,
+                      batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        """Yield unsynced punches lazily in sync order, by (punchTime, id)
+
+        Reads one page of batch_size punches at a time, so memory does not
+        grow with the backlog. Punches synced or deleted while iterating may
+        still be yielded if their page was already read.
+
+        Args:
+            after: Only yield punches whose (punchTime, id) sorts after this key
+            batch_size: Punches read from storage at a time
+        """
+        while True:
+            page = self.unsynced_page(after, batch_size)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after = (page[-1]['punchTime'], page[-1]['id'])
+
+    def iter_punches(self, start: Optional[str] = None, end: Optional[str] = None,
+                     synced: Optional[bool] = None,
+                     batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        """Yield stored punches matching the filters, reading batch_size at a time
+
+        Args:
+            start: Only punches with punchTime at or after this ISO timestamp
+            end: Only punches with punchTime before this ISO timestamp
+            synced: Only synced (True) or unsynced (False) punches, None for both
+            batch_size: Punches read from storage at a time
+        """
+        raise NotImplementedError
+
+    def unsynced_page(self, after: Optional[Tuple[str, int]], limit: int) -> List[Dict[str, Any]]:
+        """Up to limit unsynced punches sorting after the given key, in sync order"""
+        punches = sorted(self.get_unsynced(), key=lambda p: (p['punchTime'], p['id']))
+        if after is not None:
+            punches = [p for p in punches if (p['punchTime'], p['id']) > tuple(after)]
+        return punches[:limit]
+
+    def oldest(self, synced: bool, limit: int) -> List[Dict[str, Any]]:
+        """Get up to limit of the oldest records (by createdAt) with the given synced state"""
+        raise NotImplementedError
+
+    def delete_created_before(self, cutoff: datetime) -> int:
+        """Delete records whose createdAt day is on or before the cutoff day"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Total number of stored records"""
+        raise NotImplementedError
+
+    def size_bytes(self) -> int:
+        """Bytes the store takes up on disk"""
+        return sum(os.path.getsize(p) for p in self.data_files() if os.path.exists(p))
+
+    def data_files(self) -> List[str]:
+        """Files holding the store's data"""
+        return [self.path]
+
+    def close(self):
+        """Release any open handles"""
+        pass
+
+
+class JsonPunchStore(PunchStore):
+    """Original engine: the whole punch list as one JSON array, rewritten on every change"""
+
+    name = 'json'
+
+    def __init__(self, path: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(path, options)
+        punches = self._load_punches()
+        self._ids = IdSequence(
+            os.path.splitext(path)[0] + '.seq',
+            floor=max((p.get('id', 0) for p in punches), default=0)
+        )
+        self._renumber_duplicates(punches)
+
+    def _renumber_duplicates(self, punches: List[Dict[str, Any]]):
+        """Give fresh ids to records sharing an id, left by the old len+1 numbering"""
+        seen = set()
+        renumbered = 0
+        for punch in punches:
+            if punch.get('id') is None or punch['id'] in seen:
+                punch['id'] = self._ids.allocate()
+                renumbered += 1
+            seen.add(punch['id'])
+        if renumbered:
+            self._save_punches(punches)
+            logger.warning(f"Renumbered {renumbered} punches with duplicate ids")
+
+    def _load_punches(self) -> List[Dict[str, Any]]:
+        """Load punches from the JSON file"""
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except ValueError as e:
+            # Never hand back an empty list for a damaged file: the next save
+            # would overwrite the backlog. Keep what can be salvaged instead.
+            logger.error(f"Failed to load punches, salvaging damaged file: {e}")
+            from storage_recovery import salvage_json_file
+            punches = salvage_json_file(self.path)
+            # Replace the damaged file, so later loads and saves start from the salvaged backlog
+            write_json_atomic(self.path, punches, indent=2)
+            return punches
+
+    def _save_punches(self, punches: List[Dict[str, Any]]):
+        """Save punches to the JSON file using atomic write"""
+        try:
+            # Create a temporary file in the same directory
+            temp_fd, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path),
+                prefix='punches_',
+                suffix='.tmp'
+            )
+
+            try:
+                with os.fdopen(temp_fd, 'w') as f:
+                    json.dump(punches, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())  # Ensure data is written to disk
+
+                # Atomic rename
+                shutil.move(temp_path, self.path)
+
+            except Exception:
+                # Clean up the temp file if something went wrong
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+
+        except Exception as e:
+            logger.error(f"Failed to save punches: {e}")
+            raise
+
+    def commit(self, ops: List[Tuple]) -> List[Any]:
+        punches = self._load_punches()
+        by_id = {p['id']: p for p in punches}
+        results = []
+        for op in ops:
+            if op[0] == 'store':
+                punch = op[1]
+                punch['id'] = self._ids.allocate()
+                punches.append(punch)
+                by_id[punch['id']] = punch
+                results.append(punch)
+            elif op[0] == 'synced':
+                punch = by_id.get(op[1])
+                if punch is not None:
+                    punch['synced'] = True
+                    punch['syncedAt'] = op[2]
+                results.append(punch is not None)
+            elif op[0] == 'delete':
+                doomed = set(op[1])
+                before = len(punches)
+                punches = [p for p in punches if p['id'] not in doomed]
+                for punch_id in doomed:
+                    by_id.pop(punch_id, None)
+                results.append(before - len(punches))
+            else:
+                raise ValueError(f"Unknown storage operation '{op[0]}'")
+        self._save_punches(punches)
+        return results
+
+    def import_punches(self, punches: Iterable[Dict[str, Any]],
+                       source: Optional[str] = None) -> int:
+        existing = self._load_punches()
+        count = 0
+        for punch in punches:
+            punch = dict(punch)
+            punch['id'] = self._ids.allocate()
+            existing.append(punch)
+            count += 1
+        if count:
+            self._save_punches(existing)
+        return count
+
+    def get_unsynced(self) -> List[Dict[str, Any]]:
+        return [p for p in self._load_punches() if not p.get('synced', False)]
+
+    def iter_punches(self, start: Optional[str] = None, end: Optional[str] = None,
+                     synced: Optional[bool] = None,
+                     batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        matching = [p for p in self._load_punches() if punch_matches(p, start, end, synced)]
+        matching.sort(key=lambda p: (p['punchTime'], p['id']))
+        yield from matching
+
+    def iter_unsynced(self, after: Optional[Tuple[str, int]] = None,
+                      batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        # The whole file is parsed on every read anyway, so read it once
+        # rather than once per page
+        yield from self.unsynced_page(after, len(self._load_punches()))
+
+    def oldest(self, synced: bool, limit: int) -> List[Dict[str, Any]]:
+        matching = [p for p in self._load_punches() if p.get('synced', False) == synced]
+        matching.sort(key=lambda p: (p['createdAt'], p['id']))
+        return matching[:limit]
+
+    def delete_created_before(self, cutoff: datetime) -> int:
+        punches = self._load_punches()
+
+        # Filter out old records
+        new_punches = [
+            p for p in punches
+            if datetime.fromisoformat(p['createdAt']).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            ) > cutoff
+        ]
+
+        deleted_count = len(punches) - len(new_punches)
+
+        if deleted_count > 0:
+            self._save_punches(new_punches)
+
+        return deleted_count
+
+    def count(self) -> int:
+        return len(self._load_punches())
@@ -0,0 +1,396 @@
+"""
+Daily segment storage engine for offline punches.
+Punches are appended to one segment file per createdAt day, and a small
+manifest keeps summary counters for every segment. Retention cleanup
+deletes whole segment files, and reading unsynced punches only opens the
+segments whose counters say they still hold unsynced rows.
+"""
+
+import os
+import json
+import bisect
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+from punch_store import (
+    PunchStore, IdSequence, DEFAULT_READ_BATCH, fsync_dir, punch_matches, read_events, write_json_atomic
+)
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.jsonl'
+MANIFEST_NAME = 'manifest.json'
+
+# Segments kept parsed while iterating unsynced punches
+SEGMENT_CACHE_SIZE = 2
+
+
+class SegmentPunchStore(PunchStore):
+    """Offline punches in per-day append-only segment files
+
+    Layout, in a directory next to the configured database path:
+        <base>.segments/YYYY-MM-DD.jsonl - 'stored' and 'synced' events for
+                                           punches created on that day
+        <base>.segments/manifest.json    - lastId plus per-segment counters
+                                           (total, unsynced, firstId, lastId, bytes)
+
+    The manifest is replaced after every commit but not fsynced: segments
+    are the source of truth, and any segment whose size differs from the
+    manifest on startup is rescanned to rebuild its counters.
+    """
+
+    name = 'segments'
+
+    def __init__(self, path: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(path, options)
+        self.segment_dir = os.path.splitext(path)[0] + '.segments'
+        self.manifest_file = os.path.join(self.segment_dir, MANIFEST_NAME)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._segments: Dict[str, Dict[str, int]] = {}
+        self._last_id = 0
+        # Ids of unsynced punches mapped to their segment day and punch time
+        self._unsynced: Dict[int, str] = {}
+        self._unsynced_times: Dict[int, str] = {}
+        # Segment days sorted by first id, with those ids, for finding synced punches
+        self._day_index: Optional[Tuple[List[str], List[int]]] = None
+        self._load_manifest()
+        # Ids keep growing even when the manifest is lost and the newest
+        # segments were removed by cleanup
+        self._ids = IdSequence(os.path.join(self.segment_dir, 'sequence.json'), floor=self._last_id)
+
+    def _segment_path(self, day: str) -> str:
+        return os.path.join(self.segment_dir, day + SEGMENT_SUFFIX)
+
+    def _load_manifest(self):
+        """Load segment counters, rescanning segments the manifest doesn't match"""
+        manifest = {}
+        try:
+            if os.path.exists(self.manifest_file):
+                with open(self.manifest_file, 'r') as f:
+                    manifest = json.load(f)
+        except Exception as e:
+            logger.warning(f"Segment manifest unreadable, rescanning all segments: {e}")
+            manifest = {}
+        known = manifest.get('segments', {})
+        self._last_id = manifest.get('lastId', 0)
+
+        rescanned = 0
+        for name in sorted(os.listdir(self.segment_dir)):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            day = name[:-len(SEGMENT_SUFFIX)]
+            size = os.path.getsize(self._segment_path(day))
+            summary = known.get(day)
+            if summary is None or summary.get('bytes') != size:
+                summary = self._scan_segment(day)
+                rescanned += 1
+            self._segments[day] = summary
+            self._last_id = max(self._last_id, summary['lastId'])
+
+        # Only segments holding unsynced rows are read to index them
+        for day, summary in self._segments.items():
+            if summary['unsynced'] > 0:
+                for punch in self._read_segment(day).values():
+                    if not punch.get('synced', False):
+                        self._unsynced[punch['id']] = day
+                        self._unsynced_times[punch['id']] = punch['punchTime']
+        if rescanned:
+            logger.info(f"Rebuilt counters for {rescanned} punch segments")
+            self._write_manifest()
+
+    def _read_segment(self, day: str) -> Dict[int, Dict[str, Any]]:
+        """Replay a segment file into its punch records"""
+        punches: Dict[int, Dict[str, Any]] = {}
+        path = self._segment_path(day)
+        if not os.path.exists(path):
+            return punches
+        for event in read_events(path):
+            if event.get('op') == 'stored':
+                punch = event['punch']
+                punches[punch['id']] = punch
+            elif event.get('op') == 'synced' and event.get('id') in punches:
+                punch = punches[event['id']]
+                punch['synced'] = True
+                punch['syncedAt'] = event['syncedAt']
+            elif event.get('op') == 'deleted':
+                for punch_id in event['ids']:
+                    punches.pop(punch_id, None)
+        return punches
+
+    def _scan_segment(self, day: str) -> Dict[str, int]:
+        """Compute the summary counters of a segment from its contents"""
+        punches = self._read_segment(day)
+        ids = sorted(punches)
+        return {
+            'total': len(punches),
+            'unsynced': sum(1 for p in punches.values() if not p.get('synced', False)),
+            'firstId': ids[0] if ids else 0,
+            'lastId': ids[-1] if ids else 0,
+            'bytes': os.path.getsize(self._segment_path(day))
+        }
+
+    def _write_manifest(self):
+        try:
+            write_json_atomic(self.manifest_file, {
+                'lastId': self._last_id,
+                'segments': self._segments
+            }, durable=False, separators=(',', ':'))
+        except Exception as e:
+            # Not fatal: counters are rebuilt from the segments on next start
+            logger.warning(f"Failed to write segment manifest: {e}")
+
+    def _segments_for_id(self, punch_id: int) -> List[str]:
+        """Segments whose id range covers a punch id
+
+        Ids usually grow with the segment day, but imports and clock changes
+        store new ids in older days, so ranges can overlap and more than one
+        segment may need reading.
+        """
+        day = self._unsynced.get(punch_id)
+        if day is not None:
+            return [day]
+        if self._day_index is None:
+            ranges = sorted((summary['firstId'], day) for day, summary in self._segments.items())
+            self._day_index = ([d for _, d in ranges], [first for first, _ in ranges])
+        days, first_ids = self._day_index
+        end = bisect.bisect_right(first_ids, punch_id)
+        return [d for d in days[:end] if self._segments[d]['lastId'] >= punch_id]
+
+    def commit(self, ops: List[Tuple]) -> List[Any]:
+        with self._lock:
+            lines: Dict[str, List[str]] = {}
+            stored: List[Tuple[str, int, str]] = []
+            synced: List[Tuple[str, int]] = []
+            results = []
+            batch_unsynced: Dict[int, str] = {}
+            synced_ids = set()
+            deleted: List[Tuple[str, List[Tuple[int, bool]]]] = []
+            for op in ops:
+                if op[0] == 'store':
+                    punch = op[1]
+                    next_id = self._ids.allocate()
+                    punch['id'] = next_id
+                    day = punch['createdAt'][:10]
+                    lines.setdefault(day, []).append(json.dumps(
+                        {'op': 'stored', 'punch': punch}, separators=(',', ':')))
+                    stored.append((day, next_id, punch['punchTime']))
+                    batch_unsynced[next_id] = day
+                    results.append(punch)
+                elif op[0] == 'synced':
+                    punch_id = op[1]
+                    day = batch_unsynced.pop(punch_id, None)
+                    if day is None and punch_id not in synced_ids:
+                        day = self._unsynced.get(punch_id)
+                    if day is not None:
+                        synced_ids.add(punch_id)
+                        lines.setdefault(day, []).append(json.dumps(
+                            {'op': 'synced', 'id': punch_id, 'syncedAt': op[2]},
+                            separators=(',', ':')))
+                        synced.append((day, punch_id))
+                        results.append(True)
+                    else:
+                        # Already synced punches are still found, unknown and deleted
+                        # ids are not; the id ranges only say where to look
+                        results.append(any(punch_id in self._read_segment(day)
+                                           for day in self._segments_for_id(punch_id)))
+                elif op[0] == 'delete':
+                    # Deletes are rare (capacity spills), so read the segments
+                    # involved to learn which ids still exist and their state
+                    by_day: Dict[str, List[int]] = {}
+                    for punch_id in op[1]:
+                        for day in self._segments_for_id(punch_id):
+                            by_day.setdefault(day, []).append(punch_id)
+                    removed = 0
+                    for day, ids in by_day.items():
+                        existing = self._read_segment(day)
+                        present = [i for i in ids if i in existing]
+                        if not present:
+                            continue
+                        lines.setdefault(day, []).append(json.dumps(
+                            {'op': 'deleted', 'ids': present}, separators=(',', ':')))
+                        deleted.append((day, [
+                            (i, existing[i].get('synced', False)) for i in present
+                        ]))
+                        removed += len(present)
+                    results.append(removed)
+                else:
+                    raise ValueError(f"Unknown storage operation '{op[0]}'")
+
+            if not lines:
+                return results
+
+            # Make the events durable before updating any counters
+            new_segment = False
+            for day, day_lines in lines.items():
+                path = self._segment_path(day)
+                new_segment = new_segment or not os.path.exists(path)
+                with open(path, 'a') as f:
+                    f.write('\n'.join(day_lines) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            if new_segment:
+                fsync_dir(self.segment_dir)
+
+            for day, punch_id, punch_time in stored:
+                summary = self._segments.setdefault(
+                    day, {'total': 0, 'unsynced': 0, 'firstId': punch_id, 'lastId': punch_id, 'bytes': 0})
+                summary['total'] += 1
+                summary['unsynced'] += 1
+                summary['lastId'] = max(summary['lastId'], punch_id)
+                self._unsynced[punch_id] = day
+                self._unsynced_times[punch_id] = punch_time
+            for day, punch_id in synced:
+                self._segments[day]['unsynced'] -= 1
+                self._unsynced.pop(punch_id, None)
+                self._unsynced_times.pop(punch_id, None)
+            for day, removed in deleted:
+                summary = self._segments[day]
+                for punch_id, was_synced in removed:
+                    summary['total'] -= 1
+                    if not was_synced and self._unsynced.pop(punch_id, None) is not None:
+                        self._unsynced_times.pop(punch_id, None)
+                        summary['unsynced'] -= 1
+            for day in lines:
+                if self._segments[day]['total'] <= 0:
+                    # Everything in this segment was removed
+                    os.unlink(self._segment_path(day))
+                    del self._segments[day]
+                    continue
+                self._segments[day]['bytes'] = os.path.getsize(self._segment_path(day))
+            if stored:
+                self._last_id = max(self._last_id, stored[-1][1])
+            if new_segment or deleted:
+                self._day_index = None
+            self._write_manifest()
+        return results
+
+    def import_punches(self, punches, source: Optional[str] = None) -> int:
+        # Import in creation order so ids mostly grow with the segment day
+        originals = sorted(punches, key=lambda p: p['createdAt'])
+        records = []
+        for original in originals:
+            punch = dict(original)
+            punch.pop('id', None)
+            punch.pop('syncedAt', None)
+            punch['synced'] = False
+            records.append(punch)
+        # Everything is stored unsynced first, then the synced ones are marked,
+        # so the segment counters come out right
+        results = self.commit([('store', punch) for punch in records])
+        synced_ops = [
+            ('synced', stored['id'], original.get('syncedAt') or datetime.now().isoformat())
+            for stored, original in zip(results, originals) if original.get('synced', False)
+        ]
+        if synced_ops:
+            self.commit(synced_ops)
+        return len(records)
+
+    def get_unsynced(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            days = sorted(day for day, summary in self._segments.items() if summary['unsynced'] > 0)
+            unsynced = []
+            for day in days:
+                unsynced.extend(
+                    p for p in self._read_segment(day).values() if not p.get('synced', False)
+                )
+        return unsynced
+
+    def iter_punches(self, start: Optional[str] = None, end: Optional[str] = None,
+                     synced: Optional[bool] = None,
+                     batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        # One segment is parsed at a time. A punch is stored at or after its
+        # punch time, so segments from before the start day can't match
+        with self._lock:
+            days = sorted(self._segments)
+        for day in days:
+            if start is not None and day < start[:10]:
+                continue
+            with self._lock:
+                summary = self._segments.get(day)
+                if summary is None:
+                    continue
+                if synced is True and summary['total'] == summary['unsynced']:
+                    continue
+                if synced is False and summary['unsynced'] == 0:
+                    continue
+                matching = [p for p in self._read_segment(day).values()
+                            if punch_matches(p, start, end, synced)]
+            matching.sort(key=lambda p: (p['punchTime'], p['id']))
+            yield from matching
+
+    def iter_unsynced(self, after: Optional[Tuple[str, int]] = None,
+                      batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        # Sort the in-memory keys, then read records a batch at a time from
+        # their segments, keeping only the last couple of segments parsed
+        with self._lock:
+            keys = sorted((t, i) for i, t in self._unsynced_times.items())
+        if after is not None:
+            keys = keys[bisect.bisect_right(keys, tuple(after)):]
+        cache: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        for start in range(0, len(keys), batch_size):
+            batch = []
+            with self._lock:
+                for _, punch_id in keys[start:start + batch_size]:
+                    day = self._unsynced.get(punch_id)
+                    if day is None:
+                        # Synced or deleted since the keys were taken
+                        continue
+                    if day not in cache:
+                        if len(cache) >= SEGMENT_CACHE_SIZE:
+                            cache.pop(next(iter(cache)))
+                        cache[day] = self._read_segment(day)
+                    punch = cache[day].get(punch_id)
+                    if punch is not None:
+                        batch.append(dict(punch))
+            yield from batch
+
+    def oldest(self, synced: bool, limit: int) -> List[Dict[str, Any]]:
+        found: List[Dict[str, Any]] = []
+        with self._lock:
+            for day in sorted(self._segments):
+                summary = self._segments[day]
+                matching_count = summary['total'] - summary['unsynced'] if synced else summary['unsynced']
+                if matching_count <= 0:
+                    continue
+                matching = [
+                    p for p in self._read_segment(day).values()
+                    if p.get('synced', False) == synced
+                ]
+                matching.sort(key=lambda p: (p['createdAt'], p['id']))
+                found.extend(matching[:limit - len(found)])
+                if len(found) >= limit:
+                    break
+        return found
+
+    def delete_created_before(self, cutoff: datetime) -> int:
+        cutoff_day = cutoff.strftime('%Y-%m-%d')
+        deleted = 0
+        with self._lock:
+            for day in sorted(self._segments):
+                if day > cutoff_day:
+                    break
+                try:
+                    os.unlink(self._segment_path(day))
+                except FileNotFoundError:
+                    pass
+                deleted += self._segments.pop(day)['total']
+                self._day_index = None
+                self._unsynced = {i: d for i, d in self._unsynced.items() if d != day}
+                self._unsynced_times = {i: t for i, t in self._unsynced_times.items()
+                                        if i in self._unsynced}
+                logger.debug(f"Deleted expired punch segment {day}")
+            if deleted:
+                self._write_manifest()
+        return deleted
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(summary['total'] for summary in self._segments.values())
+
+    def size_bytes(self) -> int:
+        # Segment sizes are kept in the manifest counters
+        with self._lock:
+            return sum(summary['bytes'] for summary in self._segments.values())
@@ -1,31 +1,83 @@
 import os
 import json
 import logging
+import threading
+from concurrent.futures import TimeoutError as CallTimeout
 from datetime import datetime
 from typing import Optional, Dict, Any
 import zeep
 from zeep import Client, Transport, xsd
 from zeep.exceptions import Fault, TransportError
 from requests.exceptions import RequestException
-from offline_storage import OfflineStorage
+from offline_storage import OfflineStorage, sync_key
+from soap_transport import ConnectionPool, DEFAULT_POOL_SIZE
+from wsdl_cache import WsdlCache
+from circuit_breaker import CircuitBreaker
+from soap_executor import CallExecutor, CallRejected, DEFAULT_WORKERS
+from soap_fastpath import create_fast_path
+from telemetry import Telemetry
 
 logger = logging.getLogger(__name__)
 
+# Punches marked synced per checkpoint while draining the offline backlog
+DEFAULT_SYNC_BATCH_SIZE = 25
+
+# Queued image upload retries: first delay, longest delay and attempts
+# rejected by a reachable server before the photo is given up on
+DEFAULT_UPLOAD_RETRY_BASE = 10.0
+DEFAULT_UPLOAD_RETRY_MAX = 3600.0
+DEFAULT_UPLOAD_MAX_ATTEMPTS = 20
+
+# Cached service definitions older than this are revalidated when the service is reachable
+DEFAULT_WSDL_MAX_AGE_HOURS = 24
+
 class SoapClient:
     def __init__(self, settings_path: str = 'settings.json'):
         self.settings = self._load_settings(settings_path)
         self.storage = OfflineStorage(settings_path)
+        # Latency histograms and connection counters, see telemetry
+        self.telemetry = Telemetry()
+        # One pooled HTTP session for the client's lifetime, reused by every reconnect
+        self.http = ConnectionPool(self.settings['soap'].get('poolSize', DEFAULT_POOL_SIZE))
+        self.http.stats.on_connect = self.telemetry.record_connect
+        self.wsdl_cache = WsdlCache(self._wsdl_cache_path())
+        self.transport = self._create_transport()
+        # Every SOAP operation runs on this bounded pool with a deadline
+        self.calls = CallExecutor(self.settings['soap'].get('workers', DEFAULT_WORKERS))
+        # Gates reconnect attempts while the server is failing
+        self.breaker = CircuitBreaker(
+            failure_threshold=self.settings['soap'].get('breakerThreshold', 3),
+            base_delay=self.settings['soap'].get('backoffBase', 5.0),
+            max_delay=self.settings['soap'].get('backoffMax', 300.0)
+        )
         self.checkin_client = None
         self.summary_client = None
         self.credentials = None
+        # Templated RecordSwipeSummary calls, see soap_fastpath
+        self.fast_path = None
+        self._reconnect_thread = None
+        self._reconnect_lock = threading.Lock()
+        # Clients built from definitions confirmed current with the server
+        self._clients_verified = False
+        # Response validators of the service definition, seen by the first probe after a build
+        self._definition_validators = None
         self._is_online = False
         self._connection_error = None
+        # Queued photo uploads run on their own worker, see queue_image_upload
+        self._upload_wakeup = threading.Event()
+        self._upload_retries: Dict[str, tuple] = {}
+        self._upload_thread = threading.Thread(
+            target=self._run_upload_worker, name='image-upload', daemon=True
+        )
         # Try initial setup but don't block on failure
         try:
-            self.setup_client()
+            if not self.setup_client():
+                self.breaker.record_failure(self._connection_error)
         except Exception as e:
             logger.warning(f"Initial connection failed, starting in offline mode: {e}")
             self._connection_error = str(e)
+            self.breaker.record_failure(self._connection_error)
+        self._upload_thread.start()
         
     def _load_settings(self, settings_path: str) -> Dict[str, Any]:
         try:
@@ -35,32 +87,50 @@ class SoapClient:
             logger.error(f"Failed to load settings: {e}")
             raise
 
-    def setup_client(self) -> bool:
+    def setup_client(self, refresh: bool = False) -> bool:
         """Initialize SOAP clients for both services
+
+        With both service definitions cached, the clients are built from the
+        cache and a probe checks connectivity; the definitions are only
+        revalidated when old, when the probe suggests they changed, or when
+        refresh is set.
         Returns:
             bool: True if connection successful, False otherwise
         """
         try:
-            # Base transport settings with optimized configuration
-            from requests import Session
-            session = Session()
-            
-            # Configure session for better performance
-            session.headers = {
-                'Connection': 'keep-alive',  # Use persistent connections
-                'Accept-Encoding': 'gzip, deflate',  # Enable compression
-                'Cache-Control': 'no-cache'  # Avoid caching issues
-            }
-            
-            # Set timeouts more aggressively
-            timeout = min(self.settings['soap']['timeout'], 10)  # Max 10 seconds
-            transport = Transport(timeout=timeout, session=session)
-            
-            # Log transport settings
-            logger.debug(f"SOAP transport configured with timeout={timeout}s and keep-alive connections")
+            # The transport and its connection pool outlive this rebuild
+            transport = self.transport
+            self._clients_verified = False
+            self._definition_validators = None
             
             # Initialize clients with optimized settings
-            base_url = f"{self.settings['soap']['endpoint']}Services"
+            checkin_url, summary_url = self._wsdl_urls()
+            
+            # The clients below are built from the cached service definitions
+            unreachable = None
+            validators = None
+            max_age = self.settings['soap'].get('wsdlMaxAgeHours', DEFAULT_WSDL_MAX_AGE_HOURS) * 3600
+            ages = [self.wsdl_cache.age(url) for url in (checkin_url, summary_url)]
+            if None in ages:
+                # Nothing to fall back on: download, and fail if the service is down
+                for url in (checkin_url, summary_url):
+                    self.wsdl_cache.refresh(self.http.session, url, transport.load_timeout)
+            else:
+                # A short probe rather than a full download decides whether we're online
+                validators = self.probe()
+                if validators is None:
+                    unreachable = self._connection_error
+                    logger.warning(f"SOAP service unreachable, building clients from cached definitions: {unreachable}")
+                else:
+                    cached_length = len(self.wsdl_cache.get(summary_url))
+                    if (refresh or max(ages) > max_age
+                            or validators['Content-Length'] not in (None, str(cached_length))):
+                        try:
+                            for url in (checkin_url, summary_url):
+                                self.wsdl_cache.refresh(self.http.session, url, transport.load_timeout)
+                        except RequestException as e:
+                            unreachable = str(e)
+                            logger.warning(f"Service definition refresh failed, building clients from cache: {e}")
             
             # Add performance logging
             import time
@@ -68,7 +138,7 @@ class SoapClient:
             
             # Initialize clients with simpler configuration
             self.checkin_client = Client(
-                f'{base_url}/MSIWebTraxCheckIn.asmx?WSDL',
+                checkin_url,
                 transport=transport
             )
             
@@ -76,7 +146,7 @@ class SoapClient:
             logger.debug(f"CheckIn client initialized in {checkin_time - start_time:.2f}s")
             
             self.summary_client = Client(
-                f'{base_url}/MSIWebTraxCheckInSummary.asmx?WSDL',
+                summary_url,
                 transport=transport
             )
             
@@ -102,6 +172,18 @@ class SoapClient:
                 PWD=self.settings['soap']['password']
             )
             
+            # Punches skip zeep's generic serializer where the definition allows
+            self.fast_path = None
+            if self.settings['soap'].get('fastPath', True):
+                self.fast_path = create_fast_path(
+                    self.summary_client, self.credentials, self.http.session, transport.operation_timeout
+                )
+            
+            if unreachable:
+                self._is_online = False
+                self._connection_error = unreachable
+                return False
+            
             # Test connection by checking if we can access both services
             try:
                 # Check if required operations exist in both services
@@ -111,6 +193,9 @@ class SoapClient:
                 if 'RecordSwipeSummary' in summary_ops and 'RecordSwipe' in checkin_ops:
                     self._is_online = True
                     self._connection_error = None
+                    self._clients_verified = True
+                    # Later reconnects compare their probe against this one
+                    self._definition_validators = validators
                     logger.info("Successfully connected to SOAP services")
                     return True
                 else:
@@ -133,6 +218,36 @@ class SoapClient:
             self._connection_error = str(e)
             return False
 
+    def _wsdl_urls(self) -> tuple:
+        """WSDL URLs of the CheckIn and CheckInSummary services"""
+        base_url = f"{self.settings['soap']['endpoint']}Services"
+        return (f'{base_url}/MSIWebTraxCheckIn.asmx?WSDL',
+                f'{base_url}/MSIWebTraxCheckInSummary.asmx?WSDL')
+
+    def _wsdl_cache_path(self) -> str:
+        """WSDL cache location, next to the offline database unless configured"""
+        path = self.settings['soap'].get('wsdlCachePath')
+        if not path:
+            data_dir = os.path.dirname(self.settings['storage']['dbPath'])
+            path = os.path.join(data_dir, 'wsdl_cache.db')
+        return path
+
+    def _create_transport(self) -> Transport:
+        """Create the zeep transport over the persistent connection pool"""
+        # Set timeouts more aggressively
+        timeout = min(self.settings['soap']['timeout'], 10)  # Max 10 seconds
+        # The operation timeout bounds how long an abandoned call can hold a worker
+        transport = Transport(cache=self.wsdl_cache, timeout=timeout, operation_timeout=timeout,
+                              session=self.http.session)
+        
+        # Log transport settings
+        logger.debug(f"SOAP transport configured with timeout={timeout}s and keep-alive connections")
+        return transport
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool hit/miss counters"""
+        return self.http.stats.snapshot()
+
     def is_online(self) -> bool:
         """Check if service is currently online"""
         return self._is_online
@@ -141,19 +256,128 @@ class SoapClient:
         """Get the last connection error message"""
         return self._connection_error
 
+    def connection_status(self) -> Dict[str, Any]:
+        """Online state, circuit breaker state and pool counters for display"""
+        return {
+            'online': self._is_online,
+            'error': self._connection_error,
+            'circuit': self.breaker.snapshot(),
+            'pool': self.pool_stats(),
+            'calls': self.calls.stats(),
+            'pendingUploads': self.pending_uploads()
+        }
+
+    def _mark_online(self):
+        self._is_online = True
+        self._connection_error = None
+        self.breaker.record_success()
+
+    def _mark_offline(self, error: str):
+        self._is_online = False
+        self._connection_error = error
+        self.breaker.record_failure(error)
+
+    def probe(self) -> Optional[Dict[str, Optional[str]]]:
+        """Cheap liveness check: a HEAD request for the summary service definition
+        Returns:
+            The definition's response validators, or None if the service is unreachable
+        """
+        timeout = self.settings['soap'].get('probeTimeout', 2.0)
+        try:
+            with self.telemetry.operation('probe'):
+                # Identity encoding, so Content-Length is comparable with the cached document
+                response = self.http.session.head(self._wsdl_urls()[1], timeout=timeout, allow_redirects=False,
+                                                  headers={'Accept-Encoding': 'identity'})
+        except RequestException as e:
+            self._connection_error = str(e)
+            return None
+        # Redirects and client errors (a login page, a moved or missing service) count as down too
+        if not 200 <= response.status_code < 300:
+            self._connection_error = f"SOAP service returned HTTP {response.status_code}"
+            return None
+        return {name: response.headers.get(name) for name in ('ETag', 'Last-Modified', 'Content-Length')}
+
     def try_reconnect(self) -> bool:
         """Attempt to reconnect to the service
+        
+        Once the clients are built, reconnecting is a single probe request;
+        the clients are only rebuilt when the probe shows the service
+        definition changed. While the circuit breaker is open no attempt
+        is made at all.
         Returns:
             bool: True if reconnection successful, False otherwise
         """
+        if not self.breaker.allow():
+            logger.debug(f"SOAP circuit open, next reconnect attempt in {self.breaker.retry_in():.1f}s")
+            self.telemetry.record_reconnect('circuitOpen')
+            return False
         logger.info("Attempting to reconnect to SOAP service")
-        return self.setup_client()
+        import time
+        start = time.time()
+        try:
+            if self._clients_verified:
+                validators = self.probe()
+                if validators is None:
+                    self._mark_offline(self._connection_error)
+                    self.telemetry.record_reconnect('failed', time.time() - start, self._connection_error)
+                    return False
+                if self._definition_validators is None:
+                    self._definition_validators = validators
+                if validators == self._definition_validators:
+                    self._mark_online()
+                    self.telemetry.record_reconnect('connected', time.time() - start)
+                    logger.debug(f"HTTP connection pool after reconnect: {self.pool_stats()}")
+                    return True
+                logger.info("SOAP service definition changed, rebuilding clients")
+            connected = self.setup_client(refresh=self._clients_verified)
+            if connected:
+                self.breaker.record_success()
+                self.telemetry.record_reconnect('rebuilt', time.time() - start)
+            else:
+                self.breaker.record_failure(self._connection_error)
+                self.telemetry.record_reconnect('failed', time.time() - start, self._connection_error)
+            logger.debug(f"HTTP connection pool after reconnect: {self.pool_stats()}")
+            return connected
+        except Exception as e:
+            # The breaker may have let this attempt through half-open, close the trial
+            # with a failure so the circuit opens again instead of staying half-open
+            logger.error(f"Reconnect attempt failed: {e}")
+            self._is_online = False
+            self._connection_error = str(e)
+            self.breaker.record_failure(self._connection_error)
+            self.telemetry.record_reconnect('failed', time.time() - start, self._connection_error)
+            raise
+
+    def request_reconnect(self) -> bool:
+        """Start a background reconnect attempt unless one is already running
+        Returns:
+            bool: True if an attempt was started
+        """
+        with self._reconnect_lock:
+            if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+                return False
+            # No thread is started while the circuit is open
+            if self.breaker.retry_in() > 0:
+                return False
+            self._reconnect_thread = threading.Thread(
+                target=self._background_reconnect, name='soap-reconnect', daemon=True
+            )
+            self._reconnect_thread.start()
+            return True
+
+    def _background_reconnect(self):
+        try:
+            if self.try_reconnect():
+                logger.info("Reconnected to SOAP service in the background")
+        except Exception as e:
+            logger.error(f"Background reconnect failed: {e}")
 
     # Track repeated punch attempts
     _recent_punches = {}
     
     def record_punch(self, employee_id: str, punch_time: datetime,
-                    department_override: Optional[int] = None, image_data: Optional[bytes] = None) -> Dict[str, Any]:
+                    department_override: Optional[int] = None, image_data: Optional[bytes] = None,
+                    store_offline: bool = True) -> Dict[str, Any]:
         """
         Record a punch for an employee, handling both online and offline scenarios
         
@@ -161,6 +385,10 @@ class SoapClient:
             employee_id: Employee's ID number
             punch_time: Timestamp for the punch
             department_override: Optional department code
+            image_data: JPEG photo of the punch, stored with it if the punch is stored
+                        offline and uploaded when it syncs
+            store_offline: Store the punch locally if the server can't be reached.
+                           The offline sync passes False, its punches are already stored
             
         Sends: "{employee_id}|*|{punch_time}|*|{department_override}"
         
@@ -205,98 +433,102 @@ class SoapClient:
             filename = f"{employee_id}__{punch_time.strftime('%Y%m%d_%H%M%S')}.jpg"
             logger.info(f"PUNCH SEND: {employee_id}, {punch_time.isoformat()}, {filename}")
 
-            # If we're offline, try to reconnect first
+            # If we're offline, store the punch locally right away. Reconnecting
+            # happens in the background, never while the employee waits
             if not self._is_online:
-                logger.info("Attempting to reconnect before processing punch")
-                if self.try_reconnect():
-                    logger.info("Successfully reconnected")
-                else:
-                    logger.info("Reconnection failed, storing punch locally")
-                    return self._store_offline_punch(employee_id, punch_time, image_data)
+                logger.info("Offline, storing punch locally")
+                self.request_reconnect()
+                return self._offline_fallback(employee_id, punch_time, image_data, store_offline, 'offline')
 
             # If we're still missing clients after reconnect attempt, store offline
             if not self.summary_client or not self.credentials:
                 logger.info("Missing SOAP clients, storing punch locally")
-                return self._store_offline_punch(employee_id, punch_time, image_data)
+                return self._offline_fallback(employee_id, punch_time, image_data, store_offline, 'noClient')
 
             # Try online punch with timeout protection and performance tracking
             try:
                 # Create the request with proper header
-                import threading
                 import time
                 
-                response_container = [None]
-                exception_container = [None]
                 timing_data = {'start': 0, 'end': 0, 'soap_start': 0, 'soap_end': 0}
+                operation = 'RecordSwipeSummaryDepartmentOverride' if department_override else 'RecordSwipeSummary'
                 
                 # Record start time
                 timing_data['start'] = time.time()
                 
                 def soap_call():
+                    # Pre-warm DNS and connection
+                    try:
+                        import socket
+                        dns_start = time.time()
+                        from urllib.parse import urlsplit
+                        endpoint = urlsplit(self.settings['soap']['endpoint']).hostname
+                        socket.gethostbyname(endpoint)
+                        logger.debug(f"DNS lookup for {endpoint} completed")
+                        self.telemetry.record(operation, 'dns', time.time() - dns_start)
+                    except Exception as e:
+                        logger.debug(f"DNS pre-warm failed: {e}")
+
+                    # Record SOAP call start time
+                    timing_data['soap_start'] = time.time()
                     try:
-                        # Record SOAP call start time
-                        timing_data['soap_start'] = time.time()
-                        
-                        # Pre-warm DNS and connection
-                        try:
-                            import socket
-                            endpoint = self.settings['soap']['endpoint'].replace('https://', '').replace('http://', '').split('/')[0]
-                            socket.gethostbyname(endpoint)
-                            logger.debug(f"DNS lookup for {endpoint} completed")
-                        except Exception as e:
-                            logger.debug(f"DNS pre-warm failed: {e}")
-                        
                         # Make the actual SOAP call
-                        if department_override:
-                            response_container[0] = self.summary_client.service.RecordSwipeSummaryDepartmentOverride(
-                                _soapheaders=[self.credentials],
-                                swipeInput=swipe_input
-                            )
-                        else:
-                            response_container[0] = self.summary_client.service.RecordSwipeSummary(
-                                _soapheaders=[self.credentials],
-                                swipeInput=swipe_input
-                            )
-                        
+                        with self.telemetry.operation(operation):
+                            return send()
+                    finally:
                         # Record SOAP call end time
                         timing_data['soap_end'] = time.time()
-                    except Exception as e:
-                        timing_data['soap_end'] = time.time()
-                        exception_container[0] = e
-                
-                # Run SOAP call in a thread with a timeout
-                soap_thread = threading.Thread(target=soap_call)
-                soap_thread.daemon = True
-                soap_thread.start()
+                        self.telemetry.record(operation, 'soap', timing_data['soap_end'] - timing_data['soap_start'])
+
+                def send():
+                    fast_path = self.fast_path
+                    if fast_path is not None:
+                        return fast_path.call(operation, swipe_input)
+                    if department_override:
+                        return self.summary_client.service.RecordSwipeSummaryDepartmentOverride(
+                            _soapheaders=[self.credentials],
+                            swipeInput=swipe_input
+                        )
+                    return self.summary_client.service.RecordSwipeSummary(
+                        _soapheaders=[self.credentials],
+                        swipeInput=swipe_input
+                    )
                 
+                # Run the SOAP call on the worker pool with a deadline
                 # Use a shorter timeout for better responsiveness
                 timeout = min(self.settings['soap'].get('timeout', 10.0), 8.0)  # Max 8 seconds
-                soap_thread.join(timeout=timeout)
+                try:
+                    soap_response = self.calls.call(soap_call, timeout)
+                except CallTimeout:
+                    # The call is abandoned to its worker
+                    total_time = time.time() - timing_data['start']
+                    logger.error(f"SOAP call timed out for {employee_id} after {total_time:.2f}s")
+                    self.telemetry.record(operation, 'total', total_time)
+                    self.telemetry.record_timeout(operation)
+                    self._mark_offline(f"SOAP call timed out after {total_time:.2f}s")
+                    return self._offline_fallback(employee_id, punch_time, image_data, store_offline, 'timeout')
+                except CallRejected as e:
+                    # The local pool is saturated; the server may be fine, so stay online
+                    logger.error(f"SOAP call for {employee_id} not sent: {e}")
+                    return self._offline_fallback(employee_id, punch_time, image_data, store_offline, 'rejected')
+                except Exception as e:
+                    total_time = time.time() - timing_data['start']
+                    self.telemetry.record(operation, 'total', total_time)
+                    logger.error(f"SOAP call failed for {employee_id} after {total_time:.2f}s: {e}")
+                    raise
                 
                 # Record end time
                 timing_data['end'] = time.time()
                 
                 # Calculate timing information
                 total_time = timing_data['end'] - timing_data['start']
+                self.telemetry.record(operation, 'total', total_time)
                 
-                if soap_thread.is_alive():
-                    # Thread is still running after timeout
-                    logger.error(f"SOAP call timed out for {employee_id} after {total_time:.2f}s")
-                    self._is_online = False
-                    self._connection_error = f"SOAP call timed out after {total_time:.2f}s"
-                    return self._store_offline_punch(employee_id, punch_time, image_data)
-                
-                if exception_container[0]:
-                    # Thread encountered an exception
-                    logger.error(f"SOAP call failed for {employee_id} after {total_time:.2f}s: {exception_container[0]}")
-                    raise exception_container[0]
-                
-                if response_container[0] is None:
+                if soap_response is None:
                     # No response but no exception either
                     logger.error(f"SOAP call returned no response for {employee_id} after {total_time:.2f}s")
-                    self._is_online = False
-                    self._connection_error = "SOAP call returned no response"
-                    return self._store_offline_punch(employee_id, punch_time, image_data)
+                    self._mark_offline("SOAP call returned no response")
+                    return self._offline_fallback(employee_id, punch_time, image_data, store_offline, 'noResponse')
                 
                 # Calculate SOAP call time if available
                 if timing_data['soap_start'] > 0 and timing_data['soap_end'] > 0:
@@ -306,9 +538,8 @@ class SoapClient:
                     logger.info(f"SOAP call for {employee_id} completed in {total_time:.2f}s")
                 
                 # Successful punch, we're definitely online
-                self._is_online = True
-                self._connection_error = None
-                response = self._format_response(response_container[0], True, employee_id)
+                self._mark_online()
+                response = self._format_response(soap_response, True, employee_id)
                 
                 # Store this punch attempt with its exception code (if any)
                 exception_code = response.get('exception', None)
@@ -318,9 +549,8 @@ class SoapClient:
 
             except (Fault, TransportError, RequestException) as e:
                 logger.warning(f"Online punch failed, storing offline: {e}")
-                self._is_online = False
-                self._connection_error = str(e)
-                return self._store_offline_punch(employee_id, punch_time, image_data)
+                self._mark_offline(str(e))
+                return self._offline_fallback(employee_id, punch_time, image_data, store_offline, 'error')
 
         except Exception as e:
             logger.error(f"Error recording punch: {e}")
@@ -398,57 +628,53 @@ class SoapClient:
             filename = f"{employee_id}__{punch_time.strftime('%Y%m%d_%H%M%S')}.jpg"
             client_id = str(self.settings['soap']['clientId'])
             
-            # Use threading with timeout for image upload
-            import threading
-            response_container = [None]
-            exception_container = [None]
+            # Run the upload on the worker pool with a deadline
             timing_data = {'soap_start': 0, 'soap_end': 0}
             
             def upload_call():
+                timing_data['soap_start'] = time.time()
                 try:
-                    timing_data['soap_start'] = time.time()
-                    response_container[0] = self.checkin_client.service.SaveImage(
-                        _soapheaders=[self.credentials],
-                        fileName=filename,
-                        data=image_data,
-                        dir=client_id
-                    )
-                    timing_data['soap_end'] = time.time()
-                except Exception as e:
+                    with self.telemetry.operation('SaveImage'):
+                        return self.checkin_client.service.SaveImage(
+                            _soapheaders=[self.credentials],
+                            fileName=filename,
+                            data=image_data,
+                            dir=client_id
+                        )
+                finally:
                     timing_data['soap_end'] = time.time()
-                    exception_container[0] = e
-            
-            # Run upload in a thread with a timeout
-            upload_thread = threading.Thread(target=upload_call)
-            upload_thread.daemon = True
-            upload_thread.start()
+                    self.telemetry.record('SaveImage', 'soap', timing_data['soap_end'] - timing_data['soap_start'])
             
             # Use a shorter timeout for image upload
             timeout = min(self.settings['soap'].get('timeout', 10.0), 5.0)  # Max 5 seconds for image upload
-            upload_thread.join(timeout=timeout)
-            
-            end_time = time.time()
-            total_time = end_time - start_time
-            
-            if upload_thread.is_alive():
-                # Thread is still running after timeout
+            try:
+                response = self.calls.call(upload_call, timeout)
+            except CallTimeout:
+                # The call is abandoned to its worker
+                total_time = time.time() - start_time
                 logger.error(f"Image upload timed out for {employee_id} after {total_time:.2f}s")
-                self._is_online = False
-                self._connection_error = f"Image upload timed out after {total_time:.2f}s"
+                self.telemetry.record('SaveImage', 'total', total_time)
+                self.telemetry.record_timeout('SaveImage')
+                self._mark_offline(f"Image upload timed out after {total_time:.2f}s")
                 return False
-            
-            if exception_container[0]:
-                # Thread encountered an exception
-                logger.error(f"Image upload failed for {employee_id} after {total_time:.2f}s: {exception_container[0]}")
-                self._is_online = False
-                self._connection_error = str(exception_container[0])
+            except CallRejected as e:
+                logger.error(f"Image upload for {employee_id} not sent: {e}")
+                return False
+            except Exception as e:
+                total_time = time.time() - start_time
+                self.telemetry.record('SaveImage', 'total', total_time)
+                logger.error(f"Image upload failed for {employee_id} after {total_time:.2f}s: {e}")
+                self._mark_offline(str(e))
                 return False
             
-            if response_container[0] is None:
+            end_time = time.time()
+            total_time = end_time - start_time
+            self.telemetry.record('SaveImage', 'total', total_time)
+            
+            if response is None:
                 # No response but no exception either
                 logger.error(f"Image upload returned no response for {employee_id} after {total_time:.2f}s")
-                self._is_online = False
-                self._connection_error = "Image upload returned no response"
+                self._mark_offline("Image upload returned no response")
                 return False
             
             # Calculate SOAP call time if available
@@ -459,11 +685,9 @@ class SoapClient:
                 logger.info(f"Image upload for {employee_id} completed in {total_time:.2f}s")
             
             # Successful upload means we're definitely online
-            self._is_online = True
-            self._connection_error = None
+            self._mark_online()
             
             # Check for system error codes
-            response = response_container[0]
             if hasattr(response, 'SystemErrorCode'):
                 error_code = response.SystemErrorCode
                 if error_code:
@@ -476,6 +700,97 @@ class SoapClient:
             logger.error(f"Failed to upload image: {e}")
             return False
 
+    def queue_image_upload(self, employee_id: str, image_data: bytes, punch_time: datetime):
+        """Durably queue a punch photo for upload by the background worker
+        
+        Returns as soon as the photo is on disk. The worker uploads queued
+        photos in order while online and retries failures with backoff.
+        
+        Args:
+            employee_id: Employee's ID number
+            image_data: JPEG image as bytes
+            punch_time: Timestamp for the photo
+        """
+        filename = f"{employee_id}__{punch_time.strftime('%Y%m%d_%H%M%S')}.jpg"
+        # Pinned until uploaded so the photo can't be evicted first
+        self.storage.photos.put(filename, image_data, pin=True)
+        self.storage.uploads.add(filename, employee_id, punch_time.isoformat())
+        logger.debug(f"Queued image upload: {employee_id}, {filename}")
+        self._upload_wakeup.set()
+
+    def _run_upload_worker(self):
+        """Upload queued photos, oldest first, for the life of the client"""
+        retry_base = self.settings['soap'].get('uploadRetryBase', DEFAULT_UPLOAD_RETRY_BASE)
+        retry_max = self.settings['soap'].get('uploadRetryMax', DEFAULT_UPLOAD_RETRY_MAX)
+        max_attempts = self.settings['soap'].get('uploadMaxAttempts', DEFAULT_UPLOAD_MAX_ATTEMPTS)
+        import time
+        import random
+        while True:
+            wait = 60.0
+            try:
+                if self._is_online:
+                    now = time.monotonic()
+                    for entry in self.storage.uploads.pending():
+                        name = entry['name']
+                        attempts, retry_at = self._upload_retries.get(name, (0, 0.0))
+                        if retry_at > now:
+                            wait = min(wait, retry_at - now)
+                            continue
+                        data = self.storage.photos.view(name)
+                        if data is None:
+                            logger.warning(f"Queued image {name} is no longer stored, dropping upload")
+                            self._finish_upload(name, uploaded=False)
+                            continue
+                        if self._upload_image(entry['employeeId'], bytes(data),
+                                              datetime.fromisoformat(entry['punchTime'])):
+                            self._finish_upload(name, uploaded=True)
+                            continue
+                        if not self._is_online:
+                            # Connection lost; retry once reconnected, not counted as an attempt
+                            break
+                        attempts += 1
+                        if attempts >= max_attempts:
+                            logger.error(f"Giving up on image upload {name} after {attempts} attempts")
+                            self._finish_upload(name, uploaded=False)
+                            continue
+                        delay = min(retry_max, retry_base * (2 ** (attempts - 1)))
+                        delay *= 1 - 0.5 * random.random()
+                        self._upload_retries[name] = (attempts, time.monotonic() + delay)
+                        logger.warning(f"Image upload {name} failed (attempt {attempts}), retrying in {delay:.1f}s")
+                        wait = min(wait, delay)
+                elif self.storage.uploads.count():
+                    # Recheck soon after the connection returns
+                    wait = 5.0
+            except Exception as e:
+                logger.error(f"Image upload worker error: {e}")
+            self._upload_wakeup.wait(wait)
+            self._upload_wakeup.clear()
+
+    def _finish_upload(self, name: str, uploaded: bool):
+        self.storage.uploads.remove(name, uploaded=uploaded)
+        self.storage.photos.unpin([name])
+        self._upload_retries.pop(name, None)
+
+    def pending_uploads(self) -> int:
+        """Number of photos waiting in the upload queue"""
+        return self.storage.uploads.count()
+
+    def _offline_fallback(self, employee_id: str, punch_time: datetime,
+                          image_data: Optional[bytes], store_offline: bool, reason: str) -> Dict[str, Any]:
+        """Handle a punch that couldn't be sent, storing it locally if requested
+
+        reason names why for the telemetry: offline, noClient, timeout,
+        rejected, noResponse or error.
+        """
+        self.telemetry.record_offline_fallback(reason)
+        if not store_offline:
+            return {
+                'success': False,
+                'offline': True,
+                'message': 'Service offline, punch not sent'
+            }
+        return self._store_offline_punch(employee_id, punch_time, image_data)
+
     def _store_offline_punch(self, employee_id: str, punch_time: datetime,
                            image_data: Optional[bytes] = None) -> Dict[str, Any]:
         """Store punch data locally when offline"""
@@ -484,10 +799,8 @@ class SoapClient:
             filename = None
             if image_data:
                 filename = f"{employee_id}__{punch_time.strftime('%Y%m%d_%H%M%S')}.jpg"
-                # Save image to photos directory
-                os.makedirs('photos', exist_ok=True)
-                with open(os.path.join('photos', filename), 'wb') as f:
-                    f.write(image_data)
+                # Pinned until the punch syncs so the photo can't be evicted first
+                self.storage.photos.put(filename, image_data, pin=True)
                 logger.debug(f"Storing offline punch with image: {employee_id}, filename: {filename}")
             else:
                 logger.debug(f"Storing offline punch without image: {employee_id}")
@@ -504,7 +817,14 @@ class SoapClient:
             raise
 
     def sync_offline_punches(self) -> Dict[str, Any]:
-        """Attempt to sync stored offline punches"""
+        """Attempt to sync stored offline punches
+
+        Punches are sent in punch-time order, resuming after the persisted
+        sync cursor. Successful punches are marked synced and the cursor is
+        advanced once per batch, so an interrupted drain re-sends at most one
+        batch. The cursor is cleared when a pass reaches the end of the
+        backlog, so punches that failed are retried on the next pass.
+        """
         try:
             # If we're offline, try to reconnect first
             if not self._is_online:
@@ -518,21 +838,28 @@ class SoapClient:
                         'error': self._connection_error
                     }
 
-            unsynced_punches = self.storage.get_unsynced_punches()
+            batch_size = self.settings.get('storage', {}).get('syncBatchSize', DEFAULT_SYNC_BATCH_SIZE)
+            cursor = self.storage.get_sync_cursor()
+            if cursor:
+                logger.info(f"Resuming offline sync after checkpoint {cursor}, "
+                            f"earlier punches wait for the next pass")
+
             results = {
-                'total': len(unsynced_punches),
+                'total': 0,
                 'synced': 0,
                 'failed': 0,
                 'error': None
             }
 
-            if not unsynced_punches:
-                logger.debug("No offline punches to sync")
-                return results
-            
-            for punch in unsynced_punches:
+            # Punches are read lazily, a bounded batch at a time
+            pending = self.storage.iter_unsynced_punches(after=cursor)
+            synced_ids = []
+            last_key = cursor
+            interrupted = False
+            processed = 0
+            for processed, punch in enumerate(pending, 1):
+                punch_id = punch.get('id')
                 try:
-                    punch_id = punch['id']
                     employee_id = punch['employeeId']
                     punch_datetime = datetime.fromisoformat(punch['punchTime'])
                     image_filename = punch.get('imageFilename')
@@ -540,36 +867,29 @@ class SoapClient:
                     # Attempt to sync the punch
                     response = self.record_punch(
                         employee_id=employee_id,
-                        punch_time=punch_datetime
+                        punch_time=punch_datetime,
+                        store_offline=False
                     )
                     
-                    if response.get('success') and not response.get('offline'):
-                        # If punch was successful and we have an image file, upload it
+                    if response.get('offline'):
+                        # Lost the connection, resume from this punch next time
+                        logger.warning(f"Connection lost while syncing punch {punch_id}, stopping sync")
+                        results['failed'] += 1
+                        results['error'] = self._connection_error
+                        interrupted = True
+                        break
+
+                    if response.get('success'):
+                        # Its photo goes to the upload queue, which retries until
+                        # SaveImage succeeds and only then unpins it
                         if image_filename:
-                            image_path = os.path.join('photos', image_filename)
-                            if os.path.exists(image_path):
-                                try:
-                                    with open(image_path, 'rb') as f:
-                                        image_data = f.read()
-                                    
-                                    upload_response = self.checkin_client.service.SaveImage(
-                                        _soapheaders=[self.credentials],
-                                        fileName=image_filename,
-                                        data=image_data,
-                                        dir=str(self.settings['soap']['clientId'])
-                                    )
-                                    
-                                    if upload_response:
-                                        logger.info(f"Successfully uploaded image for synced punch: {employee_id}, {image_filename}")
-                                    else:
-                                        logger.warning(f"Failed to upload image for synced punch: {employee_id}, {image_filename}")
-                                except Exception as e:
-                                    logger.error(f"Error uploading image for synced punch: {employee_id}, {image_filename}, error: {e}")
+                            if self.storage.photos.view(image_filename) is not None:
+                                self.storage.uploads.add(image_filename, employee_id, punch['punchTime'])
+                                self._upload_wakeup.set()
                             else:
                                 logger.warning(f"Image file not found for synced punch: {image_filename}")
-                        
-                        # Mark punch as synced
-                        self.storage.mark_as_synced(punch_id)
+
+                        synced_ids.append(punch_id)
                         results['synced'] += 1
                     else:
                         results['failed'] += 1
@@ -577,6 +897,18 @@ class SoapClient:
                 except Exception as e:
                     logger.error(f"Failed to sync punch {punch_id}: {e}")
                     results['failed'] += 1
+
+                last_key = sync_key(punch)
+                if processed % batch_size == 0:
+                    self._checkpoint_sync(synced_ids, last_key)
+                    synced_ids = []
+
+            results['total'] = processed
+            if not processed:
+                logger.debug("No offline punches to sync")
+
+            # A finished pass clears the cursor, an interrupted one keeps its place
+            self._checkpoint_sync(synced_ids, last_key if interrupted else None)
             
             return results
             
@@ -584,6 +916,15 @@ class SoapClient:
             logger.error(f"Failed to sync offline punches: {e}")
             raise
 
+    def _checkpoint_sync(self, synced_ids: list, cursor: Optional[tuple]):
+        """Mark a batch of sent punches as synced, then persist the sync cursor"""
+        # Marking first means a crash in between only leaves the cursor behind,
+        # never a sent punch that is still flagged unsynced past the cursor
+        self.storage.mark_many_synced(synced_ids)
+        self.storage.save_sync_cursor(cursor)
+        if synced_ids:
+            logger.debug(f"Sync checkpoint: {len(synced_ids)} punches marked synced, cursor {cursor}")
+
     def _format_response(self, soap_response: Any, online: bool = True, employee_id: Optional[str] = None) -> Dict[str, Any]:
         """Format the SOAP response into a standardized dictionary"""
         # Log the raw SOAP response at DEBUG level
@@ -0,0 +1,105 @@
+"""
+Bounded worker pool for SOAP calls.
+Calls run on a fixed set of worker threads and the caller waits on a
+future with a deadline. A call that misses its deadline is cancelled if it
+hasn't started, otherwise it is abandoned: it finishes on its worker (the
+transport's operation timeout bounds how long) and its result is dropped.
+Thread count therefore stays fixed however flaky the network is, and the
+in-flight and abandoned gauges show how busy the pool is.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError
+from typing import Dict, Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Default number of worker threads
+DEFAULT_WORKERS = 4
+
+# Calls allowed to wait for a worker, per worker, before new calls are rejected
+QUEUE_PER_WORKER = 4
+
+
+class CallRejected(RuntimeError):
+    """The pool is saturated and the call was not queued"""
+
+
+class CallExecutor:
+    """Fixed-size thread pool returning futures, with in-flight and abandoned gauges"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, name: str = 'soap'):
+        self.workers = max(1, workers)
+        self.max_pending = self.workers * (1 + QUEUE_PER_WORKER)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Abandoned calls still running on a worker
+        self._abandoned = 0
+        self._abandoned_total = 0
+        self._timeouts = 0
+        self._rejected = 0
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Queue a call. Raises CallRejected if too many calls are pending"""
+        with self._lock:
+            if self._in_flight >= self.max_pending:
+                self._rejected += 1
+                raise CallRejected(f"{self._in_flight} SOAP calls already pending")
+            self._in_flight += 1
+        future = self._executor.submit(func, *args, **kwargs)
+        future.add_done_callback(self._call_done)
+        return future
+
+    def call(self, func: Callable, timeout: float, *args, **kwargs):
+        """Run a call and wait for its result until the deadline
+
+        Returns:
+            The call's result
+        Raises:
+            concurrent.futures.TimeoutError: If the deadline passed first
+            CallRejected: If the pool is saturated
+            Any exception raised by the call
+        """
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            self.abandon(future)
+            raise
+
+    def abandon(self, future: Future):
+        """Give up on a call: cancel it if queued, else let it finish unobserved"""
+        with self._lock:
+            self._timeouts += 1
+        if future.cancel():
+            return
+        with self._lock:
+            if future.done():
+                return
+            self._abandoned += 1
+            self._abandoned_total += 1
+            future.abandoned = True
+
+    def _call_done(self, future: Future):
+        with self._lock:
+            self._in_flight -= 1
+            if getattr(future, 'abandoned', False):
+                self._abandoned -= 1
+        if getattr(future, 'abandoned', False) and not future.cancelled() and future.exception() is not None:
+            logger.debug(f"Abandoned SOAP call failed: {future.exception()}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'inFlight': self._in_flight,
+                'abandoned': self._abandoned,
+                'abandonedTotal': self._abandoned_total,
+                'timeouts': self._timeouts,
+                'rejected': self._rejected
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,199 @@
+"""
+Fast path for the RecordSwipeSummary punch operations.
+The request envelope is rendered once by zeep, with the UserCredentials
+header filled in, and kept as a byte template that only needs the swipe
+input spliced in. The reply is read with a targeted lxml iterparse using
+converters taken from the service's own schema, producing the same
+attribute structure zeep would. Anything unexpected in a reply (a fault,
+an unknown element, a bad value) hands the very same response to zeep,
+so nothing is ever sent twice.
+"""
+
+import io
+import logging
+from types import SimpleNamespace
+from typing import Dict, Any, Optional
+from xml.sax.saxutils import escape
+
+from lxml import etree
+from zeep.wsdl.bindings.soap import Soap11Binding
+from zeep.wsdl.utils import etree_to_string
+from zeep.xsd import ComplexType
+
+logger = logging.getLogger(__name__)
+
+# Operations served by the fast path
+FAST_OPERATIONS = ('RecordSwipeSummary', 'RecordSwipeSummaryDepartmentOverride')
+
+SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+# Placeholder rendered into the template where the swipe input goes
+_SWIPE_MARKER = 'SWIPE-INPUT-PLACEHOLDER-4f1d2a'
+
+
+class FastPathError(Exception):
+    """The reply can't be read by the fast path, zeep must handle it"""
+
+
+def _field_spec(xsd_type) -> Dict[str, Any]:
+    """Map of child element name to a converter or a nested spec, from a zeep complex type"""
+    if xsd_type.attributes or any(getattr(e, 'max_occurs', 1) != 1 for _, e in xsd_type.elements):
+        raise FastPathError(f"Type {xsd_type.name} has attributes or repeated elements")
+    spec = {}
+    for name, element in xsd_type.elements:
+        if isinstance(element.type, ComplexType):
+            spec[element.qname.text] = (name, _field_spec(element.type))
+        else:
+            spec[element.qname.text] = (name, element.type.pythonvalue)
+    return spec
+
+
+def _convert(node, spec: Dict[str, Any]) -> SimpleNamespace:
+    """Build a zeep-like object from an element whose children follow spec"""
+    # Absent elements are None, as zeep leaves them
+    values = {name: None for name, _ in spec.values()}
+    for child in node:
+        if not isinstance(child.tag, str):
+            continue  # Comments and processing instructions
+        field = spec.get(child.tag)
+        if field is None:
+            raise FastPathError(f"Unexpected element {child.tag}")
+        name, converter = field
+        if isinstance(converter, dict):
+            values[name] = _convert(child, converter)
+        elif child.text is None:
+            values[name] = None
+        else:
+            try:
+                values[name] = converter(child.text)
+            except (TypeError, ValueError) as e:
+                raise FastPathError(f"Bad value for {name}: {e}")
+    return SimpleNamespace(**values)
+
+
+class SwipeFastPath:
+    """Pre-rendered request templates and a schema-driven reply reader"""
+
+    def __init__(self, client, credentials, session, timeout: Optional[float]):
+        """
+        Args:
+            client: zeep Client for the CheckInSummary service
+            credentials: Rendered UserCredentials header value
+            session: requests session to post with
+            timeout: Request timeout in seconds
+        Raises:
+            FastPathError: If the service definition doesn't suit the fast path
+        """
+        self.client = client
+        self.session = session
+        self.timeout = timeout
+        binding = client.service._binding
+        if not isinstance(binding, Soap11Binding):
+            raise FastPathError(f"Unsupported binding {type(binding).__name__}")
+        self.binding = binding
+        self.address = client.service._binding_options['address']
+        self._templates = {}
+        self._headers = {}
+        self._results = {}
+        for operation in FAST_OPERATIONS:
+            operation_obj = binding.get(operation)
+            envelope, headers = binding._create(
+                operation, (), {'_soapheaders': [credentials], 'swipeInput': _SWIPE_MARKER},
+                client=client
+            )
+            # Serialized exactly as zeep's transport would send it
+            parts = etree_to_string(envelope).split(_SWIPE_MARKER.encode('ascii'))
+            if len(parts) != 2:
+                raise FastPathError(f"Could not template {operation}")
+            self._templates[operation] = parts
+            self._headers[operation] = dict(headers)
+
+            # The reply body wraps a single result element
+            result_elements = operation_obj.output.body.type.elements
+            if len(result_elements) != 1 or not isinstance(result_elements[0][1].type, ComplexType):
+                raise FastPathError(f"{operation} reply is not a single result object")
+            result_element = result_elements[0][1]
+            self._results[operation] = (result_element.qname.text, _field_spec(result_element.type))
+
+    def render(self, operation: str, swipe_input: str) -> bytes:
+        """Request envelope for an operation"""
+        head, tail = self._templates[operation]
+        return head + escape(swipe_input).encode('utf-8') + tail
+
+    def parse(self, operation: str, content: bytes) -> SimpleNamespace:
+        """Read the result object from a reply. Raises FastPathError if it can't"""
+        result_tag, spec = self._results[operation]
+        fault_tag = f'{{{SOAP_ENV_NS}}}Fault'
+        try:
+            for _, node in etree.iterparse(io.BytesIO(content), events=('end',),
+                                           tag=(result_tag, fault_tag)):
+                if node.tag == fault_tag:
+                    raise FastPathError("SOAP fault")
+                return _convert(node, spec)
+        except etree.XMLSyntaxError as e:
+            raise FastPathError(f"Invalid XML: {e}")
+        raise FastPathError(f"No {result_tag} in reply")
+
+    def sample_reply(self, operation: str, values: Optional[Dict[str, str]] = None) -> bytes:
+        """A well-formed reply for an operation, for benchmarks and tests
+
+        Args:
+            operation: One of FAST_OPERATIONS
+            values: Text for result fields by element name; other fields get
+                    the first of a few generic values their type accepts
+        """
+        values = values or {}
+        result_tag, spec = self._results[operation]
+
+        def render(parent, field_spec: Dict[str, Any]):
+            for child_tag, (name, converter) in field_spec.items():
+                child = etree.SubElement(parent, child_tag)
+                if isinstance(converter, dict):
+                    render(child, converter)
+                    continue
+                text = values.get(name)
+                if text is None:
+                    for candidate in ('0', 'true', '2000-01-01T00:00:00'):
+                        try:
+                            converter(candidate)
+                        except (TypeError, ValueError):
+                            continue
+                        text = candidate
+                        break
+                child.text = text
+
+        envelope = etree.Element(f'{{{SOAP_ENV_NS}}}Envelope', nsmap={'soap': SOAP_ENV_NS})
+        body = etree.SubElement(envelope, f'{{{SOAP_ENV_NS}}}Body')
+        response_tag = self.binding.get(operation).output.body.qname
+        result = etree.SubElement(etree.SubElement(body, response_tag), result_tag)
+        render(result, spec)
+        return etree.tostring(envelope, encoding='utf-8', xml_declaration=True)
+
+    def call(self, operation: str, swipe_input: str):
+        """Send a punch operation and return its result
+
+        Raises the same exceptions a zeep call would when the reply is a
+        fault or the server can't be reached.
+        """
+        response = self.session.post(
+            self.address,
+            data=self.render(operation, swipe_input),
+            headers=self._headers[operation],
+            timeout=self.timeout
+        )
+        if response.status_code == 200:
+            try:
+                return self.parse(operation, response.content)
+            except FastPathError as e:
+                logger.debug(f"Fast path can't read {operation} reply, using zeep: {e}")
+        # Faults, errors and surprises are zeep's to interpret
+        return self.binding.process_reply(self.client, self.binding.get(operation), response)
+
+
+def create_fast_path(client, credentials, session, timeout: Optional[float]) -> Optional[SwipeFastPath]:
+    """SwipeFastPath for a summary client, or None if its definition doesn't allow one"""
+    try:
+        return SwipeFastPath(client, credentials, session, timeout)
+    except Exception as e:
+        logger.info(f"Punch fast path disabled, using zeep for every punch: {e}")
+        return None
@@ -0,0 +1,413 @@
+"""
+Local stand-in for the MSIWebTrax SOAP services.
+Serves the MSIWebTraxCheckIn and MSIWebTraxCheckInSummary WSDLs and
+answers RecordSwipeSummary, RecordSwipeSummaryDepartmentOverride,
+RecordSwipe and SaveImage, with configurable latency, faults, hangs,
+PunchException codes and SystemErrorCode replies. Point soap.endpoint at
+it to measure throughput and timeout behaviour without touching
+msiwebtrax.com. Counters are served as JSON at /stats.
+
+Usage:
+    python soap_standin.py --port 8088
+    python soap_standin.py --latency 150 --jitter 100 --fault-rate 0.02 --exception 2=0.05
+then set "endpoint": "http://127.0.0.1:8088/" in the soap settings.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+NS = 'http://msiwebtrax.com/'
+SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+DEFAULT_PORT = 8088
+
+# Operations of each service: name -> (request fields, result type)
+SERVICES = {
+    'MSIWebTraxCheckIn': {
+        'RecordSwipe': ([('swipeInput', 's:string')], 'tns:RecordSwipeReturnInfo'),
+        'SaveImage': ([('fileName', 's:string'), ('data', 's:base64Binary'), ('dir', 's:string')],
+                      'tns:SaveImageReturnInfo')
+    },
+    'MSIWebTraxCheckInSummary': {
+        'RecordSwipeSummary': ([('swipeInput', 's:string')], 'tns:RecordSwipeSummaryInfo'),
+        'RecordSwipeSummaryDepartmentOverride': ([('swipeInput', 's:string')], 'tns:RecordSwipeSummaryInfo')
+    }
+}
+
+SCHEMA_TYPES = """
+<s:complexType name="RecordSwipeReturnInfo"><s:sequence>
+  <s:element minOccurs="0" maxOccurs="1" name="SystemErrorCode" type="s:string"/>
+  <s:element minOccurs="1" maxOccurs="1" name="PunchSuccess" type="s:boolean"/>
+  <s:element minOccurs="0" maxOccurs="1" name="PunchType" type="s:string"/>
+  <s:element minOccurs="0" maxOccurs="1" name="FirstName" type="s:string"/>
+  <s:element minOccurs="0" maxOccurs="1" name="LastName" type="s:string"/>
+  <s:element minOccurs="1" maxOccurs="1" name="PunchException" type="s:int"/>
+</s:sequence></s:complexType>
+<s:complexType name="RecordSwipeSummaryInfo"><s:sequence>
+  <s:element minOccurs="0" maxOccurs="1" name="RecordSwipeReturnInfo" type="tns:RecordSwipeReturnInfo"/>
+  <s:element minOccurs="0" maxOccurs="1" name="CurrentWeeklyHours" type="s:string"/>
+</s:sequence></s:complexType>
+<s:complexType name="SaveImageReturnInfo"><s:sequence>
+  <s:element minOccurs="0" maxOccurs="1" name="SystemErrorCode" type="s:string"/>
+  <s:element minOccurs="1" maxOccurs="1" name="ImageSaved" type="s:boolean"/>
+</s:sequence></s:complexType>
+<s:element name="UserCredentials"><s:complexType><s:sequence>
+  <s:element minOccurs="0" maxOccurs="1" name="UserName" type="s:string"/>
+  <s:element minOccurs="0" maxOccurs="1" name="PWD" type="s:string"/>
+</s:sequence></s:complexType></s:element>
+"""
+
+
+def render_wsdl(service: str, address: str) -> str:
+    """WSDL of a stand-in service with its port at address"""
+    elements, messages, port_ops, binding_ops = [], [], [], []
+    for op, (fields, result_type) in SERVICES[service].items():
+        params = ''.join(f'<s:element minOccurs="0" maxOccurs="1" name="{name}" type="{xsd}"/>'
+                         for name, xsd in fields)
+        elements.append(
+            f'<s:element name="{op}"><s:complexType><s:sequence>{params}</s:sequence></s:complexType></s:element>'
+            f'<s:element name="{op}Response"><s:complexType><s:sequence>'
+            f'<s:element minOccurs="0" maxOccurs="1" name="{op}Result" type="{result_type}"/>'
+            f'</s:sequence></s:complexType></s:element>'
+        )
+        messages.append(
+            f'<wsdl:message name="{op}SoapIn"><wsdl:part name="parameters" element="tns:{op}"/></wsdl:message>'
+            f'<wsdl:message name="{op}SoapOut"><wsdl:part name="parameters" element="tns:{op}Response"/></wsdl:message>'
+            f'<wsdl:message name="{op}UserCredentials"><wsdl:part name="UserCredentials" element="tns:UserCredentials"/></wsdl:message>'
+        )
+        port_ops.append(
+            f'<wsdl:operation name="{op}"><wsdl:input message="tns:{op}SoapIn"/>'
+            f'<wsdl:output message="tns:{op}SoapOut"/></wsdl:operation>'
+        )
+        binding_ops.append(
+            f'<wsdl:operation name="{op}"><soap:operation soapAction="{NS}{op}" style="document"/>'
+            f'<wsdl:input><soap:body use="literal"/>'
+            f'<soap:header message="tns:{op}UserCredentials" part="UserCredentials" use="literal"/></wsdl:input>'
+            f'<wsdl:output><soap:body use="literal"/></wsdl:output></wsdl:operation>'
+        )
+    return (
+        f'<?xml version="1.0" encoding="utf-8"?>\n'
+        f'<wsdl:definitions xmlns:s="http://www.w3.org/2001/XMLSchema" '
+        f'xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" xmlns:tns="{NS}" targetNamespace="{NS}" '
+        f'xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/">'
+        f'<wsdl:types><s:schema elementFormDefault="qualified" targetNamespace="{NS}">'
+        f'{SCHEMA_TYPES}{"".join(elements)}</s:schema></wsdl:types>'
+        f'{"".join(messages)}'
+        f'<wsdl:portType name="{service}Soap">{"".join(port_ops)}</wsdl:portType>'
+        f'<wsdl:binding name="{service}Soap" type="tns:{service}Soap">'
+        f'<soap:binding transport="http://schemas.xmlsoap.org/soap/http"/>{"".join(binding_ops)}</wsdl:binding>'
+        f'<wsdl:service name="{service}"><wsdl:port name="{service}Soap" binding="tns:{service}Soap">'
+        f'<soap:address location="{address}"/></wsdl:port></wsdl:service>'
+        f'</wsdl:definitions>'
+    )
+
+
+def envelope(body: str) -> bytes:
+    return (f'<?xml version="1.0" encoding="utf-8"?>'
+            f'<soap:Envelope xmlns:soap="{SOAP_ENV_NS}"><soap:Body>{body}</soap:Body></soap:Envelope>'
+            ).encode('utf-8')
+
+
+def fault(message: str) -> bytes:
+    return envelope(f'<soap:Fault><faultcode>soap:Server</faultcode>'
+                    f'<faultstring>{escape(message)}</faultstring></soap:Fault>')
+
+
+class StandInConfig:
+    """Behaviour of the stand-in server
+
+    Rates are probabilities per request. Codes are drawn independently in
+    the listed order; the first one drawn is used.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, fault_rate: float = 0.0,
+                 hang_rate: float = 0.0, hang_seconds: float = 30.0,
+                 exceptions: Optional[List[Tuple[int, float]]] = None,
+                 system_errors: Optional[List[Tuple[str, float]]] = None,
+                 image_error_rate: float = 0.0, username: Optional[str] = None,
+                 password: Optional[str] = None, image_dir: Optional[str] = None,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fault_rate = fault_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.exceptions = exceptions or []
+        self.system_errors = system_errors or []
+        self.image_error_rate = image_error_rate
+        self.username = username
+        self.password = password
+        self.image_dir = image_dir
+        self.seed = seed
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering as the MSIWebTrax services"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: StandInConfig):
+        super().__init__(address, StandInHandler)
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._last_punch: Dict[str, str] = {}
+        self.counters: Dict[str, int] = {}
+        self.started_at = datetime.now().isoformat()
+
+    @property
+    def endpoint(self) -> str:
+        """Value for soap.endpoint"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def chance(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def draw(self, choices) -> Optional[Any]:
+        """First code of (code, rate) pairs whose draw hits, or None"""
+        with self._lock:
+            for code, rate in choices:
+                if self._rng.random() < rate:
+                    return code
+        return None
+
+    def latency(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(0, self.config.jitter_ms) if self.config.jitter_ms else 0.0
+        return (self.config.latency_ms + jitter) / 1000.0
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def next_punch_type(self, employee_id: str) -> str:
+        """Alternate check in and check out per employee"""
+        with self._lock:
+            punch_type = 'checkout' if self._last_punch.get(employee_id) == 'checkin' else 'checkin'
+            self._last_punch[employee_id] = punch_type
+            return punch_type
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on slow replies when their timeout passes
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            self.count('clientGone')
+            return
+        super().handle_error(request, client_address)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'startedAt': self.started_at, 'counters': dict(self.counters)}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like IIS
+    protocol_version = 'HTTP/1.1'
+    server: StandInServer
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status: int, body: bytes, content_type: str = 'text/xml; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/stats':
+            self._send(200, json.dumps(self.server.stats(), indent=2).encode('utf-8'), 'application/json')
+            return
+        service = os.path.basename(path)[:-len('.asmx')] if path.endswith('.asmx') else None
+        if service in SERVICES:
+            self.server.count(f'{self.command} {service} WSDL')
+            address = f'{self.server.endpoint}Services/{service}.asmx'
+            self._send(200, render_wsdl(service, address).encode('utf-8'))
+            return
+        self._send(404, b'Not found', 'text/plain')
+
+    def do_POST(self):
+        content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        config = self.server.config
+        try:
+            doc = etree.fromstring(content)
+            body = doc.find(f'{{{SOAP_ENV_NS}}}Body')
+            request = next(iter(body))
+            op = etree.QName(request).localname
+        except Exception as e:
+            self.server.count('badRequest')
+            self._send(400, fault(f"Malformed request: {e}"))
+            return
+        self.server.count(op)
+
+        time.sleep(self.server.latency())
+        if self.server.chance(config.hang_rate):
+            self.server.count('hang')
+            time.sleep(config.hang_seconds)
+        if self.server.chance(config.fault_rate):
+            self.server.count('fault')
+            self._send(500, fault("Stand-in injected fault"))
+            return
+
+        fields = {etree.QName(child).localname: child.text or '' for child in request}
+        credentials = {etree.QName(child).localname: child.text
+                       for child in doc.iterfind(f'{{{SOAP_ENV_NS}}}Header/{{{NS}}}UserCredentials/*')}
+        authorized = ((config.username is None or credentials.get('UserName') == config.username) and
+                      (config.password is None or credentials.get('PWD') == config.password))
+
+        if op in ('RecordSwipeSummary', 'RecordSwipeSummaryDepartmentOverride', 'RecordSwipe'):
+            info = self._swipe(fields.get('swipeInput', ''), authorized)
+            if op == 'RecordSwipe':
+                result = info
+            else:
+                hours = '' if info.startswith('<SystemErrorCode>-') else '<CurrentWeeklyHours>32.5</CurrentWeeklyHours>'
+                result = f'<RecordSwipeReturnInfo>{info}</RecordSwipeReturnInfo>{hours}'
+        elif op == 'SaveImage':
+            result = self._save_image(fields, authorized)
+        else:
+            self._send(500, fault(f"Unknown operation {op}"))
+            return
+        self._send(200, envelope(f'<{op}Response xmlns="{NS}"><{op}Result>{result}</{op}Result></{op}Response>'))
+
+    def _swipe(self, swipe_input: str, authorized: bool) -> str:
+        """RecordSwipeReturnInfo content for a swipe"""
+        error = None
+        parts = swipe_input.split('|*|')
+        if not authorized:
+            error = '-3'
+        elif not swipe_input:
+            error = '-2'
+        elif len(parts) < 2:
+            error = '-5'
+        else:
+            try:
+                datetime.fromisoformat(parts[1])
+            except ValueError:
+                error = '-6'
+        error = error or self.server.draw(self.server.config.system_errors)
+        if error:
+            self.server.count(f'systemError{error}')
+            return (f'<SystemErrorCode>{error}</SystemErrorCode>'
+                    f'<PunchSuccess>false</PunchSuccess><PunchException>0</PunchException>')
+
+        employee_id = parts[0]
+        exception = self.server.draw(self.server.config.exceptions) or 0
+        if exception:
+            self.server.count(f'punchException{exception}')
+            return (f'<PunchSuccess>false</PunchSuccess><FirstName>Test</FirstName>'
+                    f'<LastName>{escape(employee_id)}</LastName><PunchException>{exception}</PunchException>')
+        punch_type = self.server.next_punch_type(employee_id)
+        return (f'<PunchSuccess>true</PunchSuccess><PunchType>{punch_type}</PunchType>'
+                f'<FirstName>Test</FirstName><LastName>{escape(employee_id)}</LastName>'
+                f'<PunchException>0</PunchException>')
+
+    def _save_image(self, fields: Dict[str, str], authorized: bool) -> str:
+        """SaveImageReturnInfo content for an upload"""
+        error = None
+        if not authorized:
+            error = '-3'
+        elif not fields.get('fileName') or not fields.get('data'):
+            error = '-2'
+        elif self.server.chance(self.server.config.image_error_rate):
+            error = '-4'
+        if error:
+            self.server.count(f'imageError{error}')
+            return f'<SystemErrorCode>{error}</SystemErrorCode><ImageSaved>false</ImageSaved>'
+        data = base64.b64decode(fields['data'])
+        self.server.count('imageBytes', len(data))
+        if self.server.config.image_dir:
+            directory = os.path.join(self.server.config.image_dir, os.path.basename(fields.get('dir') or 'default'))
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, os.path.basename(fields['fileName'])), 'wb') as f:
+                f.write(data)
+        return '<ImageSaved>true</ImageSaved>'
+
+
+def start_standin(config: Optional[StandInConfig] = None, host: str = '127.0.0.1',
+                  port: int = 0) -> StandInServer:
+    """Start a stand-in server on a background thread. Port 0 picks a free port"""
+    server = StandInServer((host, port), config or StandInConfig())
+    threading.Thread(target=server.serve_forever, name='soap-standin', daemon=True).start()
+    logger.info(f"SOAP stand-in serving at {server.endpoint}")
+    return server
+
+
+def _code_rate(value: str) -> Tuple[str, float]:
+    try:
+        code, rate = value.split('=')
+        return code.strip(), float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not CODE=RATE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the MSIWebTrax SOAP services')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port (default: {DEFAULT_PORT})')
+    parser.add_argument('--latency', type=float, default=0.0, help='Added latency per call in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency per call, up to this many ms')
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='Share of calls answered with a SOAP fault (HTTP 500)')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Share of calls held for --hang-seconds first')
+    parser.add_argument('--hang-seconds', type=float, default=30.0, help='How long a hanging call is held (default: 30)')
+    parser.add_argument('--exception', dest='exceptions', type=_code_rate, action='append', default=[],
+                        metavar='CODE=RATE', help='Answer this share of punches with a PunchException code, e.g. 2=0.05')
+    parser.add_argument('--system-error', dest='system_errors', type=_code_rate, action='append', default=[],
+                        metavar='CODE=RATE', help='Answer this share of punches with a SystemErrorCode, e.g. 3=0.01 for -3')
+    parser.add_argument('--image-error-rate', type=float, default=0.0, help='Share of SaveImage calls answered with an error code')
+    parser.add_argument('--username', help='Only accept these credentials (default: any)')
+    parser.add_argument('--password', help='Only accept these credentials (default: any)')
+    parser.add_argument('--image-dir', help='Save uploaded images here')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+
+    config = StandInConfig(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        fault_rate=args.fault_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        exceptions=[(int(code), rate) for code, rate in args.exceptions],
+        # Error codes are negative, the minus sign is optional on the command line
+        system_errors=[('-' + code.lstrip('-'), rate) for code, rate in args.system_errors],
+        image_error_rate=args.image_error_rate,
+        username=args.username,
+        password=args.password,
+        image_dir=args.image_dir,
+        seed=args.seed
+    )
+    server = StandInServer((args.host, args.port), config)
+    print(f"SOAP stand-in serving at {server.endpoint} (set soap.endpoint to this), stats at {server.endpoint}stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Long-lived HTTP transport for the SOAP clients.
+One requests session with a sized connection pool is created for the
+life of the SoapClient and reused by every reconnect, so pooled TCP/TLS
+connections survive a rebuild of the zeep clients. Connection reuse is
+counted so pool hits and misses can be reported.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Any, Callable, Optional
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Default number of pooled connections kept per host
+DEFAULT_POOL_SIZE = 4
+
+
+class PoolStats:
+    """Counters of requests sent and new connections opened by the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connects = 0
+        # Called with the seconds each new connection took to open
+        self.on_connect: Optional[Callable[[float], None]] = None
+
+    def add_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def add_connect(self, seconds: float = 0.0):
+        with self._lock:
+            self.connects += 1
+        if self.on_connect is not None:
+            self.on_connect(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            requests, connects = self.requests, self.connects
+        # A request that didn't need a connect went over a pooled connection
+        hits = max(requests - connects, 0)
+        return {
+            'requests': requests,
+            'hits': hits,
+            'misses': connects,
+            'hitRate': round(hits / requests, 3) if requests else None
+        }
+
+
+def _counting_pool_classes(stats: PoolStats) -> Dict[str, type]:
+    """urllib3 pool classes whose connections report to the given stats"""
+
+    class CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                super().connect()
+            finally:
+                stats.add_connect(time.perf_counter() - start)
+
+        def request(self, *args, **kwargs):
+            stats.add_request()
+            return super().request(*args, **kwargs)
+
+    class CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                super().connect()
+            finally:
+                stats.add_connect(time.perf_counter() - start)
+
+        def request(self, *args, **kwargs):
+            stats.add_request()
+            return super().request(*args, **kwargs)
+
+    class CountingHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = CountingHTTPConnection
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = CountingHTTPSConnection
+
+    return {'http': CountingHTTPConnectionPool, 'https': CountingHTTPSConnectionPool}
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools count connection reuse"""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self.stats)
+
+
+class ConnectionPool:
+    """Persistent requests session shared by every SOAP client build"""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        self.stats = PoolStats()
+        self.session = Session()
+        self.session.headers.update({
+            'Connection': 'keep-alive',  # Use persistent connections
+            'Accept-Encoding': 'gzip, deflate',  # Enable compression
+            'Cache-Control': 'no-cache'  # Avoid caching issues
+        })
+        # No adapter-level retries: failures fall back to offline storage
+        adapter = CountingHTTPAdapter(
+            self.stats,
+            pool_connections=2,
+            pool_maxsize=pool_size,
+            max_retries=0
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        logger.debug(f"HTTP connection pool created with {pool_size} connections per host")
+
+    def close(self):
+        self.session.close()
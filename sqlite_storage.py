@@ -0,0 +1,217 @@
+"""
+SQLite storage engine for offline punches.
+Punches live in a single table of a WAL-mode database, so storing or
+marking a punch touches one row instead of rewriting the whole backlog.
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from punch_store import PunchStore, DEFAULT_READ_BATCH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employeeId TEXT NOT NULL,
+    punchTime TEXT NOT NULL,
+    punchType TEXT NOT NULL,
+    imageFilename TEXT,
+    synced INTEGER NOT NULL DEFAULT 0,
+    createdAt TEXT NOT NULL,
+    syncedAt TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_punches_synced ON punches (synced, createdAt);
+CREATE INDEX IF NOT EXISTS idx_punches_created ON punches (createdAt);
+CREATE INDEX IF NOT EXISTS idx_punches_unsynced_time ON punches (synced, punchTime, id);
+CREATE INDEX IF NOT EXISTS idx_punches_time ON punches (punchTime, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+COLUMNS = ('id', 'employeeId', 'punchTime', 'punchType', 'imageFilename',
+           'synced', 'createdAt', 'syncedAt')
+
+
+class SqlitePunchStore(PunchStore):
+    """Offline punches in a WAL-mode SQLite database"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, options: Optional[Dict[str, Any]] = None):
+        super().__init__(path, options)
+        self._lock = threading.Lock()
+        # The punch worker thread and the Tk thread share this connection,
+        # access is serialized by self._lock
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # FULL keeps every committed punch across a power cut, WAL keeps it cheap
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        logger.debug(f"Opened SQLite punch store at {path}")
+
+    @staticmethod
+    def _row_to_punch(row: sqlite3.Row) -> Dict[str, Any]:
+        punch = dict(row)
+        punch['synced'] = bool(punch['synced'])
+        if punch['syncedAt'] is None:
+            del punch['syncedAt']
+        return punch
+
+    def _insert(self, punch: Dict[str, Any]) -> int:
+        cursor = self._conn.execute(
+            'INSERT INTO punches (employeeId, punchTime, punchType, imageFilename, '
+            'synced, createdAt, syncedAt) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                punch['employeeId'],
+                punch['punchTime'],
+                punch.get('punchType', 'OFFLINE'),
+                punch.get('imageFilename'),
+                1 if punch.get('synced', False) else 0,
+                punch['createdAt'],
+                punch.get('syncedAt')
+            )
+        )
+        return cursor.lastrowid
+
+    def commit(self, ops: List[Tuple]) -> List[Any]:
+        results = []
+        # One transaction, so the whole batch costs a single WAL fsync
+        with self._lock, self._conn:
+            for op in ops:
+                if op[0] == 'store':
+                    punch = op[1]
+                    punch['id'] = self._insert(punch)
+                    results.append(punch)
+                elif op[0] == 'synced':
+                    cursor = self._conn.execute(
+                        'UPDATE punches SET synced = 1, syncedAt = ? WHERE id = ?',
+                        (op[2], op[1])
+                    )
+                    results.append(cursor.rowcount > 0)
+                elif op[0] == 'delete':
+                    cursor = self._conn.executemany(
+                        'DELETE FROM punches WHERE id = ?', [(i,) for i in op[1]]
+                    )
+                    results.append(cursor.rowcount)
+                else:
+                    raise ValueError(f"Unknown storage operation '{op[0]}'")
+        return results
+
+    def import_punches(self, punches: Iterable[Dict[str, Any]],
+                       source: Optional[str] = None) -> int:
+        count = 0
+        with self._lock, self._conn:
+            # The import marker commits in the same transaction as the rows,
+            # so an interrupted import is never applied twice
+            if source:
+                marker = f"imported:{os.path.basename(source)}"
+                if self._conn.execute('SELECT 1 FROM meta WHERE key = ?', (marker,)).fetchone():
+                    logger.info(f"{source} was already imported, skipping")
+                    return 0
+                self._conn.execute(
+                    'INSERT INTO meta (key, value) VALUES (?, ?)',
+                    (marker, datetime.now().isoformat())
+                )
+            for punch in punches:
+                self._insert(punch)
+                count += 1
+        return count
+
+    def get_unsynced(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM punches WHERE synced = 0 "
+                "ORDER BY createdAt, id"
+            ).fetchall()
+        return [self._row_to_punch(row) for row in rows]
+
+    def iter_punches(self, start: Optional[str] = None, end: Optional[str] = None,
+                     synced: Optional[bool] = None,
+                     batch_size: int = DEFAULT_READ_BATCH) -> Iterator[Dict[str, Any]]:
+        # Filters go into the query; pages are keyed on (punchTime, id)
+        where = []
+        params: List[Any] = []
+        if start is not None:
+            where.append("punchTime >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("punchTime < ?")
+            params.append(end)
+        if synced is not None:
+            where.append("synced = ?")
+            params.append(1 if synced else 0)
+        after = None
+        while True:
+            page_where = list(where)
+            page_params = list(params)
+            if after is not None:
+                page_where.append("(punchTime > ? OR (punchTime = ? AND id > ?))")
+                page_params += [after[0], after[0], after[1]]
+            query = f"SELECT {', '.join(COLUMNS)} FROM punches"
+            if page_where:
+                query += " WHERE " + " AND ".join(page_where)
+            query += " ORDER BY punchTime, id LIMIT ?"
+            page_params.append(batch_size)
+            with self._lock:
+                rows = self._conn.execute(query, page_params).fetchall()
+            for row in rows:
+                yield self._row_to_punch(row)
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]['punchTime'], rows[-1]['id'])
+
+    def unsynced_page(self, after: Optional[Tuple[str, int]], limit: int) -> List[Dict[str, Any]]:
+        # Keyset pagination on the (synced, punchTime, id) index
+        query = f"SELECT {', '.join(COLUMNS)} FROM punches WHERE synced = 0"
+        params: List[Any] = []
+        if after is not None:
+            query += " AND (punchTime > ? OR (punchTime = ? AND id > ?))"
+            params += [after[0], after[0], after[1]]
+        query += " ORDER BY punchTime, id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_punch(row) for row in rows]
+
+    def oldest(self, synced: bool, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM punches WHERE synced = ? "
+                "ORDER BY createdAt, id LIMIT ?",
+                (1 if synced else 0, limit)
+            ).fetchall()
+        return [self._row_to_punch(row) for row in rows]
+
+    def delete_created_before(self, cutoff: datetime) -> int:
+        # createdAt is an ISO timestamp, so string comparison orders by time;
+        # a record is expired when its day is on or before the cutoff day
+        boundary = (cutoff + timedelta(days=1)).isoformat()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'DELETE FROM punches WHERE createdAt < ?', (boundary,)
+            )
+        return cursor.rowcount
+
+    def data_files(self) -> List[str]:
+        return [self.path, self.path + '-wal']
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM punches').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception as e:
+                logger.warning(f"Failed to close SQLite punch store: {e}")
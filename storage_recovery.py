@@ -0,0 +1,357 @@
+"""
+Startup recovery for the offline punch store.
+Runs before the storage engine opens: removes temp files left by
+interrupted atomic writes, validates the engine's data files, and
+salvages punch records out of anything partial or corrupt instead of
+letting a bad file turn into an empty backlog. Every step checks a
+deadline so startup stays bounded however large the store is.
+"""
+
+import os
+import glob
+import gzip
+import json
+import time
+import shutil
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from punch_store import fsync_dir, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Default wall-clock budget for the whole recovery pass
+DEFAULT_TIME_LIMIT = 10.0
+
+# Fields a salvaged record must have to be kept
+REQUIRED_FIELDS = ('employeeId', 'punchTime', 'createdAt')
+
+
+class SalvageTimeout(Exception):
+    """The time budget ran out before a damaged file was fully salvaged"""
+
+
+def new_report() -> Dict[str, Any]:
+    return {
+        'tempFilesRemoved': 0,
+        'tempFilesPromoted': 0,
+        'filesRepaired': [],
+        'quarantined': [],
+        'recordsSalvaged': 0,
+        'timedOut': False,
+        'durationMs': 0
+    }
+
+
+def _is_punch(obj: Any) -> bool:
+    return isinstance(obj, dict) and all(field in obj for field in REQUIRED_FIELDS)
+
+
+def salvage_punch_records(text: str, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Pull every intact punch object out of damaged JSON text
+
+    Tries to decode an object at each '{' in turn. Punch records are flat,
+    so after a successful decode scanning resumes past the record; wrapper
+    objects that fail to decode only cost a scan up to the damage.
+
+    Raises:
+        SalvageTimeout: If the deadline passes before the whole text is scanned
+    """
+    decoder = json.JSONDecoder()
+    records = []
+    pos = text.find('{')
+    while pos != -1:
+        if deadline is not None and time.monotonic() > deadline:
+            raise SalvageTimeout(f"Out of time after salvaging {len(records)} punch records")
+        try:
+            obj, end = decoder.raw_decode(text, pos)
+            if _is_punch(obj):
+                records.append(obj)
+                pos = text.find('{', end)
+                continue
+        except ValueError:
+            pass
+        pos = text.find('{', pos + 1)
+    return records
+
+
+def quarantine(path: str, report: Dict[str, Any], copy: bool = False) -> str:
+    """Move (or copy) a damaged file aside, keeping it for later inspection"""
+    target = f"{path}.corrupt-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    if copy:
+        shutil.copy2(path, target)
+    else:
+        shutil.move(path, target)
+    report['quarantined'].append(target)
+    logger.warning(f"{'Copied' if copy else 'Moved'} damaged storage file {path} to {target}")
+    return target
+
+
+def salvage_json_file(path: str, report: Optional[Dict[str, Any]] = None,
+                      deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Copy a corrupt punch file aside and return the records salvaged from it
+
+    The damaged file stays in place until the caller atomically replaces it
+    with the repaired content, so a crash in between loses nothing.
+
+    Raises:
+        SalvageTimeout: If the deadline passed first; nothing is copied aside
+    """
+    report = report if report is not None else new_report()
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    records = salvage_punch_records(text, deadline)
+    quarantine(path, report, copy=True)
+    report['recordsSalvaged'] += len(records)
+    logger.warning(f"Salvaged {len(records)} punch records from corrupt {path}")
+    return records
+
+
+def _load_json(path: str) -> Any:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _recover_punch_array(path: str, report: Dict[str, Any], deadline: float):
+    """Validate a JSON punch array (json engine file or legacy local.json), repairing it if needed"""
+    temps = sorted(glob.glob(os.path.join(os.path.dirname(path) or '.', 'punches_*.tmp')),
+                   key=os.path.getmtime)
+
+    main_records = []
+    if os.path.exists(path):
+        try:
+            main_records = _load_json(path)
+            if not isinstance(main_records, list):
+                raise ValueError("punch file is not a list")
+        except Exception as e:
+            logger.error(f"Punch file {path} is damaged: {e}")
+            try:
+                main_records = salvage_json_file(path, report, deadline)
+            except SalvageTimeout as timeout:
+                # Left as it is; the engine salvages it when loading, or the next start does
+                logger.error(f"Punch file {path} not repaired: {timeout}")
+                report['timedOut'] = True
+                return
+            write_json_atomic(path, main_records, indent=2)
+            report['filesRepaired'].append(path)
+
+    # A temp file newer than the punch file that parses completely is a write
+    # that was fsynced but never renamed into place: it is the newest state
+    main_mtime = os.path.getmtime(path) if os.path.exists(path) else 0
+    for temp in reversed(temps):
+        if os.path.getmtime(temp) < main_mtime:
+            continue
+        try:
+            records = _load_json(temp)
+            if isinstance(records, list) and all(_is_punch(r) for r in records) \
+                    and len(records) >= len(main_records):
+                os.replace(temp, path)
+                report['tempFilesPromoted'] += 1
+                logger.warning(f"Promoted interrupted punch file write {temp}")
+                break
+        except Exception:
+            pass
+
+
+def _recover_sqlite(path: str, report: Dict[str, Any], deadline: float):
+    """Check the SQLite database and rebuild it from readable rows if it is damaged"""
+    if not os.path.exists(path):
+        return
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            conn.close()
+        if result == 'ok':
+            return
+        logger.error(f"SQLite punch store {path} failed integrity check: {result}")
+    except sqlite3.DatabaseError as e:
+        logger.error(f"SQLite punch store {path} can't be opened: {e}")
+
+    # Copy out whatever rows are still readable, in id order, chunk by chunk.
+    # Running out of time leaves the database as it is, to retry next start,
+    # rather than replace it with part of its rows.
+    rows: List[tuple] = []
+    columns = None
+    timed_out = time.monotonic() >= deadline
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            cursor = conn.execute('SELECT * FROM punches ORDER BY id')
+            columns = [d[0] for d in cursor.description]
+            while time.monotonic() < deadline:
+                try:
+                    chunk = cursor.fetchmany(500)
+                except sqlite3.DatabaseError as e:
+                    logger.error(f"Stopped reading damaged punch table: {e}")
+                    break
+                if not chunk:
+                    break
+                rows.extend(chunk)
+            else:
+                timed_out = True
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        logger.error(f"No rows could be read from {path}: {e}")
+    if timed_out:
+        logger.error(f"Out of time salvaging {path}, leaving it for the next start")
+        report['timedOut'] = True
+        return
+
+    # Rebuild beside the original with the engine's schema, keeping the ids,
+    # then swap it in
+    rebuilt = path + '.rebuild'
+    if os.path.exists(rebuilt):
+        os.unlink(rebuilt)
+    from sqlite_storage import SCHEMA
+    conn = sqlite3.connect(rebuilt)
+    try:
+        conn.executescript(SCHEMA)
+        if rows and columns:
+            placeholders = ', '.join('?' for _ in columns)
+            with conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO punches ({', '.join(columns)}) VALUES ({placeholders})",
+                    rows
+                )
+    finally:
+        conn.close()
+
+    quarantine(path, report)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            shutil.move(path + suffix, report['quarantined'][-1] + suffix)
+    os.replace(rebuilt, path)
+    fsync_dir(os.path.dirname(path) or '.')
+    report['recordsSalvaged'] += len(rows)
+    report['filesRepaired'].append(path)
+    logger.warning(f"Rebuilt SQLite punch store with {len(rows)} salvaged punches")
+
+
+def _recover_snapshot(path: str, report: Dict[str, Any], deadline: float):
+    """Validate the journal engine's snapshot, salvaging its punches if it is damaged"""
+    if not os.path.exists(path):
+        return
+    try:
+        snapshot = _load_json(path)
+        if isinstance(snapshot, dict) and isinstance(snapshot.get('punches'), list):
+            return
+        raise ValueError("unexpected snapshot layout")
+    except Exception as e:
+        logger.error(f"Journal snapshot {path} is damaged: {e}")
+    try:
+        repair_snapshot(path, report, deadline)
+    except SalvageTimeout as e:
+        # Left as it is; the engine salvages it when loading, or the next start does
+        logger.error(f"Journal snapshot {path} not repaired: {e}")
+        report['timedOut'] = True
+
+
+def repair_snapshot(path: str, report: Optional[Dict[str, Any]] = None,
+                    deadline: Optional[float] = None):
+    """Replace a damaged journal snapshot with the punches salvaged from it"""
+    report = report if report is not None else new_report()
+    records = salvage_json_file(path, report, deadline)
+    write_json_atomic(path, {
+        'lastId': max((r.get('id', 0) for r in records), default=0),
+        'punches': [r for r in records if 'id' in r]
+    }, separators=(',', ':'))
+    report['filesRepaired'].append(path)
+
+
+def _recover_archive(directory: str, report: Dict[str, Any], deadline: float):
+    """Check the archive file currently being appended to for a torn gzip member"""
+    files = sorted(glob.glob(os.path.join(directory, 'punches-*.jsonl.gz')))
+    if not files:
+        return
+    path = files[-1]
+    records = []
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if time.monotonic() > deadline:
+                    report['timedOut'] = True
+                    return
+                if line.strip():
+                    records.append(line)
+        return
+    except (EOFError, OSError, ValueError) as e:
+        logger.error(f"Punch archive {path} is damaged: {e}")
+
+    # Rewrite with the lines that decompressed; the index recounts missing files
+    quarantine(path, report)
+    complete = [line if line.endswith('\n') else line + '\n' for line in records
+                if line.rstrip('\n').endswith('}')]
+    with open(path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+            gz.write(''.join(complete).encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+    index = os.path.join(directory, 'index.json')
+    if os.path.exists(index):
+        os.unlink(index)
+    report['recordsSalvaged'] += len(complete)
+    report['filesRepaired'].append(path)
+
+
+def recover_storage(storage_file: str, engine: str, legacy_file: Optional[str] = None,
+                    time_limit: float = DEFAULT_TIME_LIMIT) -> Dict[str, Any]:
+    """Run the startup recovery pass for the offline store
+
+    Args:
+        storage_file: Main data path of the configured engine
+        engine: Configured storage engine name
+        legacy_file: local.json path that may still be waiting to be imported
+        time_limit: Seconds the pass may take before it stops salvaging
+    Returns:
+        Report of what was repaired, salvaged and cleaned up
+    """
+    start = time.monotonic()
+    deadline = start + time_limit
+    report = new_report()
+    data_dir = os.path.dirname(storage_file) or '.'
+    base = os.path.splitext(storage_file)[0]
+
+    try:
+        if not os.path.isdir(data_dir):
+            return report
+
+        # JSON punch arrays get first look at leftover temp files
+        if engine == 'json':
+            _recover_punch_array(storage_file, report, deadline)
+        if legacy_file and legacy_file != storage_file and os.path.exists(legacy_file):
+            _recover_punch_array(legacy_file, report, deadline)
+
+        if engine == 'sqlite':
+            _recover_sqlite(storage_file, report, deadline)
+        elif engine == 'journal':
+            _recover_snapshot(base + '.snapshot', report, deadline)
+        # Journal, segment and overflow event files tolerate torn and corrupt
+        # lines when they are read, so they need no pass of their own
+
+        _recover_archive(base + '.archive', report, deadline)
+
+        # Anything still left is an abandoned atomic write whose target is intact
+        for pattern in ('punches_*.tmp', os.path.join('*', 'punches_*.tmp')):
+            for temp in glob.glob(os.path.join(data_dir, pattern)):
+                try:
+                    os.unlink(temp)
+                    report['tempFilesRemoved'] += 1
+                except OSError as e:
+                    logger.warning(f"Could not remove temp file {temp}: {e}")
+    except Exception as e:
+        logger.error(f"Storage recovery failed: {e}")
+    finally:
+        if time.monotonic() > deadline:
+            report['timedOut'] = True
+        report['durationMs'] = int((time.monotonic() - start) * 1000)
+
+    if report['filesRepaired'] or report['tempFilesPromoted'] or report['timedOut']:
+        logger.warning(f"Storage recovery report: {report}")
+    elif report['tempFilesRemoved']:
+        logger.info(f"Storage recovery removed {report['tempFilesRemoved']} leftover temp files")
+    return report
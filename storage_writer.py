@@ -0,0 +1,121 @@
+"""
+Single-writer thread for the offline punch store.
+All writes to the store go through one thread that takes operations off a
+queue and coalesces everything arriving within a short window into a
+single durable commit, so a burst of punches shares one fsync.
+"""
+
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+from punch_store import PunchStore
+
+logger = logging.getLogger(__name__)
+
+# Default time window for coalescing writes into one commit
+DEFAULT_GROUP_COMMIT_MS = 5
+
+# Upper bound on operations folded into a single commit
+MAX_BATCH = 500
+
+_STOP = object()
+
+
+class StorageWriter:
+    """Storage actor: the only thread that writes to a PunchStore"""
+
+    def __init__(self, store: PunchStore, group_commit_ms: float = DEFAULT_GROUP_COMMIT_MS):
+        self.store = store
+        self.window = group_commit_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self.commits = 0
+        self.operations = 0
+        self._thread = threading.Thread(target=self._run, name='storage-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, op: Tuple) -> Future:
+        """Queue a store operation, see PunchStore.commit. Returns a future for its result"""
+        future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def call(self, func: Callable[[], Any]) -> Future:
+        """Run func on the writer thread, between commits. Returns a future for its result"""
+        future = Future()
+        self._queue.put((func, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item[0] is _STOP:
+                item[1].set_result(None)
+                return
+            if callable(item[0]):
+                self._run_call(*item)
+                continue
+
+            # Collect everything else that arrives within the commit window
+            batch = [item]
+            pending_call = None
+            deadline = time.monotonic() + self.window
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        next_item = self._queue.get(timeout=remaining)
+                    else:
+                        next_item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item[0] is _STOP or callable(next_item[0]):
+                    pending_call = next_item
+                    break
+                batch.append(next_item)
+
+            self._commit(batch)
+
+            if pending_call is not None:
+                if pending_call[0] is _STOP:
+                    pending_call[1].set_result(None)
+                    return
+                self._run_call(*pending_call)
+
+    def _commit(self, batch: List[Tuple[Tuple, Future]]):
+        """Apply a batch of operations as one durable commit"""
+        ops = [op for op, _ in batch]
+        try:
+            results = self.store.commit(ops)
+        except Exception as e:
+            logger.error(f"Group commit of {len(ops)} storage operations failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.commits += 1
+        self.operations += len(ops)
+        if len(ops) > 1:
+            logger.debug(f"Group commit wrote {len(ops)} storage operations")
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    @staticmethod
+    def _run_call(func: Callable[[], Any], future: Future):
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+
+    def stop(self, timeout: float = 5.0):
+        """Commit everything already queued, then stop the writer thread"""
+        future = Future()
+        self._queue.put((_STOP, future))
+        try:
+            future.result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Storage writer did not stop cleanly: {e}")
+        self._thread.join(timeout)
@@ -0,0 +1,187 @@
+"""
+In-memory SOAP telemetry.
+Latency histograms per operation and phase (dns, connect, soap, total),
+timeout counts, offline fallbacks and reconnect outcomes. Histograms use
+fixed buckets and recent reconnects a bounded ring, so memory stays flat
+however long the kiosk runs. A snapshot is shown in the admin panel and
+exported periodically to a JSON file.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets in milliseconds; slower samples go in an overflow bucket
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+# Operation and phase pairs tracked; anything beyond is dropped rather than grown
+MAX_SERIES = 64
+
+# Reconnect attempts kept for display
+RECENT_RECONNECTS = 20
+
+# Operation connects are filed under when no SOAP operation is running on the thread
+OTHER_OPERATION = 'other'
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds: float):
+        ms = seconds * 1000.0
+        index = len(BUCKET_BOUNDS_MS)
+        for i, bound in enumerate(BUCKET_BOUNDS_MS):
+            if ms <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile, in milliseconds"""
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i == len(BUCKET_BOUNDS_MS):
+                    break
+                # The slowest sample is a tighter bound for the top bucket in use
+                return min(float(BUCKET_BOUNDS_MS[i]), round(self.max_ms, 1))
+        return round(self.max_ms, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'meanMs': round(self.total_ms / self.count, 1) if self.count else None,
+            'p50Ms': self.percentile(50),
+            'p95Ms': self.percentile(95),
+            'p99Ms': self.percentile(99),
+            'maxMs': round(self.max_ms, 1),
+            'buckets': {('+inf' if i == len(BUCKET_BOUNDS_MS) else str(BUCKET_BOUNDS_MS[i])): n
+                        for i, n in enumerate(self.buckets) if n}
+        }
+
+
+class Telemetry:
+    """Counters and latency histograms of one SoapClient"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started_at = datetime.now().isoformat()
+        self._histograms: Dict[tuple, LatencyHistogram] = {}
+        self._dropped_series = 0
+        self.timeouts: Dict[str, int] = {}
+        self.offline_fallbacks: Dict[str, int] = {}
+        self.reconnects: Dict[str, int] = {}
+        self._recent_reconnects = deque(maxlen=RECENT_RECONNECTS)
+
+    def record(self, operation: str, phase: str, seconds: float):
+        """Add a latency sample for an operation's phase"""
+        key = (operation, phase)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                if len(self._histograms) >= MAX_SERIES:
+                    self._dropped_series += 1
+                    return
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def operation(self, name: str):
+        """File new connections made on this thread under an operation"""
+        previous = getattr(self._local, 'operation', None)
+        self._local.operation = name
+        try:
+            yield
+        finally:
+            self._local.operation = previous
+
+    def record_connect(self, seconds: float):
+        """A new HTTP connection was opened, see soap_transport"""
+        self.record(getattr(self._local, 'operation', None) or OTHER_OPERATION, 'connect', seconds)
+
+    def _increment(self, counters: Dict[str, int], key: str):
+        with self._lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def record_timeout(self, operation: str):
+        self._increment(self.timeouts, operation)
+
+    def record_offline_fallback(self, reason: str):
+        """A punch was stored offline (or not sent) instead of going to the server"""
+        self._increment(self.offline_fallbacks, reason)
+
+    def record_reconnect(self, outcome: str, seconds: Optional[float] = None, error: Optional[str] = None):
+        """Outcome of a reconnect attempt: connected, rebuilt, failed or circuitOpen"""
+        with self._lock:
+            self.reconnects[outcome] = self.reconnects.get(outcome, 0) + 1
+            self._recent_reconnects.append({
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'outcome': outcome,
+                'ms': round(seconds * 1000, 1) if seconds is not None else None,
+                'error': error[:200] if error else None
+            })
+        if seconds is not None:
+            self.record('reconnect', 'total', seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything recorded so far"""
+        with self._lock:
+            latency: Dict[str, Dict[str, Any]] = {}
+            for (operation, phase), histogram in sorted(self._histograms.items()):
+                latency.setdefault(operation, {})[phase] = histogram.snapshot()
+            return {
+                'startedAt': self.started_at,
+                'takenAt': datetime.now().isoformat(),
+                'latency': latency,
+                'timeouts': dict(self.timeouts),
+                'offlineFallbacks': dict(self.offline_fallbacks),
+                'reconnects': dict(self.reconnects),
+                'recentReconnects': list(self._recent_reconnects),
+                'droppedSeries': self._dropped_series
+            }
+
+    def export(self, path: str, extra: Optional[Dict[str, Any]] = None):
+        """Write a snapshot to a JSON file, replacing the previous one whole
+
+        Args:
+            path: File to write
+            extra: Further top-level entries for the file, e.g. connection status
+        """
+        snapshot = self.snapshot()
+        if extra:
+            snapshot.update(extra)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(snapshot, f, indent=2, default=str)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to export telemetry to {path}: {e}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
@@ -1,13 +1,33 @@
+import os
 import sys
 import logging
 import json
-from camera_service import CameraService
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
 from soap_client import SoapClient
-from datetime import datetime
+from offline_storage import ENGINES, ENGINE_EXTENSIONS
+from storage_recovery import recover_storage
+from punch_store import JsonPunchStore
+
+def make_punch(employee_id, punch_time, created_at=None):
+    return {
+        'employeeId': employee_id,
+        'punchTime': punch_time,
+        'punchType': 'OFFLINE',
+        'imageFilename': None,
+        'synced': False,
+        'createdAt': created_at or punch_time
+    }
 
 def test_camera():
     print("\nTesting Camera Service...")
+    camera = None
     try:
+        # cv2 is only needed here, so the storage and SOAP tests run without it
+        from camera_service import CameraService
         camera = CameraService()
         results = camera.test_camera()
         print("Camera Test Results:")
@@ -16,7 +36,8 @@ def test_camera():
     except Exception as e:
         print(f"Camera test failed: {e}")
     finally:
-        camera.cleanup()
+        if camera is not None:
+            camera.cleanup()
 
 def test_soap():
     print("\nTesting SOAP Connection...")
@@ -42,6 +63,654 @@ def test_settings():
     except Exception as e:
         print(f"Settings test failed: {e}")
 
+def check_engine_reopen(engine):
+    """Commits survive a reopen and replay keeps each punch's synced state"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'local' + ENGINE_EXTENSIONS[engine])
+        store = ENGINES[engine](path, {})
+        stored = store.commit([('store', make_punch(str(100 + i), f'2026-10-01T09:{i:02d}:00'))
+                               for i in range(5)])
+        ids = [p['id'] for p in stored]
+        assert ids == sorted(set(ids))
+        assert store.commit([('synced', ids[0], '2026-10-01T10:00:00'), ('synced', 999999, 'x')]) == [True, False]
+        assert store.commit([('delete', [ids[1]])]) == [1]
+        store.close()
+
+        store = ENGINES[engine](path, {})
+        assert store.count() == 4
+        unsynced = list(store.iter_unsynced())
+        assert [p['id'] for p in unsynced] == ids[2:]
+        assert [p['employeeId'] for p in unsynced] == ['102', '103', '104']
+        synced = list(store.iter_punches(synced=True))
+        assert [p['id'] for p in synced] == [ids[0]]
+        assert synced[0]['syncedAt'] == '2026-10-01T10:00:00'
+        store.close()
+
+def test_sqlite_engine_reopen():
+    check_engine_reopen('sqlite')
+
+def test_journal_engine_reopen():
+    check_engine_reopen('journal')
+
+def test_journal_retention_survives_interrupted_compaction(monkeypatch):
+    """Punches removed by retention stay removed when the rotated journal is replayed"""
+    import journal_storage
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'local.journal')
+        store = journal_storage.JournalPunchStore(path, {})
+        store.commit([('store', make_punch('100', '2026-09-01T09:00:00')),
+                      ('store', make_punch('101', '2026-10-01T09:00:00'))])
+        # Crash after the snapshot is written but before the rotated journal is removed
+        real_unlink = os.unlink
+        monkeypatch.setattr(journal_storage.os, 'unlink',
+                            lambda p: None if p == store.rotated_file else real_unlink(p))
+        assert store.delete_created_before(datetime(2026, 9, 15)) == 1
+        monkeypatch.undo()
+        assert os.path.exists(store.rotated_file)
+        store.close()
+
+        store = journal_storage.JournalPunchStore(path, {})
+        assert [p['employeeId'] for p in store.get_unsynced()] == ['101']
+        store.close()
+
+def test_segment_engine_reopen():
+    check_engine_reopen('segments')
+
+def test_segment_engine_id_lookup():
+    """Synced and deleted ids are told apart, also when id ranges of days overlap"""
+    from segment_storage import SegmentPunchStore
+    with tempfile.TemporaryDirectory() as directory:
+        store = SegmentPunchStore(os.path.join(directory, 'local.segments'), {})
+        first = store.commit([('store', make_punch('100', '2026-10-02T08:00:00')),
+                              ('store', make_punch('101', '2026-10-03T08:00:00'))])
+        # Stored later into an older day, as imports and clock changes do
+        later = store.commit([('store', make_punch('102', '2026-10-01T08:00:00')),
+                              ('store', make_punch('103', '2026-10-02T09:00:00'))])
+        ids = [p['id'] for p in first + later]
+        assert store.commit([('synced', i, '2026-10-05T00:00:00') for i in ids]) == [True] * 4
+        assert store.commit([('delete', [ids[0]])]) == [1]
+        # Synced again after a lost checkpoint: known ids are found, the deleted one isn't
+        assert store.commit([('synced', i, '2026-10-05T00:00:00') for i in ids]) == [False, True, True, True]
+        assert store.commit([('delete', [ids[2], ids[3]])]) == [2]
+        assert store.count() == 1
+        store.close()
+
+def write_truncated_json_store(directory):
+    """A JSON engine file of four punches cut off inside the last one"""
+    path = os.path.join(directory, 'local.json')
+    store = JsonPunchStore(path, {})
+    store.commit([('store', make_punch(str(100 + i), f'2026-10-01T09:{i:02d}:00')) for i in range(4)])
+    store.close()
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:data.rfind(b'"punchTime"')])
+    return path
+
+def test_truncated_json_salvage():
+    """Startup recovery keeps every record before the cut"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_truncated_json_store(directory)
+        report = recover_storage(path, 'json')
+        assert path in report['filesRepaired']
+        assert report['recordsSalvaged'] == 3
+        assert len(report['quarantined']) == 1 and os.path.exists(report['quarantined'][0])
+        store = JsonPunchStore(path, {})
+        assert [p['employeeId'] for p in store.get_unsynced()] == ['100', '101', '102']
+        assert store.insert_punch(make_punch('200', '2026-10-01T11:00:00'))['id'] > 3
+        store.close()
+
+def test_runtime_json_salvage_persists():
+    """A file damaged after startup is salvaged once and stays salvaged"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_truncated_json_store(directory)
+        store = JsonPunchStore(path, {})
+        assert len(store.get_unsynced()) == 3
+        # A second read and a write both still see the salvaged punches
+        assert len(store.get_unsynced()) == 3
+        store.insert_punch(make_punch('200', '2026-10-01T11:00:00'))
+        assert [p['employeeId'] for p in store.get_unsynced()] == ['100', '101', '102', '200']
+        store.close()
+        with open(path) as f:
+            assert len(json.load(f)) == 4
+
+def test_timed_out_salvage_leaves_store_in_place():
+    """Out of time, recovery neither quarantines nor replaces the live files"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_truncated_json_store(directory)
+        with open(path, 'rb') as f:
+            damaged = f.read()
+        report = recover_storage(path, 'json', time_limit=0)
+        assert report['timedOut'] and not report['quarantined']
+        with open(path, 'rb') as f:
+            assert f.read() == damaged
+        # The engine salvages it when it loads
+        store = JsonPunchStore(path, {})
+        assert len(store.get_unsynced()) == 3
+        store.close()
+
+        db_path = os.path.join(directory, 'other', 'local.db')
+        os.makedirs(os.path.dirname(db_path))
+        with open(db_path, 'wb') as f:
+            f.write(b'not a database' * 100)
+        report = recover_storage(db_path, 'sqlite', time_limit=0)
+        assert report['timedOut'] and not report['quarantined']
+        assert os.path.getsize(db_path) == 1400
+
+def test_circuit_breaker_backoff():
+    """Failures open the circuit with doubling, jittered delays; a success closes it"""
+    import time
+    from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+    breaker = CircuitBreaker(failure_threshold=2, base_delay=0.05, max_delay=0.2, jitter=0.5)
+    assert breaker.allow()
+    breaker.record_failure('down')
+    assert breaker.state == CLOSED
+    breaker.record_failure('down')
+    assert breaker.state == OPEN and not breaker.allow()
+    assert 0.015 <= breaker.retry_in() <= 0.05
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    # A failed trial opens it again with twice the delay
+    breaker.record_failure('still down')
+    assert breaker.state == OPEN and 0.04 <= breaker.retry_in() <= 0.1
+    for _ in range(4):
+        breaker._retry_at = 0
+        assert breaker.allow()
+        breaker.record_failure('still down')
+    assert 0.09 <= breaker.retry_in() <= 0.2
+    breaker._retry_at = 0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.snapshot()['opens'] == 0
+
+def start_standin_client(directory, config=None):
+    """A stand-in SOAP server and a client connected to it, storing under directory"""
+    from soap_standin import start_standin
+    from punch_replay import write_settings
+    server = start_standin(config)
+    settings_path = write_settings(directory, 'settings.json', server.endpoint)
+    return server, SoapClient(settings_path)
+
+def test_reconnect_exception_reopens_circuit(monkeypatch):
+    """A trial reconnect that raises counts as a failure instead of leaving the circuit half-open"""
+    from circuit_breaker import OPEN
+    with tempfile.TemporaryDirectory() as directory:
+        server, client = start_standin_client(directory)
+        try:
+            assert client.is_online()
+            client.breaker._state = OPEN
+            client.breaker._retry_at = 0
+            def broken_probe():
+                raise RuntimeError('probe crashed')
+            monkeypatch.setattr(client, 'probe', broken_probe)
+            with pytest.raises(RuntimeError):
+                client.try_reconnect()
+            assert client.breaker.state == OPEN and client.breaker.retry_in() > 0
+            assert not client.is_online()
+        finally:
+            client.storage.close()
+            server.shutdown()
+
+def make_offline_storage(directory, **storage):
+    """OfflineStorage under directory, with storage settings overridden by keyword"""
+    from offline_storage import OfflineStorage
+    settings = {'storage': dict({
+        'dbPath': os.path.join(directory, 'data', 'local.db'),
+        'photoDir': os.path.join(directory, 'photos')
+    }, **storage)}
+    settings_path = os.path.join(directory, 'settings.json')
+    with open(settings_path, 'w') as f:
+        json.dump(settings, f)
+    return OfflineStorage(settings_path)
+
+def store_punches(storage, count, first=0):
+    """Store count punches a minute apart; returns their ids"""
+    for i in range(first, first + count):
+        storage.store_punch(str(100 + i), datetime(2026, 10, 1, 9, 0) + timedelta(minutes=i))
+    # Spills are queued on the writer, wait for them
+    storage.writer.call(lambda: None).result()
+    return [p['id'] for p in storage.store.iter_punches()]
+
+def test_spill_to_archive_and_overflow():
+    """Past the cap synced punches are archived first, then unsynced ones overflow"""
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_offline_storage(directory, maxOfflineRecords=20)
+        ids = store_punches(storage, 20)
+        storage.mark_as_synced(ids[0])
+        store_punches(storage, 1, first=20)
+        assert storage.spill_stats()['hot'] == 20 and storage.spill_stats()['archived'] == 1
+        # No synced punch left to archive: the two oldest unsynced overflow, one as headroom
+        store_punches(storage, 1, first=21)
+        spill = storage.spill_stats()
+        assert (spill['hot'], spill['overflow'], spill['archived']) == (19, 2, 1)
+        assert storage.overflow.ids() == ids[1:3]
+        unsynced = storage.get_unsynced_punches()
+        assert [p['employeeId'] for p in unsynced] == [str(100 + i) for i in range(1, 22)]
+        assert len(list(storage.iter_punches())) == 22
+        assert storage.stats()['total'] == 22 and storage.stats()['unsynced'] == 21
+
+        storage.mark_many_synced([ids[1], ids[5]])
+        spill = storage.spill_stats()
+        assert (spill['hot'], spill['overflow'], spill['archived']) == (19, 1, 2)
+        assert storage.stats()['unsynced'] == 19
+        storage.close()
+
+        storage = make_offline_storage(directory, maxOfflineRecords=20)
+        spill = storage.spill_stats()
+        assert (spill['hot'], spill['overflow'], spill['archived']) == (19, 1, 2)
+        assert [p['id'] for p in storage.get_unsynced_punches()][0] == ids[2]
+        storage.close()
+
+def test_mark_synced_during_spill():
+    """A punch spilled to overflow while it is being marked synced is still marked"""
+    import threading
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_offline_storage(directory, maxOfflineRecords=10)
+        ids = store_punches(storage, 10)
+        # Hold the writer, queue a spill of the oldest punch, then mark it synced
+        release = threading.Event()
+        storage.writer.call(release.wait)
+        # A lower cap makes the queued spill move the two oldest punches to overflow
+        storage.max_records = 9
+        storage.writer.call(storage._spill)
+        marking = threading.Thread(target=storage.mark_as_synced, args=(ids[0],))
+        marking.start()
+        while storage.writer._queue.qsize() < 2:
+            pass
+        release.set()
+        marking.join()
+        assert storage.overflow.ids() == [ids[1]]
+        assert ids[0] not in [p['id'] for p in storage.get_unsynced_punches()]
+        assert storage.stats()['unsynced'] == 9
+        storage.close()
+
+def test_export_csv_and_jsonl():
+    """Exports stream every layer with filters applied, archived months in punch-time order"""
+    import csv
+    from punch_export import export_punches
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_offline_storage(directory)
+        store_punches(storage, 3)
+        # Archived in spill order, not punch order
+        archived = []
+        for i, minute in ((900, 30), (901, 10)):
+            punch = make_punch(str(i), f'2026-10-01T08:{minute:02d}:00', '2026-10-01T12:00:00')
+            punch.update(id=i, synced=True, syncedAt='2026-10-01T12:00:00')
+            archived.append(punch)
+            storage.archive.append([punch])
+
+        csv_path = os.path.join(directory, 'punches.csv')
+        assert export_punches(storage, csv_path) == 5
+        with open(csv_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert [r['employeeId'] for r in rows] == ['100', '101', '102', '901', '900']
+        assert rows[3]['synced'] == 'True' and rows[0]['syncedAt'] == ''
+
+        jsonl_path = os.path.join(directory, 'punches.jsonl')
+        assert export_punches(storage, jsonl_path, synced=True) == 2
+        with open(jsonl_path) as f:
+            assert [json.loads(line) for line in f] == [archived[1], archived[0]]
+        assert export_punches(storage, jsonl_path, start=datetime(2026, 10, 1, 8, 20),
+                              end=datetime(2026, 10, 1, 9, 2)) == 3
+        with open(jsonl_path) as f:
+            assert [json.loads(line)['employeeId'] for line in f] == ['100', '101', '900']
+        assert not os.path.exists(jsonl_path + '.tmp')
+        storage.close()
+
+def test_import_punches_keeps_counters():
+    """A bulk import is counted like stored punches and spills past the cap"""
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_offline_storage(directory, maxOfflineRecords=20)
+        store_punches(storage, 2)
+        backlog = [make_punch(str(200 + i), f'2026-09-30T08:{i:02d}:00') for i in range(22)]
+        for punch in backlog[:10]:
+            punch.update(synced=True, syncedAt=punch['punchTime'])
+        assert storage.import_punches(backlog) == 22
+        storage.writer.call(lambda: None).result()
+        spill = storage.spill_stats()
+        assert spill['hot'] <= 20 and spill['archived'] > 0
+        stats = storage.stats()
+        assert stats['total'] == 24 and stats['unsynced'] == 14
+        assert stats['oldestUnsynced'] == '2026-09-30T08:10:00'
+        storage.close()
+
+def test_upload_queue_survives_restart():
+    """Queued photos come back in order after a reopen; a drained queue leaves no file"""
+    from upload_queue import UploadQueue
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'local.uploads.jsonl')
+        queue = UploadQueue(path)
+        for i in range(3):
+            queue.add(f'10{i}__20261001_090{i}00.jpg', f'10{i}', f'2026-10-01T09:0{i}:00')
+        queue.remove('100__20261001_090000.jpg')
+        queue.remove('102__20261001_090200.jpg', uploaded=False)
+        queue.remove('unknown.jpg')
+
+        queue = UploadQueue(path)
+        assert queue.pending() == [{'name': '101__20261001_090100.jpg', 'employeeId': '101',
+                                    'punchTime': '2026-10-01T09:01:00'}]
+        queue.remove('101__20261001_090100.jpg')
+        assert queue.count() == 0 and not os.path.exists(path)
+
+def test_offline_punch_photo_uploaded_on_sync():
+    """A photo passed with a punch stored offline is kept pinned and uploaded once the punch syncs"""
+    from soap_standin import StandInConfig
+    from punch_replay import wait_for_uploads
+    with tempfile.TemporaryDirectory() as directory:
+        server, client = start_standin_client(directory, StandInConfig(image_dir=os.path.join(directory, 'images')))
+        try:
+            client._is_online = False
+            photo = b'\xff\xd8' + os.urandom(2000)
+            response = client.record_punch('123', datetime(2026, 10, 1, 9, 0), image_data=photo)
+            assert response['offline']
+            if client._reconnect_thread is not None:
+                client._reconnect_thread.join()
+            punch, = client.storage.get_unsynced_punches()
+            assert punch['imageFilename'] == '123__20261001_090000.jpg'
+            assert bytes(client.storage.photos.view(punch['imageFilename'])) == photo
+
+            assert client.sync_offline_punches()['synced'] == 1
+            assert wait_for_uploads(client, 5.0)[1] == 0
+            assert server.stats()['counters']['imageBytes'] == len(photo)
+        finally:
+            client.storage.close()
+            server.shutdown()
+
+def test_writer_group_commit():
+    """Queued operations share one commit, calls run between commits in queue order"""
+    import threading
+    from sqlite_storage import SqlitePunchStore
+    from storage_writer import StorageWriter
+    with tempfile.TemporaryDirectory() as directory:
+        store = SqlitePunchStore(os.path.join(directory, 'local.db'), {})
+        writer = StorageWriter(store, group_commit_ms=5)
+        release = threading.Event()
+        writer.call(release.wait)
+        first = [writer.submit(('store', make_punch(str(100 + i), f'2026-10-01T09:{i:02d}:00')))
+                 for i in range(20)]
+        counted = writer.call(store.count)
+        second = [writer.submit(('store', make_punch(str(200 + i), f'2026-10-01T10:{i:02d}:00')))
+                  for i in range(5)]
+        release.set()
+        assert [f.result()['employeeId'] for f in first] == [str(100 + i) for i in range(20)]
+        assert counted.result() == 20
+        assert min(f.result()['id'] for f in second) > first[-1].result()['id']
+        assert (writer.commits, writer.operations) == (2, 25)
+
+        # A failed commit fails its own operations only
+        real_commit = store.commit
+        def failing_commit(ops):
+            raise OSError('disk full')
+        store.commit = failing_commit
+        with pytest.raises(OSError):
+            writer.submit(('delete', [first[0].result()['id']])).result()
+        store.commit = real_commit
+        assert writer.submit(('delete', [first[0].result()['id']])).result() == 1
+        pending = writer.submit(('store', make_punch('300', '2026-10-01T11:00:00')))
+        writer.stop()
+        assert pending.done() and store.count() == 25
+        store.close()
+
+def test_sync_resumes_after_checkpoint(monkeypatch):
+    """An interrupted pass resumes after its last checkpoint; failed punches wait for the next pass"""
+    with tempfile.TemporaryDirectory() as directory:
+        server, client = start_standin_client(directory)
+        try:
+            client.settings['storage']['syncBatchSize'] = 3
+            for i in range(7):
+                client.storage.store_punch(str(100 + i), datetime(2026, 10, 1, 9, i))
+            ids = [p['id'] for p in client.storage.get_unsynced_punches()]
+            real_record_punch = client.record_punch
+            sent = []
+            def flaky_record_punch(employee_id, punch_time, **kwargs):
+                sent.append(employee_id)
+                if employee_id == '101':
+                    return {'success': False, 'offline': False}
+                if employee_id == '104' and len(sent) == 5:
+                    return {'success': False, 'offline': True}
+                return real_record_punch(employee_id, punch_time, **kwargs)
+            monkeypatch.setattr(client, 'record_punch', flaky_record_punch)
+
+            results = client.sync_offline_punches()
+            assert (results['total'], results['synced'], results['failed']) == (5, 3, 2)
+            assert client.storage.get_sync_cursor() == ('2026-10-01T09:03:00', ids[3])
+            assert [p['id'] for p in client.storage.get_unsynced_punches()] == [ids[1]] + ids[4:]
+
+            # Resumes after the cursor and finishes the pass
+            results = client.sync_offline_punches()
+            assert sent[5:] == ['104', '105', '106'] and results['synced'] == 3
+            assert client.storage.get_sync_cursor() is None
+            # The next pass retries the failed punch from the start
+            monkeypatch.setattr(client, 'record_punch', real_record_punch)
+            assert client.sync_offline_punches()['synced'] == 1
+            assert client.storage.get_unsynced_punches() == []
+        finally:
+            client.storage.close()
+            server.shutdown()
+
+def test_photo_store_dedup_eviction_and_retention():
+    """Photos are kept once per content, evicted least recently used first, never while pinned"""
+    from photo_store import PhotoStore
+    with tempfile.TemporaryDirectory() as directory:
+        photos = {name: os.urandom(1000) for name in 'abde'}
+        store = PhotoStore(directory, max_bytes=3000)
+        store.put('a.jpg', photos['a'], pin=True)
+        store.put('b.jpg', photos['b'])
+        store.put('c.jpg', photos['b'])
+        assert (store.stats()['photos'], store.size_bytes()) == (2, 2000)
+        store.put('d.jpg', photos['d'])
+        assert bytes(store.view('b.jpg')) == photos['b']
+        # Over budget: d is the least recently used unpinned photo
+        store.put('e.jpg', photos['e'])
+        assert store.view('d.jpg') is None and store.size_bytes() == 3000
+        store.close()
+
+        store = PhotoStore(directory, max_bytes=3000)
+        assert bytes(store.view('c.jpg')) == photos['b'] and store.view('d.jpg') is None
+        assert store.size_bytes() == 3000
+        with open(os.path.join(directory, 'legacy.jpg'), 'wb') as f:
+            f.write(b'old photo')
+        assert store.view('legacy.jpg') == b'old photo'
+        # Retention keeps the pinned photo only; b and c share one stored photo
+        assert store.cleanup(datetime.now() + timedelta(seconds=1), pinned=['a.jpg']) == 3
+        assert bytes(store.view('a.jpg')) == photos['a'] and store.view('legacy.jpg') is None
+        assert store.stats()['photos'] == 1
+        store.close()
+
+def test_photo_pack_compaction(monkeypatch):
+    """Reads are views of the pack; cleanup compacts it once enough of it is dead"""
+    import photo_store
+    monkeypatch.setattr(photo_store, 'COMPACT_MIN_DEAD_BYTES', 0)
+    with tempfile.TemporaryDirectory() as directory:
+        store = photo_store.PhotoStore(directory)
+        photos = {f'{i}.jpg': os.urandom(1000) for i in range(8)}
+        for name, data in photos.items():
+            store.put(name, data)
+        assert isinstance(store.view('0.jpg'), memoryview)
+        assert store.pack.size() == 8000
+
+        # One photo in eight is under the dead-space ratio: no rewrite
+        store.max_bytes = 7000
+        store.cleanup(datetime(2000, 1, 1))
+        assert store.pack_file == 'photos-0.pack' and store.dead_bytes() == 1000
+        store.max_bytes = 5000
+        store.cleanup(datetime(2000, 1, 1))
+        assert store.pack_file == 'photos-1.pack' and store.pack.size() == 5000
+        assert store.dead_bytes() == 0
+        assert os.listdir(directory).count('photos-0.pack') == 0
+        # 0.jpg was read above, so 1 to 3 were the least recently used
+        kept = [name for name in photos if store.view(name) is not None]
+        assert kept == ['0.jpg', '4.jpg', '5.jpg', '6.jpg', '7.jpg']
+        store.max_bytes = photo_store.DEFAULT_MAX_PHOTO_BYTES
+        store.put('new.jpg', b'after compaction')
+        store.close()
+
+        store = photo_store.PhotoStore(directory)
+        for name in kept:
+            assert bytes(store.view(name)) == photos[name]
+        assert bytes(store.view('new.jpg')) == b'after compaction'
+        store.close()
+
+def test_storage_stats_counters():
+    """stats() follows stores, syncs, retention and photos, and survives a reopen"""
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_offline_storage(directory)
+        for minute in (30, 10, 20):
+            storage.store_punch('100', datetime(2026, 10, 1, 9, minute))
+        stats = storage.stats()
+        assert (stats['total'], stats['unsynced'], stats['syncedToday']) == (3, 3, 0)
+        assert stats['oldestUnsynced'] == '2026-10-01T09:10:00' and stats['bytesOnDisk'] > 0
+
+        oldest = storage.get_unsynced_punches()[0]['id']
+        storage.mark_as_synced(oldest)
+        storage.mark_as_synced(oldest)
+        stats = storage.stats()
+        assert (stats['unsynced'], stats['syncedToday']) == (2, 1)
+        assert stats['oldestUnsynced'] == '2026-10-01T09:20:00'
+
+        expired = (datetime.now() - timedelta(days=30)).isoformat()
+        storage.import_punches([make_punch('200', expired, expired) for _ in range(2)])
+        assert storage.stats()['oldestUnsynced'] == expired
+        assert storage.cleanup_old_records(10) == 2
+        stats = storage.stats()
+        assert (stats['total'], stats['unsynced']) == (3, 2)
+        assert stats['oldestUnsynced'] == '2026-10-01T09:20:00'
+
+        storage.photos.put('100__20261001_093000.jpg', b'\xff\xd8' + b'x' * 998)
+        assert storage.stats()['photoBytes'] == 1000
+        storage.close()
+
+        storage = make_offline_storage(directory)
+        stats = storage.stats()
+        assert (stats['total'], stats['unsynced'], stats['syncedToday'], stats['photoBytes']) == (3, 2, 1, 1000)
+        storage.close()
+
+def test_engine_streaming_order():
+    """Every engine streams punches in (punchTime, id) order, page by page, with filters applied"""
+    minutes = [5, 1, 3, 1, 9, 7, 3, 0, 8, 2, 6, 4]
+    for engine in sorted(ENGINES):
+        with tempfile.TemporaryDirectory() as directory:
+            store = ENGINES[engine](os.path.join(directory, 'local' + ENGINE_EXTENSIONS[engine]), {})
+            stored = store.commit([('store', make_punch(str(100 + i), f'2026-10-01T09:{m:02d}:00'))
+                                   for i, m in enumerate(minutes)])
+            keys = sorted((p['punchTime'], p['id']) for p in stored)
+            synced = {keys[2][1], keys[6][1]}
+            store.commit([('synced', punch_id, '2026-10-01T10:00:00') for punch_id in synced])
+            unsynced = [k for k in keys if k[1] not in synced]
+
+            assert [(p['punchTime'], p['id']) for p in store.iter_unsynced(batch_size=4)] == unsynced, engine
+            after = unsynced[4]
+            assert [(p['punchTime'], p['id']) for p in store.iter_unsynced(after, 3)] == unsynced[5:], engine
+            window = [(p['punchTime'], p['id'])
+                      for p in store.iter_punches('2026-10-01T09:03:00', '2026-10-01T09:08:00', batch_size=2)]
+            assert window == [k for k in keys if '2026-10-01T09:03:00' <= k[0] < '2026-10-01T09:08:00'], engine
+            assert {p['id'] for p in store.iter_punches(synced=True, batch_size=1)} == synced, engine
+            assert len(list(store.iter_punches(synced=False, batch_size=5))) == 10, engine
+            store.close()
+
+def test_ids_never_reused():
+    """Deleting the newest punches and reopening never hands out their ids again"""
+    for engine in sorted(ENGINES):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'local' + ENGINE_EXTENSIONS[engine])
+            store = ENGINES[engine](path, {})
+            ids = [p['id'] for p in store.commit([('store', make_punch(str(100 + i), f'2026-10-01T09:0{i}:00'))
+                                                  for i in range(3)])]
+            assert store.commit([('delete', ids[1:])]) == [2]
+            assert store.insert_punch(make_punch('103', '2026-10-01T09:03:00'))['id'] > ids[-1], engine
+            newest = max(p['id'] for p in store.iter_punches())
+            assert store.commit([('delete', [newest])]) == [1]
+            store.close()
+
+            store = ENGINES[engine](path, {})
+            assert store.insert_punch(make_punch('104', '2026-10-01T09:04:00'))['id'] > newest, engine
+            store.close()
+
+def test_call_executor_deadlines_and_saturation():
+    """Late calls are abandoned or cancelled, and a saturated pool rejects new calls"""
+    import threading
+    import time
+    from concurrent.futures import TimeoutError
+    from soap_executor import CallExecutor, CallRejected
+    executor = CallExecutor(workers=1)
+    assert executor.call(lambda x: x * 2, 1.0, 21) == 42
+    release = threading.Event()
+    with pytest.raises(TimeoutError):
+        executor.call(release.wait, 0.05)
+    stats = executor.stats()
+    assert (stats['timeouts'], stats['abandoned'], stats['inFlight']) == (1, 1, 1)
+    # Still queued behind the abandoned call, so it is cancelled rather than abandoned
+    with pytest.raises(TimeoutError):
+        executor.call(lambda: 1, 0.01)
+    stats = executor.stats()
+    assert (stats['timeouts'], stats['abandoned'], stats['inFlight']) == (2, 1, 1)
+
+    queued = [executor.submit(lambda: 1) for _ in range(executor.max_pending - 1)]
+    with pytest.raises(CallRejected):
+        executor.submit(lambda: 1)
+    assert executor.stats()['rejected'] == 1
+    release.set()
+    assert [f.result(timeout=1.0) for f in queued] == [1] * len(queued)
+    deadline = time.monotonic() + 1.0
+    while executor.stats()['inFlight'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = executor.stats()
+    assert (stats['inFlight'], stats['abandoned'], stats['abandonedTotal']) == (0, 0, 1)
+    executor.shutdown()
+
+def same_fields(fast, slow):
+    """Whether a fast path result carries the values zeep read, field by field"""
+    for name, value in vars(fast).items():
+        other = getattr(slow, name)
+        if hasattr(value, '__dict__'):
+            if not same_fields(value, other):
+                return False
+        elif value != other:
+            return False
+    return True
+
+def test_fast_path_matches_zeep(monkeypatch):
+    """The fast path reads replies as zeep does, leaves faults and surprises to zeep, and punches without it"""
+    import requests
+    from lxml import etree
+    from soap_fastpath import FAST_OPERATIONS, FastPathError
+    from soap_standin import fault
+    with tempfile.TemporaryDirectory() as directory:
+        server, client = start_standin_client(directory)
+        try:
+            fast_path = client.fast_path
+            assert fast_path is not None
+            for operation in FAST_OPERATIONS:
+                reply = fast_path.sample_reply(operation, {'PunchSuccess': 'true', 'PunchType': 'checkin',
+                                                           'FirstName': 'Ana', 'PunchException': '2',
+                                                           'CurrentWeeklyHours': '12.5'})
+                response = requests.Response()
+                response.status_code = 200
+                response._content = reply
+                response.headers['Content-Type'] = 'text/xml; charset=utf-8'
+                slow = fast_path.binding.process_reply(fast_path.client, fast_path.binding.get(operation), response)
+                assert same_fields(fast_path.parse(operation, reply), slow), operation
+
+            operation = FAST_OPERATIONS[0]
+            assert b'1&lt;2|*|' in fast_path.render(operation, '1<2|*|2026-10-01T09:00:00')
+            with pytest.raises(FastPathError):
+                fast_path.parse(operation, fault('Server busy'))
+            envelope = etree.fromstring(fast_path.sample_reply(operation))
+            result = next(envelope.iter(fast_path._results[operation][0]))
+            etree.SubElement(result, '{urn:unexpected}Extra').text = '1'
+            with pytest.raises(FastPathError):
+                fast_path.parse(operation, etree.tostring(envelope))
+
+            # A normal punch is read by the fast path alone
+            def no_zeep(*args, **kwargs):
+                raise AssertionError('reply handed to zeep')
+            monkeypatch.setattr(fast_path.binding, 'process_reply', no_zeep)
+            response = client.record_punch('123', datetime.now())
+            assert response['success'] and not response['offline']
+        finally:
+            client.storage.close()
+            server.shutdown()
+
 def main():
     print("MSI Time Clock Component Test\n" + "="*30)
     
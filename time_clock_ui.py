@@ -335,19 +335,24 @@ class TimeClockUI(customtkinter.CTkFrame):
         # Initialize services
         logger.debug("TimeClockUI: Checking for parent camera service")
         
+        # Use parent's SOAP client if available so the offline store has a single owner
+        if hasattr(parent, 'soap_client') and parent.soap_client is not None:
+            logger.debug("TimeClockUI: Using parent's SOAP client")
+            self.soap_client = parent.soap_client
+        else:
+            self.soap_client = SoapClient(settings_path)
+        
         # Use parent's camera service if available
         if hasattr(parent, 'camera_service') and parent.camera_service is not None:
             logger.debug("TimeClockUI: Using parent's camera service")
             self.camera_service = parent.camera_service
         else:
             logger.debug("TimeClockUI: Creating new camera service")
-            self.camera_service = CameraService(settings_path)
+            self.camera_service = CameraService(settings_path, photo_store=self.soap_client.storage.photos)
         
         # Log camera settings
         logger.debug(f"TimeClockUI: Camera settings: {self.settings.get('camera', {})}")
         
-        self.soap_client = SoapClient(settings_path)
-        
         self.employee_id = customtkinter.StringVar()
         self.status_text = customtkinter.StringVar()
         self.status_text_es = customtkinter.StringVar()
@@ -395,7 +400,8 @@ class TimeClockUI(customtkinter.CTkFrame):
                 self.admin_panel_open = True
                 
                 # Create admin panel window
-                admin_panel = AdminPanel(self.winfo_toplevel())
+                admin_panel = AdminPanel(self.winfo_toplevel(), storage=self.soap_client.storage,
+                                         soap_client=self.soap_client)
                 
                 # Center and show the window
                 admin_panel.update_idletasks()
@@ -708,16 +714,13 @@ class TimeClockUI(customtkinter.CTkFrame):
                 
                 # Record punch with same timestamp - use full ID for punch
                 logger.debug(f"Recording punch for {raw_employee_id}")
+                # The photo goes along so a punch stored offline keeps it
                 response = self.soap_client.record_punch(
                     employee_id=raw_employee_id,
-                    punch_time=punch_time
+                    punch_time=punch_time,
+                    image_data=photo_data
                 )
                 
-                # If punch was successful, upload the photo with same timestamp - use stripped ID for image
-                if response['success'] and photo_data:
-                    logger.debug(f"Uploading image for {image_employee_id}")
-                    self.soap_client._upload_image(image_employee_id, photo_data, punch_time)
-                
                 # Update UI in main thread with error handling
                 def update_ui():
                     try:
@@ -779,6 +782,15 @@ class TimeClockUI(customtkinter.CTkFrame):
                 # Schedule UI update in main thread with error handling
                 self._safe_after(0, update_ui)
                 
+                # If punch was successful, queue the photo for upload with same timestamp - use stripped ID for image.
+                # The upload worker sends it once online, the employee doesn't wait for it
+                if response['success'] and photo_data:
+                    logger.debug(f"Queueing image upload for {image_employee_id}")
+                    try:
+                        self.soap_client.queue_image_upload(image_employee_id, photo_data, punch_time)
+                    except Exception as e:
+                        logger.error(f"Failed to queue image upload for {image_employee_id}: {e}")
+                
                 # Log completion time
                 end_time = time.time()
                 logger.debug(f"Punch processing for {raw_employee_id} completed in {end_time - start_time:.2f} seconds")
@@ -0,0 +1,82 @@
+"""
+Persistent queue of punch photos waiting to be uploaded.
+The photos themselves stay in the PhotoStore, pinned until uploaded; this
+queue only records which ones still have to go to the server, so the
+upload worker picks up where it left off after a restart.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any
+
+from punch_store import fsync_dir, read_events
+
+logger = logging.getLogger(__name__)
+
+
+class UploadQueue:
+    """Photos waiting for SaveImage, oldest first
+
+    Kept as an event file of 'queued', 'uploaded' and 'dropped' lines with
+    the pending entries in memory. Once every photo in it has been uploaded
+    the file is removed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        if os.path.exists(path):
+            for event in read_events(path):
+                if event.get('op') == 'queued':
+                    self._pending[event['entry']['name']] = event['entry']
+                elif event.get('op') in ('uploaded', 'dropped'):
+                    self._pending.pop(event['name'], None)
+
+    def _append(self, events: List[Dict[str, Any]]):
+        new_file = not os.path.exists(self.path)
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in events))
+            f.flush()
+            os.fsync(f.fileno())
+        if new_file:
+            fsync_dir(os.path.dirname(self.path))
+
+    def add(self, name: str, employee_id: str, punch_time: str):
+        """Durably queue a stored photo for upload
+
+        Args:
+            name: Image filename the photo is stored and uploaded under
+            employee_id: Employee the photo belongs to
+            punch_time: ISO timestamp of the punch
+        """
+        entry = {'name': name, 'employeeId': employee_id, 'punchTime': punch_time}
+        with self._lock:
+            self._append([{'op': 'queued', 'entry': entry}])
+            self._pending[name] = entry
+
+    def remove(self, name: str, uploaded: bool = True):
+        """Take a photo off the queue, once uploaded or when giving up on it"""
+        with self._lock:
+            if self._pending.pop(name, None) is None:
+                return
+            if self._pending:
+                self._append([{'op': 'uploaded' if uploaded else 'dropped', 'name': name}])
+            else:
+                # Fully drained
+                os.unlink(self.path)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Queued photos, oldest first"""
+        with self._lock:
+            return [dict(e) for e in self._pending.values()]
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._pending)
+
+    def count(self) -> int:
+        return len(self._pending)
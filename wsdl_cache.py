@@ -0,0 +1,94 @@
+"""
+On-disk cache of the SOAP service definitions.
+zeep reads the WSDL documents through this cache, so once they have been
+downloaded the SOAP clients are built from disk in milliseconds, including
+when the kiosk boots without connectivity. Cached documents never expire;
+once they are old or the server's copy looks different they are refreshed
+with a conditional GET, and the caller is told if the definition changed.
+"""
+
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from zeep.cache import SqliteCache
+
+logger = logging.getLogger(__name__)
+
+
+class WsdlCache(SqliteCache):
+    """Persistent zeep document cache with a content check on refresh"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # No timeout: a cached definition stays usable until the server replaces it
+        super().__init__(path=path, timeout=None)
+        # ETag and Last-Modified of each cached document, for conditional refreshes
+        with self.db_connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS validators (url text PRIMARY KEY, etag text, last_modified text)"
+            )
+            conn.commit()
+
+    def age(self, url: str) -> Optional[float]:
+        """Seconds since the document for url was last downloaded, None if it isn't cached"""
+        with self.db_connection() as conn:
+            row = conn.execute("SELECT created FROM request WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        created = row[0]
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - created).total_seconds()
+
+    def _validators(self, url: str) -> Tuple[Optional[str], Optional[str]]:
+        with self.db_connection() as conn:
+            row = conn.execute("SELECT etag, last_modified FROM validators WHERE url = ?", (url,)).fetchone()
+        return row if row else (None, None)
+
+    def _save_validators(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        with self.db_connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO validators (url, etag, last_modified) VALUES (?, ?, ?)",
+                         (url, etag, last_modified))
+            conn.commit()
+
+    def refresh(self, session, url: str, timeout: float) -> bool:
+        """Download a document if the server's copy changed and update the cache
+
+        A cached document is revalidated with If-None-Match and
+        If-Modified-Since, so an unchanged one costs a 304 and no body.
+
+        Args:
+            session: requests session to download with
+            url: Document URL
+            timeout: Request timeout in seconds
+        Returns:
+            bool: True if the document was not cached or its content changed
+        Raises:
+            requests.RequestException: If the server can't be reached
+        """
+        cached = self.get(url)
+        headers = {}
+        if cached is not None:
+            etag, last_modified = self._validators(url)
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = session.get(url, timeout=timeout, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            # Unchanged; restart its age
+            self.add(url, cached)
+            return False
+        response.raise_for_status()
+        content = response.content
+        self._save_validators(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        if cached == content:
+            self.add(url, cached)
+            return False
+        self.add(url, content)
+        logger.info(f"Service definition {url} updated in the WSDL cache")
+        return True